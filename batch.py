@@ -0,0 +1,102 @@
+'''
+batch compilation for compiler.py --batch : every source is compiled to
+outdir/<name>.vm by a ProcessPoolExecutor. the parent lexes the headers
+once (preprocess.header_cache) and hands the cache to the workers , which
+only read it. exits non zero when any source fails
+'''
+
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor , as_completed
+import compiler
+import preprocess
+
+def read_manifest(path: str) -> list:
+    '''sources listed one per line , relative to the manifest , # comments'''
+    base = os.path.dirname(os.path.abspath(path))
+    res  = []
+    with open(path,'r',encoding='utf-8') as f:
+        for line in f:
+            line = line.split("#",1)[0].strip()
+            if line:
+                res.append(os.path.join(base,line))
+    return res
+
+def install_headers(entries: dict):
+    preprocess.header_cache.entries = entries
+
+def compile_one(source_path: str,target_path: str,cwd: str,timeout: float) -> tuple:
+    '''(ok,message,seconds) , run in a worker'''
+    start_time = time.perf_counter()
+    try:
+        with open(source_path,'r',encoding='utf-8') as f:
+            src = f.read()
+        with compiler.time_limit(timeout):
+            image = compiler.build(src,cwd)
+        with open(target_path,'wb') as f:
+            f.write(image)
+        ok , message = True , "{0} bytes".format(len(image))
+    except Exception as e:
+        ok , message = False , traceback.format_exception_only(type(e),e)[-1].strip()
+    return ok , message , time.perf_counter() - start_time
+
+def compile_batch(sources: list,outdir: str,jobs: int = None,timeout: float = 60,out = sys.stdout) -> int:
+    '''number of sources that failed , a status line per source goes to out'''
+    targets = {}
+    for source in sources:
+        name   = os.path.splitext(os.path.basename(source))[0] + ".vm"
+        target = os.path.join(outdir,name)
+        if target in targets.values():
+            print("[FAIL] {0} : {1} is also the target of another source".format(source,target),file=out)
+            return len(sources)
+        targets[source] = target
+    os.makedirs(outdir,exist_ok=True)
+
+    cwd = os.path.dirname(os.path.abspath(compiler.__file__)) # cwd for #include
+    for source in sources:
+        try:
+            with open(source,'r',encoding='utf-8') as f:
+                preprocess.header_cache.preload(f.read(),cwd)
+        except OSError:
+            pass # reported by its worker
+
+    failed = 0
+    with ProcessPoolExecutor(jobs,initializer=install_headers,initargs=(preprocess.header_cache.entries,)) as pool:
+        futures = {pool.submit(compile_one,source,target,cwd,timeout): source for source , target in targets.items()}
+        for future in as_completed(futures):
+            ok , message , seconds = future.result()
+            failed += not ok
+            print("[{0}] {1} -> {2} ({3} , {4:.3f}s)".format(
+                " OK " if ok else "FAIL",futures[future],targets[futures[future]],message,seconds),file=out)
+    print("{0} compiled , {1} failed".format(len(sources) - failed,failed),file=out)
+    return failed
+
+def main(args: list) -> int:
+    '''compiler.py --batch [source | @manifest] ... -o outdir [-j jobs] , the exit status'''
+    sources , outdir , jobs = [] , None , None
+    idx = args.index("--batch") + 1
+    args = args[:idx - 1] + args[idx:]
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        if arg in ["-o","-j"]:
+            if idx + 1 >= len(args):
+                compiler.show_help()
+                return 1
+            if arg == "-o":
+                outdir = args[idx + 1]
+            else:
+                jobs = int(args[idx + 1])
+            idx += 2
+            continue
+        if arg.startswith("@"):
+            sources.extend(read_manifest(arg[1:]))
+        else:
+            sources.append(arg)
+        idx += 1
+    if outdir is None or not sources:
+        compiler.show_help()
+        return 1
+    return 1 if compile_batch(sources,outdir,jobs) else 0
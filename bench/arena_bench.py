@@ -0,0 +1,70 @@
+import gc
+import io
+import contextlib
+import tracemalloc
+
+from harness import perf
+
+import lexer
+import preprocess
+import parser
+from common import *
+from gen import gen_program
+
+def build(tokens,arena):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parser.parse(tokens,arena)
+
+def retained(tokens,make_arena):
+    '''bytes still allocated once the tree is built , symbol tables included'''
+    gc.collect()
+    tracemalloc.start()
+    tree = build(tokens,make_arena())
+    size , _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size , tree
+
+def traverse(root) -> int:
+    # the access pattern codegen uses
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        count += 1
+        node.nodeType ; node.metas
+        stack.extend(node.children)
+    return count
+
+tokens = preprocess.entry(lexer.tokenize(gen_program(300)),".")
+
+tree_size  , tree  = retained(tokens,lambda: None)
+arena_size , arena = retained(tokens,ASTArena)
+assert repr(tree) == repr(arena)
+
+tree_build  , _ = perf(lambda: build(tokens,None),7)
+arena_build , _ = perf(lambda: build(tokens,ASTArena()),7)
+tree_time  , tree_nodes  = perf(lambda: traverse(tree),7)
+arena_time , arena_nodes = perf(lambda: traverse(arena),7)
+assert tree_nodes == arena_nodes
+
+print('nodes        = ',tree_nodes)
+print('arena slots  = ',len(arena.arena))
+print('tree bytes   = ',tree_size)
+print('arena bytes  = ',arena_size)
+print('tree build   = ',tree_build)
+print('arena build  = ',arena_build)
+print('tree walk    = ',tree_time)
+print('arena walk   = ',arena_time)
+
+'''
+nodes        =  37815
+arena slots  =  37815
+tree bytes   =  8095024
+arena bytes  =  2775626
+tree build   =  0.1331281749999107
+arena build  =  0.17820275400003993
+tree walk    =  0.011244525000165595
+arena walk   =  0.04161150400000224
+'''
@@ -0,0 +1,71 @@
+import io
+import os
+import tempfile
+
+from harness import perf
+
+import batch
+
+# a corpus of independent translation units , each with a few functions
+template = '''
+#include <stdio.h>
+long long table_{0}[64];
+long long step_{0}(long long x) {{
+    if (x % 2 == 0) return x / 2;
+    return 3 * x + {0};
+}}
+long long walk_{0}(long long x) {{
+    long long n = 0;
+    while (x > 1 && n < 1000) {{
+        x = step_{0}(x);
+        n++;
+    }}
+    return n;
+}}
+int main() {{
+    long long s = 0;
+    for (long long i = 1; i < 64; i++) {{
+        table_{0}[i] = walk_{0}(i);
+        s = s + table_{0}[i];
+    }}
+    printf("%lld\\n", s);
+    return 0;
+}}
+'''
+
+tmpdir  = tempfile.mkdtemp()
+outdir  = os.path.join(tmpdir,"out")
+sources = []
+for idx in range(48):
+    path = os.path.join(tmpdir,"unit{0}.c".format(idx))
+    with open(path,'w',encoding='utf-8') as f:
+        f.write(template.format(idx))
+    sources.append(path)
+
+def run(jobs: int) -> int:
+    return batch.compile_batch(sources,outdir,jobs,out=io.StringIO())
+
+print('cpus         = ',os.cpu_count())
+print('sources      = ',len(sources))
+base = None
+for jobs in sorted({1,2,4,os.cpu_count()}):
+    batch_time , failed = perf(lambda: run(jobs),3)
+    assert failed == 0
+    base = batch_time if base is None else base
+    print('jobs         = ',jobs)
+    print('batch time   = ',batch_time)
+    print('speedup      = ',base / batch_time)
+
+'''
+cpus         =  1
+sources      =  48
+jobs         =  1
+batch time   =  0.21005905600031838
+speedup      =  1.0
+jobs         =  2
+batch time   =  0.2714336330000151
+speedup      =  0.7738873538943742
+jobs         =  4
+batch time   =  0.25140722299966
+speedup      =  0.835533098428928
+'''
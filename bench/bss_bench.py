@@ -0,0 +1,55 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import codegen
+import packer
+
+source = '''
+#include <stdio.h>
+long long table[1000000];
+char flags[4000000];
+long long seed = 7;
+int main() {
+    table[999999] = seed;
+    flags[3999999] = 1;
+    printf("%lld %d\\n", table[999999] + table[5], flags[3999999]);
+    return 0;
+}
+'''
+
+with contextlib.redirect_stdout(io.StringIO()):
+    raw_image = codegen.entry(parser.parse(preprocess.entry(lexer.tokenize(source),root)))
+
+tmpdir = tempfile.mkdtemp()
+vm = os.path.join(tmpdir,"c4vm")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+
+# bytes(raw_image) drops the bss run , so the zeros are written out as before
+for name , image in (("zeros on disk",bytes(raw_image)),("bss",raw_image)):
+    path = os.path.join(tmpdir,name.replace(" ","_") + ".vm")
+    with open(path,'wb') as f:
+        f.write(packer.packer(image,ratio=None,stackspace=1 * 1024 * 1024))
+    vm_time , out = perf(lambda: subprocess.run([vm,path],capture_output=True).stdout)
+    print('image        = ',name)
+    print('image bytes  = ',os.path.getsize(path))
+    print('vm time      = ',vm_time)
+    print('output       = ',out)
+
+'''
+image        =  zeros on disk
+image bytes  =  12000688
+vm time      =  0.028726544000164722
+output       =  b'7 1\n'
+image        =  bss
+image bytes  =  712
+vm time      =  0.028865723000308208
+output       =  b'7 1\n'
+'''
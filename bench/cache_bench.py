@@ -0,0 +1,50 @@
+import io
+import os
+import contextlib
+import shutil
+import tempfile
+
+from harness import perf , root
+
+import compiler
+import buildcache
+
+tmpdir = tempfile.mkdtemp()
+target = os.path.join(tmpdir,"out.vm")
+cache_dir = os.path.join(tmpdir,"cache")
+
+def run(source: str,cache) -> bytes:
+    with contextlib.redirect_stdout(io.StringIO()):
+        compiler.compile(source,target,cache=cache)
+    with open(target,'rb') as f:
+        return f.read()
+
+def cold(source: str) -> bytes:
+    shutil.rmtree(cache_dir,ignore_errors=True)
+    return run(source,buildcache.BuildCache(cache_dir))
+
+prime_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"prime.c")
+c4vm_path  = os.path.join(root,"c4vm.c")
+for name , path in (("prime.c",prime_path),("c4vm.c",c4vm_path)):
+    nocache_time , plain = perf(lambda: run(path,None),3)
+    cold_time    , _     = perf(lambda: cold(path),3)
+    warm_time    , image = perf(lambda: run(path,buildcache.BuildCache(cache_dir)),10)
+    assert image == plain
+    print('source       = ',name)
+    print('no cache     = ',nocache_time)
+    print('cold cache   = ',cold_time)
+    print('warm cache   = ',warm_time)
+    print('speedup      = ',nocache_time / warm_time)
+
+'''
+source       =  prime.c
+no cache     =  0.004307498000343912
+cold cache   =  0.004396653999720002
+warm cache   =  0.00030722100018465426
+speedup      =  14.020844921912577
+source       =  c4vm.c
+no cache     =  0.13336639699991792
+cold cache   =  0.1168769189998784
+warm cache   =  0.0006602539997402346
+speedup      =  201.9925620327762
+'''
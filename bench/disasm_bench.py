@@ -0,0 +1,62 @@
+import io
+import os
+import contextlib
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import peephole
+import disasm
+
+def word_rows(image: bytearray):
+    '''the former codegen.disasm , one row per 8 bytes , printed on every compile'''
+    rev_opcode = {v: k for k, v in codegen.opcode.items()}
+    print(f"{'Addr':<6} | {'Opcode':<8} | {'Value (Dec)':<24} | {'Hex':<24} | {'Raw Bytes'}")
+    print("-" * 84)
+    for idx in range(0, len(image), 8):
+        bs = image[idx:idx+8]
+        decimal = int.from_bytes(bs, 'little', signed=True)
+        hex_val = f"0x{int.from_bytes(bs, 'little', signed=False):x}"
+        op_name = rev_opcode.get(decimal, "")
+        ascii_repr = "".join(chr(b) if 32 <= b <= 126 else "." for b in bs)
+        display_op = f"[{op_name}]" if op_name else f"(data)"
+        print(f"{idx:<6} | {display_op:<8} | {decimal:<24} | {hex_val:<24} | {ascii_repr}")
+
+with open(os.path.join(root,"c4vm.c"),'r',encoding='utf-8') as f:
+    source = f.read()
+
+def compile_only():
+    passes = (peephole.Peephole(),peephole.Peephole(peephole.fused_patterns))
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(source),root)
+        ast    = optimizer.fold(parser.parse(tokens))
+        return codegen.entry(ast,passes=passes,fused=True)
+
+def rows():
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        word_rows(raw_image)
+    return out.getvalue()
+
+def listing():
+    out = io.StringIO()
+    disasm.dump(raw_image,out)
+    return out.getvalue()
+
+compile_time , raw_image = perf(compile_only,3)
+rows_time    , _         = perf(rows)
+listing_time , _         = perf(listing)
+print('image bytes  = ',len(raw_image))
+print('compile      = ',compile_time)
+print('word rows    = ',rows_time)
+print('listing      = ',listing_time)
+
+'''
+image bytes  =  43256
+compile      =  0.19918406099986896
+word rows    =  0.02032592800060229
+listing      =  0.00756197600003361
+'''
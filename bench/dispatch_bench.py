@@ -0,0 +1,64 @@
+import io
+import contextlib
+
+from harness import perf
+
+import lexer
+import preprocess
+import parser
+import codegen
+from gen import gen_program
+
+def chain_dispatch(name: str,handlers: dict,returns: bool):
+    '''rebuilds the former if/elif chain over the same handlers , in table order'''
+    lines = ["def {0}(ctx,astnode):".format(name)]
+    for idx , nodeType in enumerate(handlers):
+        keyword = "if" if idx == 0 else "elif"
+        lines.append("    {0} astnode.nodeType == {1!r}:".format(keyword,nodeType))
+        lines.append("        {0}handlers[{1!r}](ctx,astnode)".format("return " if returns else "",nodeType))
+    scope = {"handlers":handlers}
+    exec("\n".join(lines),scope)
+    return scope[name]
+
+dict_dispatch = {
+    "codegen_action" : codegen.codegen_action,
+    "infer_type"     : codegen.infer_type,
+    "solve_addr"     : codegen.solve_addr,
+}
+elif_dispatch = {
+    "codegen_action" : chain_dispatch("codegen_action",codegen.action_handlers,False),
+    "infer_type"     : chain_dispatch("infer_type",codegen.type_handlers,True),
+    "solve_addr"     : chain_dispatch("solve_addr",codegen.addr_handlers,False),
+}
+
+def run(ast,dispatch: dict):
+    for name , func in dispatch.items():
+        setattr(codegen,name,func)
+    try:
+        return codegen.entry(ast)
+    finally:
+        for name , func in dict_dispatch.items():
+            setattr(codegen,name,func)
+
+# only dispatch is measured , the per-node debug prints are silenced
+codegen.print = lambda *args,**kwargs: None
+
+tokens = preprocess.entry(lexer.tokenize(gen_program(300)),".")
+with contextlib.redirect_stdout(io.StringIO()):
+    ast = parser.parse(tokens)
+
+elif_time , elif_image = perf(lambda: run(ast,elif_dispatch),7)
+dict_time , dict_image = perf(lambda: run(ast,dict_dispatch),7)
+assert elif_image == dict_image
+
+print('image bytes  = ',len(dict_image))
+print('elif chain   = ',elif_time)
+print('dict         = ',dict_time)
+print('speedup      = ',elif_time / dict_time)
+
+'''
+image bytes  =  780776
+elif chain   =  0.5203270370000155
+dict         =  0.4500519779999195
+speedup      =  1.1561487615550676
+'''
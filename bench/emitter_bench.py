@@ -0,0 +1,77 @@
+import io
+import contextlib
+
+from harness import perf
+
+import lexer
+import preprocess
+import parser
+import codegen
+from codegen import Image, Emitter, Label, opcode, i64, f64
+from gen import gen_program
+
+class RecordingEmitter(Emitter):
+    '''keeps every emitted instruction so the stream can be replayed'''
+    stream = []
+    def emit(self,op,operand = None):
+        RecordingEmitter.stream.append((op,operand))
+        return super().emit(op,operand)
+
+def bytes_replay(stream):
+    # the former encoding : one bytes object per word , jumps patched by slicing
+    image = Image()
+    for op , operand in stream:
+        if operand is None:
+            image.extend(i64(opcode[op]))
+        elif type(operand) == Label:
+            pos = image.extend(i64(opcode[op]) + i64(0))
+            image.block[pos + 8:pos + 16] = i64(0)
+        elif type(operand) == float:
+            image.extend(i64(opcode[op]) + f64(operand))
+        else:
+            image.extend(i64(opcode[op]) + i64(operand))
+    return len(image.block)
+
+def emitter_replay(stream):
+    emitter = Emitter(Image())
+    for op , operand in stream:
+        if type(operand) == Label:
+            pos = emitter.emit(op,0)
+            emitter.patch(pos + 8,0)
+        else:
+            emitter.emit(op,operand)
+    return len(emitter.tobytes())
+
+# the per-node debug prints are silenced , they would dominate codegen
+codegen.print = lambda *args,**kwargs: None
+
+tokens = preprocess.entry(lexer.tokenize(gen_program(300)),".")
+with contextlib.redirect_stdout(io.StringIO()):
+    ast = parser.parse(tokens)
+
+codegen_time , image = perf(lambda: codegen.entry(ast),7)
+
+codegen.Emitter = RecordingEmitter
+codegen.entry(ast)
+codegen.Emitter = Emitter
+stream = RecordingEmitter.stream
+
+bytes_time   , bytes_len   = perf(lambda: bytes_replay(stream),7)
+emitter_time , emitter_len = perf(lambda: emitter_replay(stream),7)
+assert bytes_len == emitter_len
+
+print('image bytes  = ',len(image))
+print('instructions = ',len(stream))
+print('codegen      = ',codegen_time)
+print('bytes emit   = ',bytes_time)
+print('word emit    = ',emitter_time)
+print('speedup      = ',bytes_time / emitter_time)
+
+'''
+image bytes  =  780776
+instructions =  71419
+codegen      =  0.5409260199999153
+bytes emit   =  0.030244321999816748
+word emit    =  0.020408968000083405
+speedup      =  1.481913343178016
+'''
@@ -0,0 +1,282 @@
+import io
+import contextlib
+
+from harness import perf
+
+import lexer
+import preprocess
+import parser
+from common import *
+from gen import gen_expressions, gen_program
+
+class LegacyParser(parser.Parser):
+    '''the former recursive descent : one level per precedence'''
+    __slots__ = ()
+
+    def expression(self,prec=15) -> ASTNode:
+        lhs = None
+
+        if prec >= 15:
+            lhs = self.expression(14)
+            while True:
+                if self.match(TK_OPERATOR,","):
+                    lhs = ASTNode("comma",[lhs,self.expression(14)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 14:
+            lhs = self.expression(13)
+            while True:
+                if self.match(TK_OPERATOR,"="):
+                    lhs = ASTNode("assign",[lhs,self.expression(13)],())
+                elif self.match(TK_OPERATOR,"/="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("div",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"*="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("mul",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"%="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("mod",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"+="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("add",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"-="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("sub",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"<<="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("shl",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,">>="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("shr",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"&="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("bitand",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"^="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("bitxor",[lhs,self.expression(13)],())],())
+                elif self.match(TK_OPERATOR,"|="):
+                    lhs = ASTNode("assign",[lhs,ASTNode("bitor",[lhs,self.expression(13)],())],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 13:
+            lhs = self.expression(12)
+            while True:
+                if self.match(TK_OPERATOR,"?"):
+                    true_ret  = self.expression(12)
+                    self.match(TK_OPERATOR,":")
+                    false_ret = self.expression(12)
+                    lhs = ASTNode("cond",[lhs,true_ret,false_ret],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 12:
+            lhs = self.expression(11)
+            while True:
+                if self.match(TK_OPERATOR,"||"):
+                    lhs = ASTNode("or",[lhs,self.expression(11)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 11:
+            lhs = self.expression(10)
+            while True:
+                if self.match(TK_OPERATOR,"&&"):
+                    lhs = ASTNode("and",[lhs,self.expression(10)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 10:
+            lhs = self.expression(9)
+            while True:
+                if self.match(TK_OPERATOR,"|"):
+                    lhs = ASTNode("bitor",[lhs,self.expression(9)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 9:
+            lhs = self.expression(8)
+            while True:
+                if self.match(TK_OPERATOR,"^"):
+                    lhs = ASTNode("bitxor",[lhs,self.expression(8)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 8:
+            lhs = self.expression(7)
+            while True:
+                if self.match(TK_OPERATOR,"&"):
+                    lhs = ASTNode("bitand",[lhs,self.expression(7)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 7:
+            lhs = self.expression(6)
+            while True:
+                if self.match(TK_OPERATOR,"=="):
+                    lhs = ASTNode("eq",[lhs,self.expression(6)],())
+                elif self.match(TK_OPERATOR,"!="):
+                    lhs = ASTNode("ne",[lhs,self.expression(6)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 6:
+            lhs = self.expression(5)
+            while True:
+                if self.match(TK_OPERATOR,">"):
+                    lhs = ASTNode("gt",[lhs,self.expression(5)],())
+                elif self.match(TK_OPERATOR,">="):
+                    lhs = ASTNode("ge",[lhs,self.expression(5)],())
+                elif self.match(TK_OPERATOR,"<"):
+                    lhs = ASTNode("lt",[lhs,self.expression(5)],())
+                elif self.match(TK_OPERATOR,"<="):
+                    lhs = ASTNode("le",[lhs,self.expression(5)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 5:
+            lhs = self.expression(4)
+            while True:
+                if self.match(TK_OPERATOR,"<<"):
+                    lhs = ASTNode("shl",[lhs,self.expression(4)],())
+                elif self.match(TK_OPERATOR,">>"):
+                    lhs = ASTNode("shr",[lhs,self.expression(4)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 4:
+            lhs = self.expression(3)
+            while True:
+                if self.match(TK_OPERATOR,"+"):
+                    lhs = ASTNode("add",[lhs,self.expression(3)],())
+                elif self.match(TK_OPERATOR,"-"):
+                    lhs = ASTNode("sub",[lhs,self.expression(3)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 3:
+            lhs = self.expression(2)
+            while True:
+                if self.match(TK_OPERATOR,"/"):
+                    lhs = ASTNode("div",[lhs,self.expression(2)],())
+                elif self.match(TK_OPERATOR,"*"):
+                    lhs = ASTNode("mul",[lhs,self.expression(2)],())
+                elif self.match(TK_OPERATOR,"%"):
+                    lhs = ASTNode("mod",[lhs,self.expression(2)],())
+                else:
+                    break
+            return lhs
+
+        if prec >= 2:
+            if self.match(TK_OPERATOR,"++"):
+                lhs = ASTNode("incret",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"--"):
+                lhs = ASTNode("decret",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"*"):
+                lhs = ASTNode("deaddr",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"&"):
+                lhs = ASTNode("addr",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"!"):
+                lhs = ASTNode("not",[self.expression(2)],())
+            elif self.match(TK_IDENTIFIER,"sizeof"):
+                lhs = ASTNode("sizeof",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"~"):
+                lhs = ASTNode("bitnot",[self.expression(2)],())
+            elif self.match(TK_OPERATOR,"+"):
+                lhs = self.expression(2)
+            elif self.match(TK_OPERATOR,"-"):
+                lhs = ASTNode("neg",[self.expression(2)],())
+            else:
+                snapshot = self.pos
+                if self.match(TK_OPERATOR,"("):
+                    conv_type , _ = self.parseType()
+                    self.match(TK_OPERATOR,")")
+                    if conv_type:
+                        lhs = ASTNode("as",[self.expression(2)],(conv_type,))
+                    else:
+                        self.pos = snapshot
+                        lhs = self.expression(1)
+                else:
+                    lhs = self.expression(1)
+
+                while True:
+                    if self.match(TK_OPERATOR,"++"):
+                        lhs = ASTNode("retinc",[lhs],())
+                    elif self.match(TK_OPERATOR,"--"):
+                        lhs = ASTNode("retdec",[lhs],())
+                    else:
+                        break
+            return lhs        
+
+        if prec >= 1:
+            tk : Token
+            if self.match(TK_OPERATOR,"("):
+                lhs = self.expression()
+                self.match(TK_OPERATOR,")")
+            elif tk := self.match(TK_IDENTIFIER):
+                var_name = tk.value
+                lhs = ASTNode("var",[],(var_name,))
+            elif tk := self.match(TK_INTEGER):
+                lhs = ASTNode("integer",[],(tk.value,))
+            elif tk := self.match(TK_STRING):
+                lhs = ASTNode("string",[],(tk.value,))
+            elif tk := self.match(TK_FLOAT):
+                lhs = ASTNode("float",[],(tk.value,))
+
+            while True:
+                if self.match(TK_OPERATOR,"("):
+                    args = []
+                    if self.match(TK_OPERATOR,")"):
+                        lhs = ASTNode("call",[lhs,],())
+                    else:
+                        while True:
+                            args.append(self.expression(14))
+                            if not self.match(TK_OPERATOR,","):
+                                break
+                        self.match(TK_OPERATOR,")")
+                        lhs = ASTNode("call",[lhs,*args],())
+                elif self.match(TK_OPERATOR,"["):
+                    lhs = ASTNode("index",[lhs,self.expression()],())
+                    self.match(TK_OPERATOR,"]")
+                elif self.match(TK_OPERATOR,"."):
+                    tk = self.match(TK_IDENTIFIER)
+                    lhs = ASTNode("attr",[lhs],(tk.value,))
+                elif self.match(TK_OPERATOR,"->"):
+                    tk = self.match(TK_IDENTIFIER)
+                    lhs = ASTNode("ptr_attr",[lhs],(tk.value,))
+                else:
+                    break
+            return lhs
+
+def run(parser_class,tokens):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parser_class(tokens).program()
+
+for name , src in (("expressions",gen_expressions(300)),("functions",gen_program(300))):
+    tokens = preprocess.entry(lexer.tokenize(src),".")
+    legacy_time , legacy_ast = perf(lambda: run(LegacyParser,tokens),7)
+    pratt_time  , pratt_ast  = perf(lambda: run(parser.Parser,tokens),7)
+    assert repr(legacy_ast) == repr(pratt_ast)
+    print(name)
+    print('tokens       = ',len(tokens))
+    print('legacy       = ',legacy_time)
+    print('pratt        = ',pratt_time)
+    print('speedup      = ',legacy_time / pratt_time)
+
+'''
+expressions
+tokens       =  56120
+legacy       =  0.2893837080000594
+pratt        =  0.07740190200001962
+speedup      =  3.7387157230320525
+functions
+tokens       =  59148
+legacy       =  0.23420716900000116
+pratt        =  0.07439274499984094
+speedup      =  3.1482528168640895
+'''
@@ -0,0 +1,82 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import packer
+
+source = '''
+#include <stdio.h>
+#define WIDTH  (16 * 4)
+#define HEIGHT (8 * 8 + 0)
+#define MASK   ((1 << 12) - 1)
+enum knobs { SCALE = 3, BIAS = 7 };
+long long grid[64];
+int main() {
+    long long s = 0;
+    double d = 2.7;
+    for (long long i = 0; i < 2000 * 10; i++) {
+        for (long long j = 0; j < WIDTH / 8 - 0; j++) {
+            s = s + (j * 1 + SCALE * BIAS - (2 << 3)) * (WIDTH / HEIGHT);
+            s = (s + 0) & MASK;
+            if (!0 && j * 1 < sizeof(grid) / sizeof(long long)) {
+                grid[j] = grid[j] + s * (HEIGHT - WIDTH + 1);
+            }
+        }
+    }
+    long long folded_neg = (int)-2.7;
+    long long runtime_neg = (int)-d;
+    printf("%lld %lld %lld %lld\\n", s, grid[3], folded_neg, runtime_neg);
+    return 0;
+}
+'''
+
+def build(fold: bool) -> bytes:
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(source),root)
+        ast    = parser.parse(tokens)
+        if fold:
+            ast = optimizer.fold(ast)
+        raw_image = codegen.entry(ast)
+        return packer.packer(raw_image,ratio=None,stackspace=1 * 1024 * 1024)
+
+tmpdir = tempfile.mkdtemp()
+vm = os.path.join(tmpdir,"c4vm")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+
+outputs = []
+for name , fold in (("unfolded",False),("folded",True)):
+    image = build(fold)
+    path  = os.path.join(tmpdir,name + ".vm")
+    with open(path,'wb') as f:
+        f.write(image)
+    vm_time , out = perf(lambda: subprocess.run([vm,path],capture_output=True).stdout)
+    print('image        = ',name)
+    print('image bytes  = ',len(image))
+    print('vm time      = ',vm_time)
+    print('output       = ',out)
+    outputs.append(out)
+
+# folding must not change what the program prints , a folded negative
+# double has to agree with the one negated at run time
+assert outputs[0] == outputs[1]
+assert outputs[1].split()[2] == outputs[1].split()[3]
+
+'''
+image        =  unfolded
+image bytes  =  2768
+vm time      =  0.025910397000188823
+output       =  b'128 40957696 -2 -2\n'
+image        =  folded
+image bytes  =  1928
+vm time      =  0.01275785000052565
+output       =  b'128 40957696 -2 -2\n'
+'''
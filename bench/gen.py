@@ -0,0 +1,85 @@
+'''
+synthetic source generator shared by the compiler benchmarks
+'''
+
+header = '''#include <stdio.h>
+
+struct pair {
+    long long a;
+    long long b;
+};
+
+long long table[64];
+'''
+
+function_template = '''
+long long func{n}(long long x,long long y) {{
+    long long acc = 0;
+    long long arr[8];
+    struct pair p;
+    p.a = x * {n} + 1;
+    p.b = y - {n};
+    for (long long i = 0 ; i < 8 ; i++) {{
+        arr[i] = (i * 3 + x) % 7 + (y << 2) - (p.a & 15);
+        if (arr[i] > {n} % 5) {{
+            acc += arr[i] * 2 - 1;
+        }} else {{
+            acc = acc - (arr[i] | 4) + table[i];
+        }}
+    }}
+    while (acc > 1000) {{
+        acc = acc / 2;
+    }}
+    table[{n} % 64] = acc ^ p.b;
+    return acc + p.a * p.b;
+}}
+'''
+
+main_template = '''
+int main() {{
+    long long total = 0;
+    long long r = 0;
+{calls}
+    printf("%lld\\n",total);
+    return 0;
+}}
+'''
+
+call_template = '''    r = func{n}({n},total % 13);
+    total = total + r % 1000;
+'''
+
+def gen_program(nfuncs: int) -> str:
+    '''returns a compilable translation unit with nfuncs functions'''
+    parts = [header]
+    for n in range(nfuncs):
+        parts.append(function_template.format(n=n))
+    calls = "".join(call_template.format(n=n) for n in range(nfuncs))
+    parts.append(main_template.format(calls=calls))
+    return "".join(parts)
+
+expression_template = '''
+long long expr{n}(long long a,long long b,long long c) {{
+    long long r = 0;
+    long long *p = &r;
+    r = a * b + c * {n} - (a << 3) % 7 + (b >> 1) * (c & 255);
+    r += a > b ? a - b : b - a;
+    r ^= (a | b) & ~c;
+    r = r && a || !b && c != {n} || a <= b && b >= c;
+    *p = -a + +b * c / (a + 1) + (long long)c;
+    r -= sizeof(long long) * a++ + --b - c--;
+    r = (a == b) + (b < c) + (c > a) + table[(a + b) % 64] * 2;
+    return r + *p;
+}}
+'''
+
+def gen_expressions(nfuncs: int) -> str:
+    '''returns a translation unit made of expression-heavy functions'''
+    parts = [header]
+    parts.extend(expression_template.format(n=n) for n in range(nfuncs))
+    return "".join(parts)
+
+if __name__ == '__main__':
+    import sys
+    nfuncs = int(sys.argv[1]) if len(sys.argv) >= 2 else 100
+    print(gen_program(nfuncs))
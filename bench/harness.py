@@ -0,0 +1,27 @@
+'''
+shared by the *_bench.py files : the repo root on sys.path and a best of
+T timer for a call (bench.py times whole commands)
+'''
+
+import gc
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+if root not in sys.path:
+    sys.path.insert(0,root)
+
+def perf(func,T: int = 5):
+    '''best time of T calls of func and its last result'''
+    best = None
+    for _ in range(T):
+        # gc is paused while timing , the same way timeit does
+        res = None ; gc.collect() ; gc.disable()
+        start_time = time.perf_counter()
+        res = func()
+        end_time   = time.perf_counter()
+        gc.enable()
+        if best is None or end_time - start_time < best:
+            best = end_time - start_time
+    return best , res
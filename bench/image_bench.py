@@ -0,0 +1,62 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import peephole
+import packer
+
+def build(src: str) -> bytes:
+    passes = (peephole.Peephole(),peephole.Peephole(peephole.fused_patterns))
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(src),root)
+        ast    = optimizer.fold(parser.parse(tokens))
+        return codegen.entry(ast,passes=passes,fused=True)
+
+# a large text section : many functions , main only calls the last one
+funcs = ["long long f{0}(long long x) {{ long long y = x * {0}; if (y > 100) y = y - 7; return y + x; }}".format(i)
+         for i in range(3000)]
+big = "#include <stdio.h>\n" + "\n".join(funcs) + '''
+int main() {
+    printf("%lld\\n", f2999(3));
+    return 0;
+}
+'''
+
+with open(os.path.join(root,"c4vm.c"),'r',encoding='utf-8') as f:
+    c4vm = f.read()
+
+tmpdir = tempfile.mkdtemp()
+vm = os.path.join(tmpdir,"c4vm")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+
+# c4vm.c on the VM only prints its usage , so both runs are mostly load
+for name , src in (("c4vm.c",c4vm),("3000 functions",big)):
+    raw_image = build(src)
+    res = {}
+    for fmt , image , symbols in (("plain",bytes(raw_image),True),("v2",raw_image,True),("stripped",raw_image,False)):
+        path = os.path.join(tmpdir,fmt + ".vm")
+        with open(path,'wb') as f:
+            f.write(packer.packer(image,ratio=None,stackspace=1 * 1024 * 1024,symbols=symbols))
+        res[fmt] = (os.path.getsize(path),) + perf(lambda: subprocess.run([vm,path],capture_output=True).stdout,20)
+    assert res["plain"][2] == res["v2"][2] == res["stripped"][2]
+    print('image        = ',name)
+    print('image bytes  = ',res["plain"][0],'->',res["v2"][0],'stripped',res["stripped"][0])
+    print('load + run   = ',res["plain"][1],'->',res["v2"][1],'stripped',res["stripped"][1])
+
+'''
+image        =  c4vm.c
+image bytes  =  43264 -> 43888 stripped 43432
+load + run   =  0.0010568249999778345 -> 0.0010651410002537887 stripped 0.0010229380000055244
+image        =  3000 functions
+image bytes  =  720168 -> 820288 stripped 724256
+load + run   =  0.0020345270004327176 -> 0.0021760399999948277 stripped 0.0021848510000381793
+'''
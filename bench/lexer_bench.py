@@ -0,0 +1,53 @@
+import os
+
+from harness import perf , root
+
+import lexer
+from gen import gen_program
+
+# generated code plus the vm source itself for comments , strings and macros
+with open(os.path.join(root,"c4vm.c"),'r',encoding='utf-8') as f:
+    vm_src = f.read()
+src = gen_program(500) + vm_src * 20
+
+t_charwise , charwise_tokens = perf(lambda: lexer.tokenize_charwise(src),7)
+t_regex    , regex_tokens    = perf(lambda: lexer.tokenize(src),7)
+
+assert charwise_tokens == regex_tokens , "tokenizers disagree on the corpus"
+charwise_tokens = None
+
+# inputs the two tokenizers read differently on purpose , the corpus has
+# none of them. the value of the first token , or the error raised
+differences = [
+    # source    , tokenize , tokenize_charwise
+    ("0xff;"    , 255      , ValueError),
+    ("'\\101';" , 65       , 1),
+    ('"\\101";' , "A"      , IndexError),
+]
+
+def first_value(func,text: str):
+    try:
+        return func(text)[0].value
+    except Exception as e:
+        return type(e)
+
+for text , expected , charwise in differences:
+    assert first_value(lexer.tokenize,text) == expected , text
+    assert first_value(lexer.tokenize_charwise,text) == charwise , text
+
+lines = src.count('\n')
+print('lines      = ',lines)
+print('tokens     = ',len(regex_tokens))
+print('t_charwise = ',t_charwise,'({0:.0f} lines/s)'.format(lines / t_charwise))
+print('t_regex    = ',t_regex   ,'({0:.0f} lines/s)'.format(lines / t_regex))
+print('speedup    = ',t_charwise / t_regex)
+print('differences = ',len(differences),'expected (lowercase hex , octal escapes)')
+
+'''
+lines      =  26556
+tokens     =  241390
+t_charwise =  0.24499365100018622 (108395 lines/s)
+t_regex    =  0.21590483599993604 (122999 lines/s)
+speedup    =  1.134729798272137
+differences =  3 expected (lowercase hex , octal escapes)
+'''
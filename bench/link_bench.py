@@ -0,0 +1,94 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import compiler
+
+# a program split over units of a few functions each , main in the last
+unit_template = '''
+long long mix_{0}(long long x) {{
+    long long s = 0;
+    for (long long i = 0; i < x; i++) {{
+        if (i % 3 == 0) s = s + i * {0};
+        else s = s - i;
+    }}
+    return s;
+}}
+long long walk_{0}(long long x) {{
+    long long n = 0;
+    while (x > 1 && n < 500) {{
+        if (x % 2 == 0) x = x / 2;
+        else x = 3 * x + 1;
+        n++;
+    }}
+    return n;
+}}
+long long step_{0}(long long x) {{
+    long long a = mix_{0}(x);
+    long long b = walk_{0}(x + {0});
+    return a + b;
+}}
+'''
+units = 16
+sources = [unit_template.format(idx) for idx in range(units)]
+prototypes = "".join("long long step_{0}(long long x);\n".format(idx) for idx in range(units))
+calls = "".join("    r = step_{0}(40);\n    s = s + r;\n".format(idx) for idx in range(units))
+main_source = '''#include <stdio.h>
+{0}int main() {{
+    long long s = 0;
+    long long r = 0;
+{1}    printf("%lld\\n", s);
+    return 0;
+}}
+'''.format(prototypes,calls)
+monolithic = "#include <stdio.h>\n" + "".join(sources) + main_source.replace("#include <stdio.h>\n","")
+
+def build_objects(srcs: list) -> list:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [compiler.build_object(src,root) for src in srcs]
+
+def link(objects: list) -> bytes:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return compiler.link(objects)
+
+objects = build_objects(sources + [main_source])
+
+mono_time   , mono_image = perf(lambda: compiler.build(monolithic,root),3)
+full_time   , _          = perf(lambda: link(build_objects(sources + [main_source])),3)
+incr_time   , incr_image = perf(lambda: link(build_objects([sources[0]]) + objects[1:]),3)
+link_time   , _          = perf(lambda: link(objects),3)
+
+tmpdir = tempfile.mkdtemp()
+vm = os.path.join(tmpdir,"c4vm")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+outputs = []
+for name , image in (("mono.vm",mono_image),("linked.vm",incr_image)):
+    path = os.path.join(tmpdir,name)
+    with open(path,'wb') as f:
+        f.write(image)
+    outputs.append(subprocess.run([vm,path],capture_output=True).stdout)
+assert outputs[0] == outputs[1]
+
+print('units        = ',units + 1)
+print('monolithic   = ',mono_time)
+print('full rebuild = ',full_time)
+print('one unit     = ',incr_time)
+print('link only    = ',link_time)
+print('speedup      = ',mono_time / incr_time)
+print('image bytes  = ',len(mono_image),'->',len(incr_image))
+print('output       = ',outputs[1])
+
+'''
+units        =  17
+monolithic   =  0.057347015000232204
+full rebuild =  0.06922176999978547
+one unit     =  0.0047584060002918704
+link only    =  0.0012092470005882205
+speedup      =  12.051728035967225
+image bytes  =  24920 -> 25176
+output       =  b'25283\n'
+'''
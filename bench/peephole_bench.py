@@ -0,0 +1,72 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import peephole
+import packer
+
+def build(path: str,passes: tuple) -> bytes:
+    with open(path,'r',encoding='utf-8') as f:
+        src = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(src),os.path.dirname(path))
+        ast    = optimizer.fold(parser.parse(tokens))
+        raw_image = codegen.entry(ast,passes=passes)
+    return packer.packer(raw_image,ratio=None,stackspace=1 * 1024 * 1024)
+
+tmpdir = tempfile.mkdtemp()
+vm = os.path.join(tmpdir,"c4vm")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+
+def write(name: str,image: bytes) -> str:
+    path = os.path.join(tmpdir,name)
+    with open(path,'wb') as f:
+        f.write(image)
+    return path
+
+def run(*args):
+    return subprocess.run([vm,*args],capture_output=True).stdout
+
+# prime.c straight on the VM , then c4vm.c running prime on top of itself
+prime_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),"prime.c")
+c4vm_path  = os.path.join(root,"c4vm.c")
+prime_vm   = None
+for name , path in (("prime.c",prime_path),("c4vm.c",c4vm_path)):
+    peephole_pass = peephole.Peephole()
+    plain_image = write("plain_" + name + ".vm",build(path,()))
+    peep_image  = write("peephole_" + name + ".vm",build(path,(peephole_pass,)))
+    inner = () if prime_vm is None else (prime_vm,)
+    plain_time , plain_out = perf(lambda: run(plain_image,*inner),3)
+    peep_time  , peep_out  = perf(lambda: run(peep_image,*inner),3)
+    assert plain_out == peep_out
+    prime_vm = plain_image
+    print('source       = ',name)
+    print('image bytes  = ',os.path.getsize(plain_image),'->',os.path.getsize(peep_image))
+    print('removed      = ',peephole_pass.removed)
+    print('vm plain     = ',plain_time)
+    print('vm peephole  = ',peep_time)
+    print('speedup      = ',plain_time / peep_time)
+
+'''
+source       =  prime.c
+image bytes  =  1416 -> 1392
+removed      =  {'reload': 1, 'lev-lev': 1}
+vm plain     =  0.040508176000003004
+vm peephole  =  0.04091520100018897
+speedup      =  0.990051985808793
+source       =  c4vm.c
+image bytes  =  45248 -> 42800
+removed      =  {'x+0': 66, 'x*1': 75, 'dead': 6, 'jmp-next': 1, 'lea+k': 66, 'lev-lev': 4, 'not-branch': 6, 'imm*k': 6}
+vm plain     =  5.864036506000048
+vm peephole  =  5.478044856999986
+speedup      =  1.0704615714321564
+'''
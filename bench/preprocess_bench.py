@@ -0,0 +1,77 @@
+import io
+import os
+import contextlib
+import tempfile
+
+from harness import perf
+
+import lexer
+import preprocess
+from gen import gen_program
+
+# a header made of debug-only blocks : every block is a full function
+# inside #ifdef C4VM_DEBUG with a nested #ifdef / #else pair
+block = '''
+#ifdef C4VM_DEBUG
+#ifdef C4VM_VERBOSE
+#define TRACE 1
+#else
+#define TRACE 0
+#endif
+{body}
+#endif
+'''
+body   = gen_program(4)
+src    = "".join(block.format(body=body) for _ in range(500))
+tokens = lexer.tokenize(src)
+positions = preprocess.macro_positions(tokens)
+
+def legacy():
+    # the former loop : every token is visited and every directive ,
+    # active or not , goes through handle_macro
+    including_stack = [] ; define_table = {} ; output_tokens = []
+    for tk in tokens:
+        if not including_stack or including_stack[-1]:
+            if tk.tktype == lexer.TK_MACRO:
+                output_tokens.extend(preprocess.handle_macro(tk.value,define_table,including_stack,"."))
+            else:
+                output_tokens.append(tk)
+        elif tk.tktype == lexer.TK_MACRO:
+            output_tokens.extend(preprocess.handle_macro(tk.value,define_table,including_stack,"."))
+    return output_tokens
+
+def stream():
+    return list(preprocess.iter_preprocess(iter(tokens),{},[],"."))
+
+def indexed():
+    return list(preprocess.iter_preprocess(tokens,{},[],".",positions))
+
+with contextlib.redirect_stdout(io.StringIO()): # legacy redefines TRACE loudly
+    t_legacy , out_legacy = perf(legacy,7)
+t_stream  , out_stream  = perf(stream,7)
+t_indexed , out_indexed = perf(indexed,7)
+assert out_legacy == out_stream == out_indexed == []
+
+# a header whose #ifndef has an #else is not guarded , including it
+# twice gives both halves
+header_dir = tempfile.mkdtemp()
+with open(os.path.join(header_dir,"half.h"),'w',encoding='utf-8') as f:
+    f.write("#ifndef HALF_H\n#define HALF_H\nint a;\n#else\nint b;\n#endif\n")
+twice = lexer.tokenize('#include "half.h"\n#include "half.h"\n')
+assert [tk.value for tk in preprocess.entry(twice,header_dir)] == ["int","a",";","int","b",";"]
+
+print('tokens     = ',len(tokens))
+print('directives = ',len(positions))
+print('t_legacy   = ',t_legacy)
+print('t_stream   = ',t_stream)
+print('t_indexed  = ',t_indexed)
+print('speedup    = ',t_legacy / t_indexed,'(vs legacy)',t_stream / t_indexed,'(vs stream)')
+
+'''
+tokens     =  422000
+directives =  4000
+t_legacy   =  0.045890344999861554
+t_stream   =  0.016131714999573887
+t_indexed  =  0.00582086799931858
+speedup    =  7.883763212846213 (vs legacy) 2.7713590140615363 (vs stream)
+'''
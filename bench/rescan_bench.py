@@ -0,0 +1,54 @@
+import io
+import os
+import contextlib
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+from gen import gen_program
+
+class SpeculativeParser(parser.Parser):
+    '''the former decision : parse the base type , then rewind and parse again'''
+    __slots__ = ()
+
+    def at_type(self,ahead: int = 0) -> bool:
+        snapshot = self.pos
+        self.pos += ahead
+        found = self.parseBasetype() is not None
+        self.rewind(snapshot)
+        return found
+
+def run(parser_class,tokens):
+    with contextlib.redirect_stdout(io.StringIO()):
+        c_parser = parser_class(tokens)
+        return c_parser.program() , c_parser.rescanned
+
+c4vm_path = os.path.join(root,"c4vm.c")
+with open(c4vm_path,'r',encoding='utf-8') as f:
+    c4vm_src = f.read()
+
+for name , src in (("c4vm.c",c4vm_src),("functions",gen_program(300))):
+    tokens = preprocess.entry(lexer.tokenize(src),".")
+    speculative_time , (speculative_ast,speculative_cnt) = perf(lambda: run(SpeculativeParser,tokens),7)
+    lookahead_time   , (lookahead_ast  ,lookahead_cnt)   = perf(lambda: run(parser.Parser,tokens),7)
+    assert repr(speculative_ast) == repr(lookahead_ast)
+    print(name)
+    print('tokens       = ',len(tokens))
+    print('rescanned    = ',speculative_cnt,'->',lookahead_cnt)
+    print('speculative  = ',speculative_time)
+    print('lookahead    = ',lookahead_time)
+
+'''
+c4vm.c
+tokens       =  3309
+rescanned    =  198 -> 0
+speculative  =  0.007659775999854901
+lookahead    =  0.007446014999914041
+functions
+tokens       =  59148
+rescanned    =  3004 -> 0
+speculative  =  0.12669837499993264
+lookahead    =  0.12270419900005436
+'''
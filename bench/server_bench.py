@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import perf , root
+
+import client
+
+tmpdir = tempfile.mkdtemp()
+sock   = os.path.join(tmpdir,"c4.sock")
+target = os.path.join(tmpdir,"out.vm")
+server = subprocess.Popen([sys.executable,os.path.join(root,"server.py"),"--socket",sock])
+while not os.path.exists(sock):
+    time.sleep(0.01)
+
+def cold(path: str) -> bytes:
+    # --no-cache , a build cache hit is not a cold compile
+    subprocess.run([sys.executable,os.path.join(root,"compiler.py"),path,target,"--no-cache"],capture_output=True,check=True)
+    with open(target,'rb') as f:
+        return f.read()
+
+def client_cli(path: str) -> bytes:
+    subprocess.run([sys.executable,os.path.join(root,"client.py"),"--socket",sock,path,target],capture_output=True,check=True)
+    with open(target,'rb') as f:
+        return f.read()
+
+def request(path: str) -> bytes:
+    header , image = client.compile_path(path,sock)
+    assert header["ok"]
+    return image
+
+sources = (("hi.c",os.path.join(root,"hi.c")),("prime.c",os.path.join(root,"bench","prime.c")),("c4vm.c",os.path.join(root,"c4vm.c")))
+try:
+    for name , path in sources:
+        cold_time    , cold_image    = perf(lambda: cold(path))
+        cli_time     , cli_image     = perf(lambda: client_cli(path))
+        request_time , request_image = perf(lambda: request(path))
+        assert cold_image == cli_image == request_image
+        print('source       = ',name)
+        print('cold         = ',cold_time)
+        print('client.py    = ',cli_time,cold_time / cli_time)
+        print('request      = ',request_time,cold_time / request_time)
+finally:
+    client.request({"op": "shutdown"},path=sock)
+    server.wait()
+
+'''
+source       =  hi.c
+cold         =  0.17408621499998844
+client.py    =  0.04380861099980393 3.973789878906856
+request      =  0.001008035000268137 172.69858184852862
+source       =  prime.c
+cold         =  0.17487607800012483
+client.py    =  0.047267330000067886 3.699724058876896
+request      =  0.004637350000848528 37.710347066347495
+source       =  c4vm.c
+cold         =  0.3409833349996916
+client.py    =  0.19890096899962373 1.714337223768561
+request      =  0.18758439600060228 1.8177595912540443
+'''
@@ -0,0 +1,146 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import peephole
+import packer
+
+matmul = '''
+#include <stdio.h>
+long long a[1600];
+long long b[1600];
+long long c[1600];
+int main() {
+    long long n = 40;
+    for (long long i = 0; i < n; i++) {
+        for (long long j = 0; j < n; j++) {
+            a[i * n + j] = i + j;
+            b[i * n + j] = i - j;
+        }
+    }
+    long long sum = 0;
+    for (long long r = 0; r < 10; r++) {
+        for (long long i = 0; i < n; i++) {
+            for (long long j = 0; j < n; j++) {
+                long long s = 0;
+                for (long long k = 0; k < n; k++) {
+                    s = s + a[i * n + k] * b[k * n + j];
+                }
+                c[i * n + j] = s;
+            }
+        }
+        sum = sum + c[r * 41];
+    }
+    printf("%lld\\n", sum);
+    return 0;
+}
+'''
+
+bubble = '''
+#include <stdio.h>
+long long v[600];
+int main() {
+    long long n = 600;
+    long long seed = 12345;
+    for (long long i = 0; i < n; i++) {
+        seed = (seed * 1103515245 + 12345) % 2147483648;
+        v[i] = seed % 10000;
+    }
+    for (long long i = 0; i < n; i++) {
+        for (long long j = 0; j < n - 1 - i; j++) {
+            if (v[j] > v[j + 1]) {
+                long long t = v[j];
+                v[j] = v[j + 1];
+                v[j + 1] = t;
+            }
+        }
+    }
+    printf("%lld %lld %lld\\n", v[0], v[300], v[599]);
+    return 0;
+}
+'''
+
+fib = '''
+#include <stdio.h>
+long long fib(long long n) {
+    if (n < 2) return n;
+    long long a = fib(n - 1);
+    long long b = fib(n - 2);
+    return a + b;
+}
+int main() {
+    long long r = fib(25);
+    printf("%lld\\n", r);
+    return 0;
+}
+'''
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),"prime.c"),'r',encoding='utf-8') as f:
+    prime = f.read()
+
+def build(src: str,fused: bool) -> bytes:
+    passes = (peephole.Peephole(),)
+    if fused:
+        passes += (peephole.Peephole(peephole.fused_patterns),)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(src),root)
+        ast    = optimizer.fold(parser.parse(tokens))
+        raw_image = codegen.entry(ast,passes=passes,fused=fused)
+    return packer.packer(raw_image,ratio=None,stackspace=1 * 1024 * 1024)
+
+tmpdir = tempfile.mkdtemp()
+vm       = os.path.join(tmpdir,"c4vm")
+vm_count = os.path.join(tmpdir,"c4vm_count")
+subprocess.run(["cc","-O2","-w","-o",vm,os.path.join(root,"c4vm.c")],check=True)
+subprocess.run(["cc","-O2","-w","-DC4VM_COUNT","-o",vm_count,os.path.join(root,"c4vm.c")],check=True)
+
+def executed(path: str) -> int:
+    err = subprocess.run([vm_count,path],capture_output=True,text=True).stderr
+    return int(err.split()[1])
+
+for name , src in (("prime",prime),("matmul",matmul),("bubble",bubble),("fib",fib)):
+    res = {}
+    for fused in (False,True):
+        path = os.path.join(tmpdir,"{0}_{1}.vm".format(name,int(fused)))
+        with open(path,'wb') as f:
+            f.write(build(src,fused))
+        vm_time , out = perf(lambda: subprocess.run([vm,path],capture_output=True).stdout)
+        res[fused] = (executed(path),vm_time,out)
+    assert res[False][2] == res[True][2]
+    print('program      = ',name)
+    print('executed     = ',res[False][0],'->',res[True][0])
+    print('instr ratio  = ',res[True][0] / res[False][0])
+    print('vm time      = ',res[False][1],'->',res[True][1])
+    print('speedup      = ',res[False][1] / res[True][1])
+
+'''
+program      =  prime
+executed     =  12668788 -> 8656796
+instr ratio  =  0.6833168255716332
+vm time      =  0.03771922700025243 -> 0.02571996599999693
+speedup      =  1.4665348702349348
+program      =  matmul
+executed     =  39366862 -> 26847788
+instr ratio  =  0.6819895372915423
+vm time      =  0.10066936099974555 -> 0.07143485699998564
+speedup      =  1.4092470430754245
+program      =  bubble
+executed     =  13406355 -> 8207852
+instr ratio  =  0.6122359134902813
+vm time      =  0.03763782300029561 -> 0.022982620999755454
+speedup      =  1.6376645205390672
+program      =  fib
+executed     =  5826847 -> 3763177
+instr ratio  =  0.6458341878549411
+vm time      =  0.017760305000138032 -> 0.012723695000204316
+speedup      =  1.3958449176794037
+'''
@@ -0,0 +1,54 @@
+
+from harness import perf
+
+import parser
+
+class ChainTable:
+    '''the former lookup : walk the father chain on every get'''
+    def __init__(self,father = None):
+        self.mapper = {}
+        self.father = father
+    def get(self,sym):
+        if sym in self.mapper:
+            return self.mapper[sym]
+        if self.father:
+            return self.father.get(sym)
+    def set(self,sym,val):
+        self.mapper[sym] = val
+
+depth   = 16
+lookups = [("long","long"),("unsigned","long","long"),("x0",),("struct","pair"),("printf",)] * 20000
+
+chain   = ChainTable(parser.rootTable())
+chain.set(("x0",),("var",None)) ; chain.set(("struct","pair"),("type",None))
+for level in range(depth):
+    chain = ChainTable(chain)
+    chain.set(("x{0}".format(level + 1),),("var",None))
+
+stack   = parser.ScopeStack(parser.rootTable())
+stack.set(("x0",),("var",None)) ; stack.set(("struct","pair"),("type",None))
+for level in range(depth):
+    stack.push()
+    stack.set(("x{0}".format(level + 1),),("var",None))
+
+# the snapshot codegen reads , resolved after parsing
+innermost = stack.scope()
+
+chain_time    , chain_res    = perf(lambda: [chain.get(sym) for sym in lookups],7)
+stack_time    , stack_res    = perf(lambda: [stack.get(sym) for sym in lookups],7)
+snapshot_time , snapshot_res = perf(lambda: [innermost.get(sym) for sym in lookups],7)
+assert chain_res == stack_res == snapshot_res
+
+print('depth        = ',depth)
+print('lookups      = ',len(lookups))
+print('chain        = ',chain_time)
+print('scope stack  = ',stack_time)
+print('snapshot     = ',snapshot_time)
+
+'''
+depth        =  16
+lookups      =  100000
+chain        =  0.1715275090000432
+scope stack  =  0.01363391299992145
+snapshot     =  0.014125127000170323
+'''
@@ -0,0 +1,80 @@
+import gc
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any
+
+from harness import perf
+
+import lexer
+from common import *
+from gen import gen_program
+
+@dataclass
+class DictToken:
+    '''the former token layout : __dict__ instance with a str kind'''
+    tktype : str
+    value  : Any
+    line   : int
+
+def build_dict_tokens(tokens: list[Token]) -> list[DictToken]:
+    return [DictToken(tktype_name[tk.tktype],tk.value,tk.line) for tk in tokens]
+
+def build_slot_tokens(tokens: list[Token]) -> list[Token]:
+    return [Token(tk.tktype,tk.value,tk.line) for tk in tokens]
+
+def scan_dict(tokens: list[DictToken]) -> int:
+    # parser style matching , one kind test and one value test per token
+    hits = 0
+    for tk in tokens:
+        if tk.tktype == "operator" and tk.value == ";":
+            hits += 1
+        elif tk.tktype == "identifier" and tk.value == "acc":
+            hits += 1
+    return hits
+
+def scan_slot(tokens: list[Token]) -> int:
+    hits = 0
+    for tk in tokens:
+        if tk.tktype == TK_OPERATOR and tk.value == ";":
+            hits += 1
+        elif tk.tktype == TK_IDENTIFIER and tk.value == "acc":
+            hits += 1
+    return hits
+
+def memory(func,arg) -> int:
+    gc.collect()
+    tracemalloc.start()
+    res = func(arg)
+    size , _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+src    = gen_program(1000)
+tokens = lexer.tokenize(src)
+
+t_build_dict , dict_tokens = perf(lambda: build_dict_tokens(tokens),7)
+t_build_slot , slot_tokens = perf(lambda: build_slot_tokens(tokens),7)
+t_scan_dict  , hits_dict   = perf(lambda: scan_dict(dict_tokens),7)
+t_scan_slot  , hits_slot   = perf(lambda: scan_slot(slot_tokens),7)
+assert hits_dict == hits_slot
+
+m_dict = memory(build_dict_tokens,tokens)
+m_slot = memory(build_slot_tokens,tokens)
+
+print('tokens       = ',len(tokens))
+print('build dict   = ',t_build_dict)
+print('build slots  = ',t_build_slot)
+print('scan  dict   = ',t_scan_dict)
+print('scan  slots  = ',t_scan_slot)
+print('bytes/token dict  = ',m_dict / len(tokens))
+print('bytes/token slots = ',m_slot / len(tokens))
+
+'''
+tokens       =  197049
+build dict   =  0.07809672799999134
+build slots  =  0.03934495900011825
+scan  dict   =  0.013620936000052097
+scan  slots  =  0.01048320299992156
+bytes/token dict  =  104.24221386558673
+bytes/token slots =  64.24221386558673
+'''
\ No newline at end of file
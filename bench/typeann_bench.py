@@ -0,0 +1,89 @@
+import io
+import os
+import contextlib
+
+from harness import perf
+
+import lexer
+import preprocess
+import parser
+import codegen
+
+header = '''
+struct leaf {
+    long long v;
+    long long arr[4];
+};
+
+struct mid {
+    struct leaf leaves[4];
+    long long w;
+};
+
+struct top {
+    struct mid mids[4];
+    struct mid *pm;
+};
+
+struct top tops[4];
+'''
+
+function_template = '''
+long long chain{n}(long long a,long long b) {{
+    long long r = 0;
+    struct top *t = &tops[1];
+    t->pm = &t->mids[2];
+    tops[1].mids[2].leaves[3].arr[1] = a;
+    r = {chain};
+    r = r + tops[1].mids[2].leaves[3].arr[1] + t->pm->leaves[3].v + t->mids[2].leaves[3].arr[1];
+    return r;
+}}
+'''
+
+def gen_chains(nfuncs: int,terms: int) -> str:
+    chain = " + ".join(("a * {0}" if i % 2 else "b - {0}").format(i) for i in range(terms))
+    return header + "".join(function_template.format(n=n,chain=chain) for n in range(nfuncs))
+
+def run(ast):
+    with open(os.devnull,'w') as devnull , contextlib.redirect_stdout(devnull):
+        return codegen.entry(ast)
+
+memo_ast_type = codegen.ast_type
+memo_annotate = codegen.annotate
+
+def legacy(ast):
+    # every ast_type call recomputes its whole subtree
+    codegen.ast_type = codegen.infer_type
+    codegen.annotate = lambda ctx,astroot: None
+    try:
+        return run(ast)
+    finally:
+        codegen.ast_type = memo_ast_type
+        codegen.annotate = memo_annotate
+
+for terms in (8,32,64):
+    tokens = preprocess.entry(lexer.tokenize(gen_chains(20,terms)),".")
+    with contextlib.redirect_stdout(io.StringIO()):
+        ast = parser.parse(tokens)
+    legacy_time , legacy_image = perf(lambda: legacy(ast),3)
+    memo_time   , memo_image   = perf(lambda: run(ast),3)
+    assert legacy_image == memo_image
+    print('terms        = ',terms)
+    print('recompute    = ',legacy_time)
+    print('annotated    = ',memo_time)
+    print('speedup      = ',legacy_time / memo_time)
+
+'''
+terms        =  8
+recompute    =  0.09501378300001306
+annotated    =  0.06857841999999437
+speedup      =  1.3854764078848838
+terms        =  32
+recompute    =  2.179755053000008
+annotated    =  0.3895385759999499
+speedup      =  5.595736051056182
+terms        =  64
+recompute    =  15.396389627999952
+annotated    =  0.9750703330000761
+speedup      =  15.790029813160924
+'''
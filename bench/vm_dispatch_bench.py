@@ -0,0 +1,125 @@
+import io
+import os
+import contextlib
+import subprocess
+import tempfile
+
+from harness import perf , root
+
+import lexer
+import preprocess
+import parser
+import optimizer
+import codegen
+import peephole
+import packer
+
+matmul = '''
+#include <stdio.h>
+long long a[1600];
+long long b[1600];
+long long c[1600];
+int main() {
+    long long n = 40;
+    for (long long i = 0; i < n; i++) {
+        for (long long j = 0; j < n; j++) {
+            a[i * n + j] = i + j;
+            b[i * n + j] = i - j;
+        }
+    }
+    long long sum = 0;
+    for (long long r = 0; r < 10; r++) {
+        for (long long i = 0; i < n; i++) {
+            for (long long j = 0; j < n; j++) {
+                long long s = 0;
+                for (long long k = 0; k < n; k++) {
+                    s = s + a[i * n + k] * b[k * n + j];
+                }
+                c[i * n + j] = s;
+            }
+        }
+        sum = sum + c[r * 41];
+    }
+    printf("%lld\\n", sum);
+    return 0;
+}
+'''
+
+fib = '''
+#include <stdio.h>
+long long fib(long long n) {
+    if (n < 2) return n;
+    long long a = fib(n - 1);
+    long long b = fib(n - 2);
+    return a + b;
+}
+int main() {
+    long long r = fib(25);
+    printf("%lld\\n", r);
+    return 0;
+}
+'''
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(bench_dir,"prime.c"),'r',encoding='utf-8') as f:
+    prime = f.read()
+with open(os.path.join(root,"c4vm.c"),'r',encoding='utf-8') as f:
+    c4vm = f.read()
+
+def build(src: str) -> bytes:
+    passes = (peephole.Peephole(),peephole.Peephole(peephole.fused_patterns))
+    with contextlib.redirect_stdout(io.StringIO()):
+        tokens = preprocess.entry(lexer.tokenize(src),root)
+        ast    = optimizer.fold(parser.parse(tokens))
+        raw_image = codegen.entry(ast,passes=passes,fused=True)
+    return packer.packer(raw_image,ratio=None,stackspace=1 * 1024 * 1024)
+
+tmpdir = tempfile.mkdtemp()
+
+def write(name: str,image: bytes) -> str:
+    path = os.path.join(tmpdir,name)
+    with open(path,'wb') as f:
+        f.write(image)
+    return path
+
+# the if / else chain (run) , the switch fallback and computed goto
+modes = (("chain","-DC4VM_SLOW"),("switch","-DC4VM_SWITCH"),("threaded",None))
+vms = {}
+for mode , flag in modes:
+    vms[mode] = os.path.join(tmpdir,"c4vm_" + mode)
+    subprocess.run(["cc","-O2","-w",*([flag] if flag else []),"-o",vms[mode],os.path.join(root,"c4vm.c")],check=True)
+
+prime_vm = write("prime.vm",build(prime))
+programs = (
+    ("prime" ,(prime_vm,)),
+    ("matmul",(write("matmul.vm",build(matmul)),)),
+    ("fib"   ,(write("fib.vm",build(fib)),)),
+    ("c4vm"  ,(write("c4vm.vm",build(c4vm)),prime_vm)),
+)
+for name , args in programs:
+    res = {}
+    for mode , _ in modes:
+        res[mode] = perf(lambda: subprocess.run([vms[mode],*args],capture_output=True).stdout,3)
+    assert res["chain"][1] == res["switch"][1] == res["threaded"][1]
+    print('program      = ',name)
+    for mode , _ in modes:
+        print('{0:<12} = '.format(mode),res[mode][0],res["chain"][0] / res[mode][0])
+
+'''
+program      =  prime
+chain        =  0.025603704000332073 1.0
+switch       =  0.02550546000020404 1.0038518811316184
+threaded     =  0.013014103000386967 1.9673813861447662
+program      =  matmul
+chain        =  0.07165815400003339 1.0
+switch       =  0.06712409399960961 1.0675474293991982
+threaded     =  0.027493490000324528 2.6063680529168014
+program      =  fib
+chain        =  0.01272346399991875 1.0
+switch       =  0.010289680999903794 1.2365265745398435
+threaded     =  0.005769166999925801 2.2054248039764475
+program      =  c4vm
+chain        =  2.537488062999728 1.0
+switch       =  2.437948717999916 1.0408291381458892
+threaded     =  0.9455258439998033 2.6836792236852447
+'''
@@ -0,0 +1,104 @@
+'''
+content addressed cache of packed images. the key is a sha256 over the
+compiler's own sources , the build options , the source text and every
+header in its include closure , so a hit can be copied to the target
+without lexing or parsing. entries are files <key>.vm whose mtime is
+bumped on every hit , eviction drops the least recently used ones once
+the directory is over max_bytes
+'''
+
+import os
+import hashlib
+import tempfile
+import preprocess
+
+# modules whose code decides what an image looks like
+compiler_modules = ("common","lexer","preprocess","parser","optimizer","codegen","peephole","packer","compiler")
+
+version = None
+
+def compiler_version() -> str:
+    '''hash of the compiler sources , computed once per process'''
+    global version
+    if version is None:
+        digest = hashlib.sha256()
+        root   = os.path.dirname(os.path.abspath(__file__))
+        for name in compiler_modules:
+            with open(os.path.join(root,name + ".py"),'rb') as f:
+                digest.update(name.encode() + b"\0" + f.read() + b"\0")
+        version = digest.hexdigest()
+    return version
+
+def default_directory() -> str:
+    '''$C4_CACHE_DIR , else $XDG_CACHE_HOME/c4 , else ~/.cache/c4'''
+    if "C4_CACHE_DIR" in os.environ:
+        return os.environ["C4_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"),".cache")
+    return os.path.join(base,"c4")
+
+class BuildCache:
+    def __init__(self,directory: str = None,max_bytes: int = 64 * 1024 * 1024):
+        self.directory = default_directory() if directory is None else directory
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+
+    def key(self,src: str,cwd: str,options: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(compiler_version().encode() + b"\0")
+        digest.update(options.encode() + b"\0")
+        digest.update(src.encode('utf-8') + b"\0")
+        for path in sorted(preprocess.include_closure(src,cwd)):
+            digest.update(path.encode('utf-8') + b"\0")
+            try:
+                with open(path,'rb') as f:
+                    digest.update(b"1" + f.read() + b"\0")
+            except OSError:
+                digest.update(b"0") # missing , creating it changes the key
+        return digest.hexdigest()
+
+    def path(self,key: str) -> str:
+        return os.path.join(self.directory,key + ".vm")
+
+    def get(self,key: str) -> bytes:
+        '''the cached image , None on a miss'''
+        path = self.path(key)
+        try:
+            with open(path,'rb') as f:
+                image = f.read()
+            os.utime(path) # most recently used
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image
+
+    def put(self,key: str,image: bytes):
+        '''store image , a failing cache directory never fails the build'''
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            fd , tmp_path = tempfile.mkstemp(dir=self.directory,suffix=".tmp")
+            with os.fdopen(fd,'wb') as f:
+                f.write(image)
+            os.replace(tmp_path,self.path(key)) # readers never see half an entry
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        '''drop least recently used entries until the cache fits max_bytes'''
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".vm"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns,st.st_size,entry.path))
+        total = sum(size for _ , size , _ in entries)
+        for _ , size , path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
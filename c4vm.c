@@ -15,24 +15,156 @@
 // #define C4VM_DEBUG
 #define C4VM_NOWRITE
 // #define C4VM_VERBOSE
+// #define C4VM_COUNT
+
+// fast dispatch (run_fast) : computed goto with GCC / Clang , a switch with
+// MSVC or -DC4VM_SWITCH. our own compiler defines neither and keeps run ,
+// as do C4VM_VERBOSE and C4VM_SLOW builds
+#ifdef __GNUC__
+#define C4VM_FAST
+#define C4VM_THREADED
+#endif
+#ifdef _MSC_VER
+#define C4VM_FAST
+#endif
+#ifdef C4VM_SWITCH
+#define C4VM_FAST
+#undef C4VM_THREADED
+#endif
+#ifdef C4VM_VERBOSE
+#undef C4VM_FAST
+#endif
+#ifdef C4VM_SLOW
+#undef C4VM_FAST
+#endif
+
+// v2 images are mapped instead of read where mmap is available
+#ifdef __unix__
+#define C4VM_MMAP
+#endif
+#ifdef __APPLE__
+#define C4VM_MMAP
+#endif
+#ifdef C4VM_MMAP
+#include <sys/mman.h>
+#endif
 
 struct c4vm {
     long long  pc,bp,sp,reg;
     long long* base;
+    long long  loaded; // words of memory loaded from the image
+    long long  bss_start,bss_end; // words of the bss , zeros never decoded
 };
 
 enum OPCODES { 
     NOP ,LEA ,IMM ,JMP ,JSR ,BZ  ,BNZ ,ENT ,ADJ ,LEV ,LI  ,LC  ,SI  ,SC  ,PSH ,
     OR  ,XOR ,AND ,EQ  ,NE  ,LT  ,GT  ,LE  ,GE  ,SHL ,SHR ,ADD ,SUB ,MUL ,DIV ,MOD ,
     FADD,FSUB,FMUL,FDIV,I2F ,F2I ,JREG,JSRR,NOT ,WRIT,GETC,
-    OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF,OPCODE_END
+    OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF,
+    LLI ,LLC ,GLI ,GLC ,SLI ,SLC ,SGI ,SGC ,ADDI,SUBI,MULI,
+    EQBZ,NEBZ,LTBZ,GTBZ,LEBZ,GEBZ,OPCODE_END
 };
 
 int OPCODE_LEN = sizeof(enum OPCODES);
 
+#ifdef C4VM_COUNT
+long long executed = 0;
+#endif
+
+// library calls , cold paths shared by every dispatch loop
+void native(struct c4vm* vm,long long opcode) {
+    if (opcode == OPEN) {
+#ifdef C4VM_DEBUG
+        printf("OPEN IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
+#else
+        vm->reg = open((char*)vm->base + vm->base[vm->sp + 1], vm->base[vm->sp]);
+#endif
+    } else if (opcode == READ) {
+        vm->reg = read(vm->base[vm->sp + 2], (char*)vm->base + vm->base[vm->sp + 1], vm->base[vm->sp]);
+    } else if (opcode == CLOS) {
+#ifdef C4VM_DEBUG
+        printf("CLOS IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
+#else
+        vm->reg = close(vm->base[vm->sp]);
+#endif
+    } else if (opcode == PRTF) {
+        long long arg_offset = vm->sp + vm->base[vm->pc + 1];
+        long long argpos = 2;
+        char *fmt = (char*)vm->base + vm->base[arg_offset - 1];
+        for (char *p = fmt; *p != 0; p++) {
+            if (argpos > 6) break;
+            if (*p == '%') {
+                p++;
+                while (*p != 0 && !(*p >= 'a' && *p <= 'z') && !(*p >= 'A' && *p <= 'Z')) {
+                    p++;
+                }
+                if (*p == 's') {
+                    vm->base[arg_offset - argpos] += (long long)vm->base;
+                }
+                argpos++;
+                if (*p == 0) break; 
+            }
+        }
+        vm->reg = printf(
+            fmt,
+            vm->base[arg_offset - 2],
+            vm->base[arg_offset - 3],
+            vm->base[arg_offset - 4],
+            vm->base[arg_offset - 5],
+            vm->base[arg_offset - 6]
+        );
+    } else if (opcode == MALC) {
+        vm->reg = (long long) malloc(vm->base[vm->sp]) - (long long)vm->base;
+    } else if (opcode == FREE) {
+        free((char*)vm->base + vm->base[vm->sp]);
+    } else if (opcode == MSET) {
+        vm->reg = (long long) memset((char *)vm->base + vm->base[vm->sp + 2],vm->base[vm->sp + 1],vm->base[vm->sp]) - (long long)vm->base;
+    } else if (opcode == MCPY) {
+        memcpy((char *)vm->base + vm->base[vm->sp + 2],(char *) vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
+    } else if (opcode == MCMP) {
+        vm->reg = memcmp((char*)vm->base + vm->base[vm->sp + 2],(char*)vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
+    }
+    
+    // My Extensions
+    else if (opcode == SCMP) {
+        vm->reg = strcmp((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]);
+    } else if (opcode == SLEN) {
+        vm->reg = strlen((char *)vm->base + vm->base[vm->sp]);
+    } else if (opcode == SSTR) {
+        vm->reg = (long long)((void*)strstr((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]) - (void*)vm->base);
+    } else if (opcode == SCAT) {
+        vm->reg = (long long)((void*)strcat((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]) - (void*)vm->base);
+    } else if (opcode == SCNF) {
+        long long arg_offset = vm->sp + vm->base[vm->pc + 1];
+        vm->reg = scanf((char*)vm->base + vm->base[arg_offset-1],(char*)vm->base + vm->base[arg_offset-2],(char*)vm->base + vm->base[arg_offset-3],(char*)vm->base + vm->base[arg_offset-4],(char*)vm->base + vm->base[arg_offset-5],(char*)vm->base + vm->base[arg_offset-6]);
+    } else if (opcode == WRIT) {
+#ifdef C4VM_DEBUG
+        printf("WRIT IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
+#else
+#ifdef C4VM_NOWRITE
+        printf("WRIT IS FORBIDDEN WHEN WITH C4VM_NOWRITE\n");
+#else
+        vm->reg = write(vm->base[vm->sp + 2],(char*)vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
+#endif
+#endif
+    } else if (opcode == GETC) {
+        vm->reg = getchar();
+    }
+    
+    // Unknown instruction
+    else {
+#ifdef C4VM_DEBUG
+        printf("unknown instruction = %lld!\n",opcode);
+#endif
+    }
+}
+
 long long run(struct c4vm* vm) {
     while (1) {
         long long opcode = vm->base[vm->pc++];
+#ifdef C4VM_COUNT
+        executed++;
+#endif
 #ifdef C4VM_VERBOSE
         if (opcode < OPCODE_END && opcode >= 0) {
             printf(
@@ -40,7 +172,9 @@ long long run(struct c4vm* vm) {
                 &"NOP ,LEA ,IMM ,JMP ,JSR ,BZ  ,BNZ ,ENT ,ADJ ,LEV ,LI  ,LC  ,SI  ,SC  ,PSH ,"
                 "OR  ,XOR ,AND ,EQ  ,NE  ,LT  ,GT  ,LE  ,GE  ,SHL ,SHR ,ADD ,SUB ,MUL ,DIV ,MOD ,"
                 "FADD,FSUB,FMUL,FDIV,I2F ,F2I ,JREG,JSRR,NOT ,WRIT,GETC,"
-                "OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF,"[opcode * 5]
+                "OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF,"
+                "LLI ,LLC ,GLI ,GLC ,SLI ,SLC ,SGI ,SGC ,ADDI,SUBI,MULI,"
+                "EQBZ,NEBZ,LTBZ,GTBZ,LEBZ,GEBZ,"[opcode * 5]
             );
             printf("[PC:%04lld] [SP:%04lld] [BP:%04lld] [REG:0x%llx (%lld)]\n", 
                vm->pc * 8, vm->sp * 8, vm->bp * 8, vm->reg, vm->reg);
@@ -83,6 +217,48 @@ long long run(struct c4vm* vm) {
         } else if (opcode == PSH) {
             vm->base[--vm->sp] = vm->reg;
         } 
+        // Fused Operations (superinstructions)
+        else if (opcode == LLI) {
+            vm->reg = *(long long*)((char*)vm->base + 8 * vm->bp + vm->base[vm->pc++]);
+        } else if (opcode == LLC) {
+            vm->reg = ((char*)vm->base)[8 * vm->bp + vm->base[vm->pc++]];
+        } else if (opcode == GLI) {
+            vm->reg = *(long long*)((char*)vm->base + vm->base[vm->pc++]);
+        } else if (opcode == GLC) {
+            vm->reg = ((char*)vm->base)[vm->base[vm->pc++]];
+        } else if (opcode == SLI) {
+            *(long long*)((char*)vm->base + 8 * vm->bp + vm->base[vm->pc++]) = vm->reg;
+        } else if (opcode == SLC) {
+            *((char*)vm->base + 8 * vm->bp + vm->base[vm->pc++]) = vm->reg;
+        } else if (opcode == SGI) {
+            *(long long*)((char*)vm->base + vm->base[vm->pc++]) = vm->reg;
+        } else if (opcode == SGC) {
+            *((char*)vm->base + vm->base[vm->pc++]) = vm->reg;
+        } else if (opcode == ADDI) {
+            vm->reg = vm->reg + vm->base[vm->pc++];
+        } else if (opcode == SUBI) {
+            vm->reg = vm->reg - vm->base[vm->pc++];
+        } else if (opcode == MULI) {
+            vm->reg = vm->reg * vm->base[vm->pc++];
+        } else if (opcode == EQBZ) {
+            vm->reg = vm->base[vm->sp++] == vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        } else if (opcode == NEBZ) {
+            vm->reg = vm->base[vm->sp++] != vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        } else if (opcode == LTBZ) {
+            vm->reg = vm->base[vm->sp++] < vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        } else if (opcode == GTBZ) {
+            vm->reg = vm->base[vm->sp++] > vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        } else if (opcode == LEBZ) {
+            vm->reg = vm->base[vm->sp++] <= vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        } else if (opcode == GEBZ) {
+            vm->reg = vm->base[vm->sp++] >= vm->reg;
+            vm->pc  = vm->reg ? vm->pc + 1 : (vm->base[vm->pc] / 8);
+        }
         // Logics & Arithmetics
         else if (opcode == OR) {
             vm->reg = vm->base[vm->sp++] | vm->reg;
@@ -166,110 +342,210 @@ long long run(struct c4vm* vm) {
         }
 
         // Library functions
-        else if (opcode == OPEN) {
-#ifdef C4VM_DEBUG
-            printf("OPEN IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
-#else
-            vm->reg = open((char*)vm->base + vm->base[vm->sp + 1], vm->base[vm->sp]);
-#endif
-        } else if (opcode == READ) {
-            vm->reg = read(vm->base[vm->sp + 2], (char*)vm->base + vm->base[vm->sp + 1], vm->base[vm->sp]);
-        } else if (opcode == CLOS) {
-#ifdef C4VM_DEBUG
-            printf("CLOS IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
-#else
-            vm->reg = close(vm->base[vm->sp]);
-#endif
-        } else if (opcode == PRTF) {
-            long long arg_offset = vm->sp + vm->base[vm->pc + 1];
-            long long argpos = 2;
-            char *fmt = (char*)vm->base + vm->base[arg_offset - 1];
-            for (char *p = fmt; *p != 0; p++) {
-                if (argpos > 6) break;
-                if (*p == '%') {
-                    p++;
-                    while (*p != 0 && !(*p >= 'a' && *p <= 'z') && !(*p >= 'A' && *p <= 'Z')) {
-                        p++;
-                    }
-                    if (*p == 's') {
-                        vm->base[arg_offset - argpos] += (long long)vm->base;
-                    }
-                    argpos++;
-                    if (*p == 0) break; 
-                }
-            }
-            vm->reg = printf(
-                fmt,
-                vm->base[arg_offset - 2],
-                vm->base[arg_offset - 3],
-                vm->base[arg_offset - 4],
-                vm->base[arg_offset - 5],
-                vm->base[arg_offset - 6]
-            );
-        } else if (opcode == MALC) {
-            vm->reg = (long long) malloc(vm->base[vm->sp]) - (long long)vm->base;
-        } else if (opcode == FREE) {
-            free(vm->base + vm->base[vm->sp]);
-        } else if (opcode == MSET) {
-            vm->reg = (long long) memset((char *)vm->base + vm->base[vm->sp + 2],vm->base[vm->sp + 1],vm->base[vm->sp]) - (long long)vm->base;
-        } else if (opcode == MCPY) {
-            memcpy((char *)vm->base + vm->base[vm->sp + 2],(char *) vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
-        } else if (opcode == MCMP) {
-            vm->reg = memcmp((char*)vm->base + vm->base[vm->sp + 2],(char*)vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
-        } else if (opcode == EXIT) {
+        else if (opcode == EXIT) {
 #ifdef C4VM_DEBUG
             printf("program exited with %lld\n",vm->base[vm->sp]);
+#endif
+#ifdef C4VM_COUNT
+            fprintf(stderr,"executed %lld instructions\n",executed);
 #endif
             return vm->base[vm->sp];
-        } 
+        } else {
+            native(vm,opcode);
+        }
         
-        // My Extensions
-        else if (opcode == SCMP) {
-            vm->reg = strcmp((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]);
-        } else if (opcode == SLEN) {
-            vm->reg = strlen((char *)vm->base + vm->base[vm->sp]);
-        } else if (opcode == SSTR) {
-            vm->reg = (long long)((void*)strstr((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]) - (void*)vm->base);
-        } else if (opcode == SCAT) {
-            vm->reg = (long long)((void*)strcat((char *)vm->base + vm->base[vm->sp + 1],(char *)vm->base + vm->base[vm->sp]) - (void*)vm->base);
-        } else if (opcode == SCNF) {
-            long long arg_offset = vm->sp + vm->base[vm->pc + 1];
-            vm->reg = scanf((char*)vm->base + vm->base[arg_offset-1],(char*)vm->base + vm->base[arg_offset-2],(char*)vm->base + vm->base[arg_offset-3],(char*)vm->base + vm->base[arg_offset-4],(char*)vm->base + vm->base[arg_offset-5],(char*)vm->base + vm->base[arg_offset-6]);
-        } else if (opcode == WRIT) {
-#ifdef C4VM_DEBUG
-            printf("WRIT IS FORBIDDEN WHEN WITH C4VM_DEBUG\n");
+        // FOR DEBUG
+        // printf("vm->sp = %lld (%lld,%lld,%lld) , ",vm->sp,vm->base[vm->sp],vm->base[vm->sp+1],vm->base[vm->sp+2]);
+        // printf("vm->pc = %lld (%lld,%lld,%lld)",vm->pc,vm->base[vm->pc],vm->base[vm->pc+1],vm->base[vm->pc+2]);
+        // getchar();
+    }
+}
+
+#ifdef C4VM_FAST
+// fast dispatch : the text is decoded once at load into handler
+// addresses (computed goto) and word index jump targets , frames keep
+// word indices too so no JMP / JSR / BZ / BNZ / LEV divides by 8
+#ifdef C4VM_COUNT
+#define COUNT executed++;
 #else
-#ifdef C4VM_NOWRITE
-            printf("WRIT IS FORBIDDEN WHEN WITH C4VM_NOWRITE\n");
+#define COUNT
+#endif
+#ifdef C4VM_THREADED
+#define OP(name) L_##name:
+#define NEXT     COUNT goto *code[pc++];
 #else
-            vm->reg = write(vm->base[vm->sp + 2],(char*)vm->base + vm->base[vm->sp + 1],vm->base[vm->sp]);
+#define OP(name) case name:
+#define NEXT     COUNT continue;
 #endif
+
+// first word at or after i that may hold code : the bss is skipped and
+// so is everything between the loaded image and the bootstrap PSH ; EXIT
+long long next_decoded(struct c4vm* vm,long long i,long long words) {
+    if (i >= vm->bss_start && i < vm->bss_end) i = vm->bss_end;
+    if (i >= vm->loaded && i < words - 2) i = words - 2;
+    return i;
+}
+
+long long run_fast(struct c4vm* vm) {
+    long long* base  = vm->base;
+    long long  pc    = vm->pc;
+    long long  bp    = vm->bp;
+    long long  sp    = vm->sp;
+    long long  reg   = vm->reg;
+    long long  words = vm->bp; // bp is still the top of memory at load
+    long long  i;
+    double     f1 , f2;
+
+    // only the loaded image holds code , besides the PSH ; EXIT the
+    // loader leaves at the top of the stack. the bss and the rest are
+    // never decoded so their pages are not touched
+    long long* target = malloc(words * sizeof(long long));
+    if (!target) {
+        printf("Malloc failed\n");
+        exit(1);
+    }
+    for (i = next_decoded(vm,0,words); i < words; i = next_decoded(vm,i + 1,words)) {
+        target[i] = base[i] / 8;
+    }
+    base[sp] = base[sp] / 8; // return address of the bootstrap frame
+
+#ifdef C4VM_THREADED
+    static void* handlers[OPCODE_END] = {
+        [NOP ] = &&L_NOP , [LEA ] = &&L_LEA , [IMM ] = &&L_IMM , [JMP ] = &&L_JMP ,
+        [JSR ] = &&L_JSR , [BZ  ] = &&L_BZ  , [BNZ ] = &&L_BNZ , [ENT ] = &&L_ENT ,
+        [ADJ ] = &&L_ADJ , [LEV ] = &&L_LEV , [LI  ] = &&L_LI  , [LC  ] = &&L_LC  ,
+        [SI  ] = &&L_SI  , [SC  ] = &&L_SC  , [PSH ] = &&L_PSH , [OR  ] = &&L_OR  ,
+        [XOR ] = &&L_XOR , [AND ] = &&L_AND , [EQ  ] = &&L_EQ  , [NE  ] = &&L_NE  ,
+        [LT  ] = &&L_LT  , [GT  ] = &&L_GT  , [LE  ] = &&L_LE  , [GE  ] = &&L_GE  ,
+        [SHL ] = &&L_SHL , [SHR ] = &&L_SHR , [ADD ] = &&L_ADD , [SUB ] = &&L_SUB ,
+        [MUL ] = &&L_MUL , [DIV ] = &&L_DIV , [MOD ] = &&L_MOD , [FADD] = &&L_FADD,
+        [FSUB] = &&L_FSUB, [FMUL] = &&L_FMUL, [FDIV] = &&L_FDIV, [I2F ] = &&L_I2F ,
+        [F2I ] = &&L_F2I , [JREG] = &&L_JREG, [JSRR] = &&L_JSRR, [NOT ] = &&L_NOT ,
+        [EXIT] = &&L_EXIT, [LLI ] = &&L_LLI , [LLC ] = &&L_LLC , [GLI ] = &&L_GLI ,
+        [GLC ] = &&L_GLC , [SLI ] = &&L_SLI , [SLC ] = &&L_SLC , [SGI ] = &&L_SGI ,
+        [SGC ] = &&L_SGC , [ADDI] = &&L_ADDI, [SUBI] = &&L_SUBI, [MULI] = &&L_MULI,
+        [EQBZ] = &&L_EQBZ, [NEBZ] = &&L_NEBZ, [LTBZ] = &&L_LTBZ, [GTBZ] = &&L_GTBZ,
+        [LEBZ] = &&L_LEBZ, [GEBZ] = &&L_GEBZ,
+    };
+    void** code = malloc(words * sizeof(void*));
+    if (!code) {
+        free(target);
+        printf("Malloc failed\n");
+        exit(1);
+    }
+    for (i = next_decoded(vm,0,words); i < words; i = next_decoded(vm,i + 1,words)) {
+        code[i] = base[i] >= 0 && base[i] < OPCODE_END && handlers[base[i]] ? handlers[base[i]] : &&L_NATIVE;
+    }
+    NEXT
+#else
+    for (;;) switch (base[pc++]) {
 #endif
-        } else if (opcode == GETC) {
-            vm->reg = getchar();
-        }
-        
-        // Unknown instruction
-        else {
+    OP(NOP)  NEXT
+    OP(LEA)  reg = 8 * bp + base[pc++]; NEXT
+    OP(IMM)  reg = base[pc++]; NEXT
+    OP(JMP)  pc = target[pc]; NEXT
+    OP(JSR)  base[--sp] = pc + 1; pc = target[pc]; NEXT
+    OP(BZ)   pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(BNZ)  pc = reg ? target[pc] : pc + 1; NEXT
+    OP(ENT)  base[--sp] = bp; bp = sp; sp -= base[pc++]; NEXT
+    OP(ADJ)  sp += base[pc++]; NEXT
+    OP(LEV)  sp = bp; bp = base[sp++]; pc = base[sp++]; NEXT
+    OP(LI)   reg = *(long long*)((char*)base + reg); NEXT
+    OP(LC)   reg = ((char*)base)[reg]; NEXT
+    OP(SI)   *(long long*)((char*)base + base[sp++]) = reg; NEXT
+    OP(SC)   *((char*)base + base[sp++]) = reg; NEXT
+    OP(PSH)  base[--sp] = reg; NEXT
+    OP(OR)   reg = base[sp++] |  reg; NEXT
+    OP(XOR)  reg = base[sp++] ^  reg; NEXT
+    OP(AND)  reg = base[sp++] &  reg; NEXT
+    OP(EQ)   reg = base[sp++] == reg; NEXT
+    OP(NE)   reg = base[sp++] != reg; NEXT
+    OP(LT)   reg = base[sp++] <  reg; NEXT
+    OP(GT)   reg = base[sp++] >  reg; NEXT
+    OP(LE)   reg = base[sp++] <= reg; NEXT
+    OP(GE)   reg = base[sp++] >= reg; NEXT
+    OP(SHL)  reg = base[sp++] << reg; NEXT
+    OP(SHR)  reg = base[sp++] >> reg; NEXT
+    OP(ADD)  reg = base[sp++] +  reg; NEXT
+    OP(SUB)  reg = base[sp++] -  reg; NEXT
+    OP(MUL)  reg = base[sp++] *  reg; NEXT
+    OP(DIV)  reg = base[sp++] /  reg; NEXT
+    OP(MOD)  reg = base[sp++] %  reg; NEXT
+    OP(FADD) memcpy(&f1,&reg,8); memcpy(&f2,&base[sp++],8); f1 = f2 + f1; memcpy(&reg,&f1,8); NEXT
+    OP(FSUB) memcpy(&f1,&reg,8); memcpy(&f2,&base[sp++],8); f1 = f2 - f1; memcpy(&reg,&f1,8); NEXT
+    OP(FMUL) memcpy(&f1,&reg,8); memcpy(&f2,&base[sp++],8); f1 = f2 * f1; memcpy(&reg,&f1,8); NEXT
+    OP(FDIV) memcpy(&f1,&reg,8); memcpy(&f2,&base[sp++],8); f1 = f2 / f1; memcpy(&reg,&f1,8); NEXT
+    OP(I2F)  f1 = (double)reg; memcpy(&reg,&f1,8); NEXT
+    OP(F2I)  memcpy(&f1,&reg,8); reg = (long long)f1; NEXT
+    OP(JREG) pc = reg >> 3; NEXT
+    OP(JSRR) base[--sp] = pc + 1; pc = reg >> 3; NEXT
+    OP(NOT)  reg = ~reg; NEXT
+    OP(LLI)  reg = *(long long*)((char*)base + 8 * bp + base[pc++]); NEXT
+    OP(LLC)  reg = ((char*)base)[8 * bp + base[pc++]]; NEXT
+    OP(GLI)  reg = *(long long*)((char*)base + base[pc++]); NEXT
+    OP(GLC)  reg = ((char*)base)[base[pc++]]; NEXT
+    OP(SLI)  *(long long*)((char*)base + 8 * bp + base[pc++]) = reg; NEXT
+    OP(SLC)  *((char*)base + 8 * bp + base[pc++]) = reg; NEXT
+    OP(SGI)  *(long long*)((char*)base + base[pc++]) = reg; NEXT
+    OP(SGC)  *((char*)base + base[pc++]) = reg; NEXT
+    OP(ADDI) reg = reg + base[pc++]; NEXT
+    OP(SUBI) reg = reg - base[pc++]; NEXT
+    OP(MULI) reg = reg * base[pc++]; NEXT
+    OP(EQBZ) reg = base[sp++] == reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(NEBZ) reg = base[sp++] != reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(LTBZ) reg = base[sp++] <  reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(GTBZ) reg = base[sp++] >  reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(LEBZ) reg = base[sp++] <= reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(GEBZ) reg = base[sp++] >= reg; pc = reg ? pc + 1 : target[pc]; NEXT
+    OP(EXIT)
 #ifdef C4VM_DEBUG
-            printf("unknown instruction = %lld!\n",opcode);
+        printf("program exited with %lld\n",base[sp]);
 #endif
-        }
-        
-        // FOR DEBUG
-        // printf("vm->sp = %lld (%lld,%lld,%lld) , ",vm->sp,vm->base[vm->sp],vm->base[vm->sp+1],vm->base[vm->sp+2]);
-        // printf("vm->pc = %lld (%lld,%lld,%lld)",vm->pc,vm->base[vm->pc],vm->base[vm->pc+1],vm->base[vm->pc+2]);
-        // getchar();
+#ifdef C4VM_COUNT
+        fprintf(stderr,"executed %lld instructions\n",executed);
+#endif
+        free(target);
+#ifdef C4VM_THREADED
+        free(code);
+#endif
+        return base[sp];
+#ifdef C4VM_THREADED
+    L_NATIVE:
+#else
+    default:
+#endif
+        vm->pc  = pc;
+        vm->sp  = sp;
+        vm->bp  = bp;
+        vm->reg = reg;
+        native(vm,base[pc - 1]);
+        reg = vm->reg;
+        NEXT
+#ifndef C4VM_THREADED
     }
+#endif
+}
+#endif
+
+// run_fast where the build has it , the if / else chain in run otherwise
+long long execute(struct c4vm* vm) {
+#ifdef C4VM_FAST
+    return run_fast(vm);
+#else
+    return run(vm);
+#endif
 }
 
 long long load_mem(long long* base,long long space) {
     struct c4vm vm = {
-        .bp   = space / sizeof(long long),
-        .sp   = space / sizeof(long long),
-        .pc   = 0,
-        .reg  = 0,
-        .base = base,
+        .bp     = space / sizeof(long long),
+        .sp     = space / sizeof(long long),
+        .pc     = 0,
+        .reg    = 0,
+        .base   = base,
+        .loaded = space / sizeof(long long),
+        .bss_start = 0,
+        .bss_end   = 0,
     };
 
     long long exit_addr = (vm.sp - 2) * 8;
@@ -277,32 +553,188 @@ long long load_mem(long long* base,long long space) {
     vm.base[--vm.sp] = PSH;
     vm.base[--vm.sp] = exit_addr;
     
-    return run(&vm);
+    return execute(&vm);
 }
 
-long long load(char* filename) {
-    long long fd = open(filename,O_RDONLY);
-    if (fd == -1) {
-        printf("load failed");
+// image formats , see packer.py. plain images are the virtual size then
+// the raw image. v1 images add a bss run left out of the file , v2 images
+// have a header page with the entry point and a section table
+#define IMAGE_V1 0x16d763463
+#define IMAGE_V2 0x26d763463
+
+#define SECTION_BSS   4
+#define SECTION_STACK 5
+
+struct image {
+    long long* base;
+    long long  space; // bytes of memory
+    long long  end;   // end of the part loaded from the file
+    long long  entry;
+    long long  bss_start,bss_end; // bytes
+};
+
+long long read_word(long long fd) {
+    long long word = 0;
+    if (read(fd, &word, sizeof(long long)) != sizeof(long long)) {
+        printf("Read header failed\n");
         exit(1);
     }
+    return word;
+}
 
-    long long size = 0;
-    if (read(fd, &size, sizeof(long long)) != sizeof(long long)) {
-        printf("Read size failed\n");
+long long* alloc_memory(long long size) {
+#ifdef C4VM_MMAP
+    // anonymous pages are zero and only touched ones are backed
+    void* mem = mmap(0, size, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+    if (mem == MAP_FAILED) {
+        printf("Mmap failed\n");
         exit(1);
     }
-    
+    return mem;
+#else
     long long* base = malloc(size);
     if (!base) {
         printf("Malloc failed\n");
         exit(1);
     }
+    return base;
+#endif
+}
+
+// clear a run of memory from alloc_memory , anonymous pages already are
+void zero_memory(void* mem,long long size) {
+#ifndef C4VM_MMAP
+    memset(mem,0,size);
+#endif
+}
+
+void read_v2(long long fd,struct image* img) {
+    img->space = read_word(fd);
+    img->entry = read_word(fd);
+    long long count = read_word(fd);
+    read_word(fd); // symbol table offset and count , only for tools
+    read_word(fd);
+
+    long long* table = malloc(count * 4 * sizeof(long long));
+    long long  pos   = 6 * sizeof(long long) + count * 4 * sizeof(long long);
+    if (read(fd, table, count * 4 * sizeof(long long)) != count * 4 * sizeof(long long)) {
+        printf("Read sections failed\n");
+        exit(1);
+    }
 
-    read(fd,base,size);
+    img->base = alloc_memory(img->space);
+    img->end  = 0;
+    for (long long i = 0; i < count; i++) {
+        if (table[4 * i] == SECTION_BSS) {
+            img->bss_start = table[4 * i + 1];
+            img->bss_end   = table[4 * i + 1] + table[4 * i + 2];
+        }
+    }
+    long long mapped = 0;
+#ifdef C4VM_MMAP
+    // map the file backed sections in place when the file is laid out for
+    // this page size , pages shared by two sections map the same file bytes
+    long long page = sysconf(_SC_PAGESIZE);
+    mapped = 1;
+    for (long long i = 0; i < count; i++) {
+        if (table[4 * i + 3] && (table[4 * i + 3] - table[4 * i + 1]) % page) mapped = 0;
+    }
+    for (long long i = 0; mapped && i < count; i++) {
+        long long addr = table[4 * i + 1];
+        long long size = table[4 * i + 2];
+        long long off  = table[4 * i + 3];
+        if (off == 0 || size == 0) continue;
+        long long skip = addr % page;
+        if (mmap((char*)img->base + addr - skip, size + skip, PROT_READ | PROT_WRITE,
+                 MAP_PRIVATE | MAP_FIXED, fd, off - skip) == MAP_FAILED) {
+            printf("Mmap failed\n");
+            exit(1);
+        }
+        img->end = addr + size;
+    }
+#endif
+    if (!mapped) {
+        // sections are stored in address order , padding is read past
+        char* scratch = malloc(4096);
+        for (long long i = 0; i < count; i++) {
+            long long addr = table[4 * i + 1];
+            long long size = table[4 * i + 2];
+            long long off  = table[4 * i + 3];
+            if (off == 0) {
+                if (table[4 * i] == SECTION_BSS) zero_memory((char*)img->base + addr,size);
+                continue;
+            }
+            while (pos < off) {
+                long long n = off - pos < 4096 ? off - pos : 4096;
+                pos = pos + read(fd,scratch,n);
+            }
+            if (read(fd,(char*)img->base + addr,size) != size) {
+                printf("Read section failed\n");
+                exit(1);
+            }
+            pos = pos + size;
+            img->end = addr + size;
+        }
+        free(scratch);
+    }
+    free(table);
+}
+
+void read_image(char* filename,struct image* img) {
+    long long fd = open(filename,O_RDONLY);
+    if (fd == -1) {
+        printf("load failed");
+        exit(1);
+    }
+
+    long long size = read_word(fd);
+    img->entry     = 0;
+    img->bss_start = 0;
+    img->bss_end   = 0;
+    // a newer image read by an older vm would be taken for a plain image
+    // of absurd size , so the versions this one does not know are refused
+    if ((size & 0xFFFFFFFF) == (IMAGE_V1 & 0xFFFFFFFF) && size != IMAGE_V1 && size != IMAGE_V2) {
+        printf("%s: unknown image version %lld\n",filename,size >> 32);
+        exit(1);
+    }
+    if (size <= 0) {
+        printf("%s: not an image\n",filename);
+        exit(1);
+    }
+    if (size == IMAGE_V2) {
+        read_v2(fd,img);
+        close(fd);
+        return;
+    }
+
+    long long bss_start = 0;
+    long long bss_size  = 0;
+    if (size == IMAGE_V1) {
+        size      = read_word(fd);
+        bss_start = read_word(fd);
+        bss_size  = read_word(fd);
+        img->bss_start = bss_start;
+        img->bss_end   = bss_start + bss_size;
+    }
+    
+    long long* base = alloc_memory(size);
+    if (bss_size) {
+        read(fd,base,bss_start);
+        zero_memory((char*)base + bss_start,bss_size);
+        img->end = bss_start + bss_size + read(fd,(char*)base + bss_start + bss_size,size - bss_start - bss_size);
+    } else {
+        img->end = read(fd,base,size);
+    }
     close(fd);
 
-    return load_mem(base,size);
+    img->base  = base;
+    img->space = size;
+}
+
+long long load(char* filename) {
+    struct image img;
+    read_image(filename,&img);
+    return load_mem(img.base,img.space);
 }
 
 void make(long long* base,long long size,long long space,char* filename) {
@@ -329,33 +761,20 @@ void make(long long* base,long long size,long long space,char* filename) {
 }
 
 long long load_with_args(char* filename,long long argc,char** argv) {
-    long long fd = open(filename,O_RDONLY);
-    if (fd == -1) {
-        printf("load failed");
-        exit(1);
-    }
-
-    long long size = 0;
-    if (read(fd, &size, sizeof(long long)) != sizeof(long long)) {
-        printf("Read size failed\n");
-        exit(1);
-    }
-    
-    long long* base = malloc(size);
-    if (!base) {
-        printf("Malloc failed\n");
-        exit(1);
-    }
-
-    read(fd,base,size);
-    close(fd);
+    struct image img;
+    read_image(filename,&img);
+    long long* base = img.base;
+    long long  size = img.space;
 
     struct c4vm vm = {
-        .bp   = size / sizeof(long long),
-        .sp   = size / sizeof(long long),
-        .pc   = 0,
-        .reg  = 0,
-        .base = base,
+        .bp     = size / sizeof(long long),
+        .sp     = size / sizeof(long long),
+        .pc     = img.entry / 8,
+        .reg    = 0,
+        .base   = base,
+        .loaded = img.end / sizeof(long long),
+        .bss_start = (img.bss_start + 7) / 8, // words wholly inside the bss
+        .bss_end   = img.bss_end / 8,
     };
 
     long long exit_addr = (vm.sp - 2) * 8;
@@ -369,7 +788,7 @@ long long load_with_args(char* filename,long long argc,char** argv) {
     vm.base[--vm.sp] = argv_virt;
     vm.base[--vm.sp] = exit_addr;
 
-    return run(&vm);
+    return execute(&vm);
 }
 
 int main(int argc,char** argv) {
@@ -0,0 +1,89 @@
+'''
+thin client of the compile server (server.py). only the standard library
+is imported so a request costs little more than interpreter startup.
+
+    client.py [source] [target] [--socket path]
+
+messages both ways are a json header and a payload , each preceded by
+its length as a little endian qword
+'''
+
+import os
+import sys
+import json
+import socket
+
+def default_socket() -> str:
+    return os.environ.get("C4_SOCKET",os.path.join("/tmp","c4-compile-{0}.sock".format(os.getuid())))
+
+def recv_exact(sock: socket.socket,size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+def send_message(sock: socket.socket,header: dict,payload: bytes = b''):
+    encoded = json.dumps(header).encode()
+    sock.sendall(b''.join((len(encoded).to_bytes(8,'little'),encoded,len(payload).to_bytes(8,'little'),payload)))
+
+def recv_message(sock: socket.socket) -> tuple:
+    '''(header,payload)'''
+    header  = json.loads(recv_exact(sock,int.from_bytes(recv_exact(sock,8),'little')))
+    payload = recv_exact(sock,int.from_bytes(recv_exact(sock,8),'little'))
+    return header , payload
+
+def request(header: dict,payload: bytes = b'',path: str = None) -> tuple:
+    '''one request on a fresh connection , (header,payload) of the reply'''
+    with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+        sock.connect(path or default_socket())
+        send_message(sock,header,payload)
+        return recv_message(sock)
+
+def compile_path(source_path: str,path: str = None) -> tuple:
+    return request({"op": "compile","path": os.path.abspath(source_path)},path=path)
+
+def compile_source(src: str,name: str = "<memory>",path: str = None) -> tuple:
+    return request({"op": "compile","name": name},src.encode(),path)
+
+def show_help():
+    print("client.py [source] [target] [--socket path]")
+    print("    compiles through a running server.py , same defaults as compiler.py")
+    print("client.py --stats | --shutdown [--socket path]")
+
+if __name__ == '__main__':
+    source = "hi.c"
+    target = "out.vm"
+    path   = None
+
+    args = sys.argv[1:]
+    if "--socket" in args:
+        idx = args.index("--socket")
+        if idx + 1 >= len(args):
+            show_help()
+            sys.exit(1)
+        path = args[idx + 1]
+        del args[idx:idx + 2]
+
+    if len(sys.argv) == 1:
+        show_help()
+        sys.exit(0)
+    if args and args[0] in ["--stats","--shutdown"]:
+        header , _ = request({"op": args[0][2:]},path=path)
+        print(json.dumps(header,indent=2))
+        sys.exit(0)
+    if len(args) >= 1:
+        source = args[0]
+    if len(args) >= 2:
+        target = args[1]
+
+    header , image = compile_path(source,path)
+    if header["diagnostics"]:
+        sys.stderr.write(header["diagnostics"])
+    if not header["ok"]:
+        sys.exit(1)
+    with open(target,'wb') as f:
+        f.write(image)
+    print("compiled successfully!")
@@ -1,4 +1,5 @@
 import struct
+from array import array
 from common import *
 from parser import SymTable
 
@@ -6,10 +7,37 @@ opcode_text = '''
 NOP ,LEA ,IMM ,JMP ,JSR ,BZ  ,BNZ ,ENT ,ADJ ,LEV ,LI  ,LC  ,SI  ,SC  ,PSH ,
 OR  ,XOR ,AND ,EQ  ,NE  ,LT  ,GT  ,LE  ,GE  ,SHL ,SHR ,ADD ,SUB ,MUL ,DIV ,MOD ,
 FADD,FSUB,FMUL,FDIV,I2F ,F2I ,JREG,JSRR,NOT ,WRIT,GETC,
-OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF
+OPEN,READ,CLOS,PRTF,MALC,FREE,MSET,MCPY,MCMP,EXIT,SCMP,SLEN,SSTR,SCAT,SCNF,
+LLI ,LLC ,GLI ,GLC ,SLI ,SLC ,SGI ,SGC ,ADDI,SUBI,MULI,
+EQBZ,NEBZ,LTBZ,GTBZ,LEBZ,GEBZ
 '''
 
 opcode = {v.strip() : i for i,v in enumerate(opcode_text.split(','))}
+rev_opcode = {v: k for k, v in opcode.items()}
+
+# opcodes followed by an operand word
+operand_ops = {
+    "LEA","IMM","JMP","JSR","BZ","BNZ","ENT","ADJ",
+    "LLI","LLC","GLI","GLC","SLI","SLC","SGI","SGC","ADDI","SUBI","MULI",
+    "EQBZ","NEBZ","LTBZ","GTBZ","LEBZ","GEBZ"
+}
+
+# opcodes whose operand is a position in the image
+address_ops = {
+    "JMP","JSR","BZ","BNZ","EQBZ","NEBZ","LTBZ","GTBZ","LEBZ","GEBZ",
+    "GLI","GLC","SGI","SGC"
+}
+
+# (section , store) of an assignment to a plain variable : fused store
+fused_stores = {
+    ("stack","SI") : "SLI",
+    ("stack","SC") : "SLC",
+    ("image","SI") : "SGI",
+    ("image","SC") : "SGC",
+}
+
+# per node debug logging , looked up once per entry instead of per node
+trace = False
 
 class Image:
     def __init__(self):
@@ -23,6 +51,154 @@ class Image:
     def __len__(self):
         return len(self.block)
 
+class Label:
+    '''a code position , words referring to it are patched once it is bound'''
+    __slots__ = ("pos","fixups")
+
+    def __init__(self):
+        self.pos    = None
+        self.fixups = [] # positions of words waiting for pos
+
+class Emitter:
+    '''
+    wraps the Image : bytes laid out by the allocators and the literal
+    pool stay in image.block , code words go to text (an array of int64)
+    from the first emit on , which starts 8 aligned at text_base.
+    extend / __len__ keep the Image interface over both parts and
+    tobytes joins them once at the end.
+    code_refs are the block positions of words holding a code position
+    (the _main and function slots) so passes moving code can fix them.
+    fused lets codegen select superinstructions , bss and rodata are the
+    (start,size) runs of zero-initialised globals and of the literal pool.
+    addr_refs are the positions of the other words holding an image
+    position (IMM operands , initialised pointers) for object_entry
+    '''
+    def __init__(self,image: Image,fused: bool = False):
+        self.image     = image
+        self.block     = image.block
+        self.text      = array('q')
+        self.text_base = None
+        self.code_refs = []
+        self.addr_refs = []
+        self.fused     = fused
+        self.bss       = (0,0)
+        self.rodata    = (0,0)
+
+    def __len__(self):
+        if self.text_base is None:
+            return len(self.block)
+        return self.text_base + 8 * len(self.text)
+
+    def here(self) -> int:
+        return len(self)
+
+    def extend(self,bs):
+        if self.text_base is None:
+            return self.image.extend(bs)
+        start = len(self)
+        if len(bs) % 8 == 0:
+            self.text.frombytes(bs)
+        else:
+            # unaligned data after code , fold the words back into bytes
+            self.flush()
+            self.block.extend(bs)
+        return start
+
+    def flush(self):
+        self.block.extend(self.text.tobytes())
+        self.text      = array('q')
+        self.text_base = None
+
+    def emit(self,op: str,operand = None) -> int:
+        '''
+        append op and its operand word (int , float or Label) ,
+        returns the position of op
+        '''
+        if self.text_base is None:
+            self.text_base = len(self.block)
+        text  = self.text
+        start = self.text_base + 8 * len(text)
+        text.append(opcode[op])
+        if operand is not None:
+            if type(operand) == Label:
+                self.emit_label(operand)
+            elif type(operand) == float:
+                text.frombytes(f64(operand))
+            else:
+                text.append(operand)
+        return start
+
+    def emit_addr(self,op: str,pos: int) -> int:
+        '''emit op with the image position pos as operand , see addr_refs'''
+        start = self.emit(op,pos)
+        self.addr_refs.append(start + 8)
+        return start
+
+    def emit_label(self,label: Label) -> int:
+        '''append a word holding label's position , patched later if unbound'''
+        if self.text_base is None:
+            self.text_base = len(self.block)
+        pos = self.text_base + 8 * len(self.text)
+        if label.pos is None:
+            label.fixups.append(pos)
+            self.text.append(0)
+        else:
+            self.text.append(label.pos)
+        return pos
+
+    def bind(self,label: Label,pos: int = None):
+        '''bind label to pos (default here) and patch every word waiting for it'''
+        label.pos = len(self) if pos is None else pos
+        for fixup in label.fixups:
+            self.patch(fixup,label.pos)
+        label.fixups.clear()
+
+    def refer(self,pos: int,target: int):
+        '''patch the word at pos with code position target and remember it'''
+        self.patch(pos,target)
+        self.code_refs.append(pos)
+
+    def patch(self,pos: int,value: int):
+        if self.text_base is not None and pos >= self.text_base:
+            self.text[(pos - self.text_base) >> 3] = value
+        else:
+            self.block[pos:pos + 8] = i64(value)
+
+    def tobytes(self) -> bytearray:
+        if self.text_base is not None:
+            self.flush()
+        return self.block
+
+class RawImage(bytearray):
+    '''
+    the bytes returned by entry with their layout for packer.packer :
+    bss and rodata as in Emitter , text from the end of rodata on ,
+    symbols maps global names to (kind,position) , see packer
+    '''
+    bss     = (0,0)
+    rodata  = (0,0)
+    symbols = {}
+
+class ObjectFile:
+    '''
+    a relocatable translation unit , see object_entry and linker.
+    block is laid out as [_main slot , bss , data , rodata , text] ,
+    the sections are (start,size) runs of it.
+    relocs are the positions of words holding a position in block ,
+    symbols maps the globals defined here to (kind,start,size) where a
+    func is its slot , imports maps the functions called but not
+    defined here to their slot
+    '''
+    def __init__(self,block: bytearray):
+        self.block   = block
+        self.bss     = (0,0)
+        self.data    = (0,0)
+        self.rodata  = (0,0)
+        self.text    = (0,0)
+        self.relocs  = []
+        self.symbols = {}
+        self.imports = {}
+
 class LiteralPool:
     def __init__(self,image: Image):
         self.image  = image
@@ -93,60 +269,109 @@ class Allocator:
 
 @dataclass
 class FlowContext:
-    break_pos_lst     : list[int]
-    continue_pos_lst  : list[int]
+    break_label       : Label
+    continue_label    : Label
 
 @dataclass
 class CodegenContext:
-    image       : Image
+    image       : Emitter
     literalpool : LiteralPool
     allocator   : Allocator
     symtable    : SymTable
     flowCtx     : FlowContext
+    types       : "TypeTable"
+
+def generate(astroot: ASTNode,fused: bool) -> CodegenContext:
+    global trace
+    trace = log.isEnabledFor(logging.DEBUG)
 
-def entry(astroot: ASTNode) -> bytes:
-    image = Image()
+    image = Emitter(Image(),fused)
     literalpool  = LiteralPool(image)
     allocbackend = AllocBackend("image",image)
     allocator    = Allocator(father=None,backend=allocbackend)
     symtable     = astroot.metas[0]
 
-    ctx = CodegenContext(image,literalpool,allocator,symtable,None)
+    ctx = CodegenContext(image,literalpool,allocator,symtable,None,TypeTable())
 
+    annotate(ctx,astroot)
     program(ctx,astroot)
-    disasm(ctx.image.block)
-
-    return ctx.image.block
-
-def disasm(image: bytearray):
-    rev_opcode = {v: k for k, v in opcode.items()}
-    
-    print(f"{'Addr':<6} | {'Opcode':<8} | {'Value (Dec)':<24} | {'Hex':<24} | {'Raw Bytes'}")
-    print("-" * 84)
-
-    for idx in range(0, len(image), 8):
-        bs = image[idx:idx+8]
-        decimal = int.from_bytes(bs, 'little', signed=True)
-        hex_val = f"0x{int.from_bytes(bs, 'little', signed=False):x}"
-        
-        op_name = rev_opcode.get(decimal, "")
-        ascii_repr = "".join(chr(b) if 32 <= b <= 126 else "." for b in bs)
-
-        if op_name:
-            display_op = f"[{op_name}]"
-        else:
-            display_op = f"(data)"
-
-        print(f"{idx:<6} | {display_op:<8} | {decimal:<24} | {hex_val:<24} | {ascii_repr}")
+    return ctx
+
+def entry(astroot: ASTNode,passes: tuple = (),fused: bool = False) -> bytes:
+    '''
+    passes are called on the Emitter once all code is generated ,
+    fused selects the fused stores (see peephole.fused_patterns for the rest)
+    '''
+    ctx = generate(astroot,fused)
+    for bytecode_pass in passes:
+        bytecode_pass(ctx.image)
+    block = RawImage(ctx.image.tobytes())
+    block.bss     = ctx.image.bss
+    block.rodata  = ctx.image.rodata
+    block.symbols = image_symbols(ctx,block)
+
+    return block
+
+def object_entry(astroot: ASTNode,passes: tuple = (),fused: bool = False) -> ObjectFile:
+    '''the unit as an ObjectFile , passes and fused as in entry'''
+    ctx = generate(astroot,fused)
+    for bytecode_pass in passes:
+        bytecode_pass(ctx.image)
+    obj = ObjectFile(ctx.image.tobytes())
+    bss_start , bss_size = ctx.image.bss
+    rodata_start , rodata_size = ctx.image.rodata
+    obj.bss    = ctx.image.bss
+    obj.data   = (bss_start + bss_size,rodata_start - bss_start - bss_size)
+    obj.rodata = ctx.image.rodata
+    obj.text   = (rodata_start + rodata_size,len(obj.block) - rodata_start - rodata_size)
+
+    # branch targets and global operands , then the words codegen noted
+    relocs = set(ctx.image.code_refs) | set(ctx.image.addr_refs)
+    pos , end = obj.text[0] , obj.text[0] + obj.text[1]
+    while pos < end:
+        op = rev_opcode[int.from_bytes(obj.block[pos:pos + 8],'little',signed=True)]
+        if op in address_ops:
+            relocs.add(pos + 8)
+        pos += 16 if op in operand_ops else 8
+    relocs.discard(8) # the _main slot is rebuilt by the linker
+    obj.relocs = sorted(relocs)
+
+    referenced = [int.from_bytes(obj.block[pos:pos + 8],'little',signed=True) for pos in obj.relocs]
+    for sym , (section , pos) in ctx.allocator.symmap.items():
+        symItem = ctx.symtable.get((sym,))
+        if section != "image" or symItem is None or symItem[0] != "var":
+            continue
+        if type(symItem[1].oftype) != C_Func:
+            obj.symbols[sym] = ("object",pos,type_size(symItem[1].oftype))
+        elif pos + 8 in ctx.image.code_refs:
+            obj.symbols[sym] = ("func",pos,16)
+        elif any(pos <= target < pos + 16 for target in referenced):
+            obj.imports[sym] = pos # unused prototypes are left out
+    return obj
 
 def program(ctx : CodegenContext,astnode : ASTNode):
     program_symtab_init(ctx,astnode) # alloc static space for variables
+    rodata_start = len(ctx.image)
     poolinit(ctx,astnode)            # init strings to literal pool
     static_init(ctx,astnode)         # fill in init data for static vars
+    ctx.image.rodata = (rodata_start,ctx.allocator.backend.align(8) - rodata_start)
     codegen_functions(ctx,astnode)
 
-    print('allocator.symmap  : ',ctx.allocator.symmap)
-    print('literalpool.mapper: ',ctx.literalpool.mapper)
+    log.debug('allocator.symmap  : %s',ctx.allocator.symmap)
+    log.debug('literalpool.mapper: %s',ctx.literalpool.mapper)
+
+def image_symbols(ctx : CodegenContext,block : bytearray) -> dict:
+    '''globals to (kind,position) , functions at their ENT'''
+    symbols = {}
+    for sym , (section , pos) in ctx.allocator.symmap.items():
+        symItem = ctx.symtable.get((sym,))
+        if section != "image" or symItem is None or symItem[0] != "var":
+            continue
+        if type(symItem[1].oftype) == C_Func:
+            symbols[sym] = ("func",int.from_bytes(block[pos + 8:pos + 16],'little',signed=True))
+        else:
+            symbols[sym] = ("object",pos)
+    return symbols
 
 def codegen_functions(ctx: CodegenContext, astroot : ASTNode):
     for astnode in astroot.children:
@@ -161,15 +386,13 @@ def codegen_function(ctx : CodegenContext, astnode : ASTNode):
     # align .text with 8 bytes
     ctx.allocator.backend.align(8) # at this point , allocator is still an image allocator
 
-    ent_pos = ctx.image.extend(
-        i64(opcode["ENT"]) + i64(0)
-    )
+    ent_pos = ctx.image.emit("ENT",0)
     var_at, var_pos = ctx.allocator.get(function_name) # var_at could only be "image" here
-    ctx.image.block[var_pos + 8:var_pos + 16] = i64(ent_pos)
+    ctx.image.refer(var_pos + 8,ent_pos)
 
     # fill in _main if function is main
     if function_name == "main":
-        ctx.image.block[8:16] = i64(ent_pos)
+        ctx.image.refer(8,ent_pos)
 
     # function scope start
     new_allocator = Allocator(ctx.allocator,AllocBackend("stack"))
@@ -183,20 +406,20 @@ def codegen_function(ctx : CodegenContext, astnode : ASTNode):
         new_allocator.symmap[arg_name] = ("stack",8 * (arg_count - 1 - idx) + 16)
 
     ctx = CodegenContext(
-        ctx.image,ctx.literalpool,new_allocator,func_symtable,ctx.flowCtx
+        ctx.image,ctx.literalpool,new_allocator,func_symtable,ctx.flowCtx,ctx.types
     )
     codegen_actions(ctx,astnode.children[0])
 
     # fill in ENT for stack allocation
     ctx.allocator.backend.align(8)
-    ctx.image.block[ent_pos + 8:ent_pos + 16] = i64(-ctx.allocator.backend.end() // 8)
-    ctx.image.extend(i64(opcode["LEV"])) # auto return for lazy guys 
+    ctx.image.patch(ent_pos + 8,-ctx.allocator.backend.end() // 8)
+    ctx.image.emit("LEV") # auto return for lazy guys 
 
 def codegen_actions(ctx : CodegenContext, astnode : ASTNode):
     symtable : SymTable = astnode.metas[0]
     new_allocator       = Allocator(ctx.allocator,ctx.allocator.backend)
     ctx = CodegenContext(
-        ctx.image,ctx.literalpool,new_allocator,symtable,ctx.flowCtx
+        ctx.image,ctx.literalpool,new_allocator,symtable,ctx.flowCtx,ctx.types
     )
     
     # build symbol table for scope
@@ -228,821 +451,1004 @@ def codegen_builtin_funcs(ctx : CodegenContext, astnode: ASTNode):
     func_name = func_ast.metas[0]
     
     opcode_name = builtin_funcs[func_name]
-    ctx.image.extend(
-        i64(opcode[opcode_name]) \
-        + i64(opcode['ADJ']) \
-        + i64(args_cnt)
-    )
+    ctx.image.emit(opcode_name)
+    ctx.image.emit("ADJ",args_cnt)
 
 def unpack_C_Var(x: C_Var):
     if type(x) == C_Var:
         return x.oftype
     return x
 
+class TypeTable:
+    '''
+    resolved C type of every expression node , filled once by annotate.
+    ASTNodes are keyed by id (the tree outlives codegen) , ASTViews by
+    themselves
+    '''
+    def __init__(self):
+        self.mapper = {}
+
+    @staticmethod
+    def key(astnode):
+        return astnode if type(astnode) == ASTView else id(astnode)
+
+# nodes that never have a type , annotate only walks through them
+untyped_nodes = {
+    "program","function","actions","if","ifelse","while","for",
+    "do_while","ret","break","continue","init_assign","initlist"
+}
+
+def annotate(ctx: CodegenContext,astroot : ASTNode):
+    '''
+    type pass run once before codegen : every expression node gets its
+    type in ctx.types , resolved in the scope codegen will see it in
+    '''
+    def visit(node : ASTNode,symtable : SymTable):
+        if node is None:
+            return
+        if node.nodeType == "function":
+            symtable = node.metas[2]
+        elif node.nodeType == "actions" or node.nodeType == "program":
+            symtable = node.metas[0]
+        for child in node.children:
+            visit(child,symtable)
+        if node.nodeType in untyped_nodes:
+            return
+        ast_type(scope_ctx(symtable),node) # untypable nodes get None
+
+    contexts = {}
+    def scope_ctx(symtable : SymTable) -> CodegenContext:
+        if id(symtable) not in contexts:
+            contexts[id(symtable)] = CodegenContext(
+                ctx.image,ctx.literalpool,ctx.allocator,symtable,ctx.flowCtx,ctx.types
+            )
+        return contexts[id(symtable)]
+
+    visit(astroot,ctx.symtable)
+
 def ast_type(ctx: CodegenContext,astnode : ASTNode):
-    '''None for unknown'''
-    print('ast_type',astnode)
-
-    if astnode.nodeType == "call":
-        func_ast : ASTNode = astnode.children[0]
-        if func_ast.nodeType == "var":
-            func_name = func_ast.metas[0]
-            
-            symtuple = ctx.symtable.get((func_name,))
-            if symtuple is None: 
-                # for built-in functions
-                return C_Basetype("long long") # conventionally , built-in functions return long long
-            else:
-                _ , func_type = symtuple
-                func_type : C_Func
-                ret_type = func_type.rettype
-                return ret_type
+    '''None for unknown , memoised in ctx.types'''
+    mapper = ctx.types.mapper
+    key    = TypeTable.key(astnode)
+    if key in mapper:
+        return mapper[key]
+    result = mapper[key] = infer_type(ctx,astnode)
+    return result
+
+def infer_type(ctx: CodegenContext,astnode : ASTNode):
+    if trace:
+        log.debug('ast_type %s',astnode)
+    handler = type_handlers.get(astnode.nodeType)
+    if handler is not None:
+        return handler(ctx,astnode)
+
+# ast_type handlers , one per nodeType , None for unknown nodes
+
+def type_call(ctx: CodegenContext,astnode : ASTNode):
+    func_ast : ASTNode = astnode.children[0]
+    if func_ast.nodeType == "var":
+        func_name = func_ast.metas[0]
+
+        symtuple = ctx.symtable.get((func_name,))
+        if symtuple is None: 
+            # for built-in functions
+            return C_Basetype("long long") # conventionally , built-in functions return long long
         else:
-            return None
-    elif astnode.nodeType == "var":
-        var_name = astnode.metas[0]
-        var_type_type , var_type = ctx.symtable.get((var_name,))
-        return var_type
-    # basic types
-    elif astnode.nodeType == "integer":
-        return C_Basetype("long long")
-    elif astnode.nodeType == "float":
+            _ , func_type = symtuple
+            func_type : C_Func = unpack_C_Var(func_type) # symbols are held as C_Var
+            ret_type = func_type.rettype
+            return ret_type
+    else:
+        return None
+
+def type_var(ctx: CodegenContext,astnode : ASTNode):
+    var_name = astnode.metas[0]
+    symtuple = ctx.symtable.get((var_name,))
+    if symtuple is None: # built-in functions
+        return None
+    var_type_type , var_type = symtuple
+    return var_type
+
+# basic types
+def type_integer(ctx: CodegenContext,astnode : ASTNode):
+    return C_Basetype("long long")
+
+def type_float(ctx: CodegenContext,astnode : ASTNode):
+    return C_Basetype("double")
+
+def type_string(ctx: CodegenContext,astnode : ASTNode):
+    return C_Array(C_Basetype("char"),(len(astnode.metas[0]) + 1,))
+
+def type_unary(ctx: CodegenContext,astnode : ASTNode):
+    return ast_type(ctx,astnode.children[0])
+
+def type_integral(ctx: CodegenContext,astnode : ASTNode):
+    return C_Basetype("long long")
+
+def type_arith(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    rtype = unpack_C_Var(ast_type(ctx,rhs))
+
+    if type(ltype) == C_Basetype and ltype.typename in ['float','double']:
         return C_Basetype("double")
-    elif astnode.nodeType == "string":
-        return C_Array(C_Basetype("char"),(len(astnode.metas[0]) + 1,))
-    elif astnode.nodeType in ["incret","decret","retinc","retdec","neg"]:
-        return ast_type(ctx,astnode.children[0])
-    elif astnode.nodeType in ["mod","shl","shr","bitand","bitor",
-                              "bitxor","bitnot""and","or","not"]:
-        return C_Basetype("long long")
-    elif astnode.nodeType in ["add","sub","mul","div"]:
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        rtype = unpack_C_Var(ast_type(ctx,rhs))
-
-        if type(ltype) == C_Basetype and ltype.typename in ['float','double']:
-            return C_Basetype("double")
-        if type(rtype) == C_Basetype and rtype.typename in ['float','double']:
-            return C_Basetype("double")
-        return C_Basetype("long long")
-    elif astnode.nodeType == "assign":
-        lhs = astnode.children[0]
-        return ast_type(ctx,lhs)
-    elif astnode.nodeType == "comma":
-        rhs = astnode.children[1]
-        return ast_type(ctx,rhs)
-    elif astnode.nodeType == "sizeof":
-        return C_Basetype("long long")
-    elif astnode.nodeType == "attr":
-        lhs = astnode.children[0]
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        field_name = astnode.metas[0]
-        field_offset, field_type = struct_offset(ltype,field_name)
-        return field_type
-    elif astnode.nodeType == "ptr_attr":
-        lhs = astnode.children[0]
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        if type(ltype) == C_Pointer:
-            ltype = ltype.oftype
-        field_name = astnode.metas[0]
-        field_offset, field_type = struct_offset(ltype,field_name)
-        return field_type
-    elif astnode.nodeType == "index":
-        arr_ast = astnode.children[0]
-        idx_ast = astnode.children[1]
-        ltype = unpack_C_Var(ast_type(ctx,arr_ast))
-        if type(ltype) == C_Pointer:
+    if type(rtype) == C_Basetype and rtype.typename in ['float','double']:
+        return C_Basetype("double")
+    return C_Basetype("long long")
+
+def type_assign(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    return ast_type(ctx,lhs)
+
+def type_comma(ctx: CodegenContext,astnode : ASTNode):
+    rhs = astnode.children[1]
+    return ast_type(ctx,rhs)
+
+def type_sizeof(ctx: CodegenContext,astnode : ASTNode):
+    return C_Basetype("long long")
+
+def type_attr(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    field_name = astnode.metas[0]
+    field_offset, field_type = struct_offset(ltype,field_name)
+    return field_type
+
+def type_ptr_attr(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    if type(ltype) == C_Pointer:
+        ltype = ltype.oftype
+    field_name = astnode.metas[0]
+    field_offset, field_type = struct_offset(ltype,field_name)
+    return field_type
+
+def type_index(ctx: CodegenContext,astnode : ASTNode):
+    arr_ast = astnode.children[0]
+    idx_ast = astnode.children[1]
+    ltype = unpack_C_Var(ast_type(ctx,arr_ast))
+    if type(ltype) == C_Pointer:
+        return ltype.oftype
+    elif type(ltype) == C_Array:
+        if len(ltype.dimension) == 1:
             return ltype.oftype
-        elif type(ltype) == C_Array:
-            if len(ltype.dimension) == 1:
-                return ltype.oftype
-            else:
-                return C_Array(ltype.oftype,ltype.dimension[1:])
-    elif astnode.nodeType == "cond":
-        tast  = astnode.children[1]
-        fast  = astnode.children[2]
-        ttype = unpack_C_Var(ast_type(ctx,tast))
-        ftype = unpack_C_Var(ast_type(ctx,fast))
-        if type(ttype) == C_Basetype and ttype.typename in ["float","double"]:
-            return C_Basetype("double")
-        if type(ftype) == C_Basetype and ttype.typename in ["float","double"]:
-            return C_Basetype("double")
-        return ttype
-    elif astnode.nodeType == "as":
-        astype = astnode.metas[0]
-        return astype
-    elif astnode.nodeType == "addr":
-        lhs   = astnode.children[0]
-        etype = unpack_C_Var(ast_type(ctx,lhs))
-        return C_Pointer(etype)
-    elif astnode.nodeType == "deaddr":
-        lhs   = astnode.children[0]
-        etype = unpack_C_Var(ast_type(ctx,lhs))
-        if type(etype) == C_Pointer:
-            return etype.oftype
-        return etype # this should be unreachable!
+        else:
+            return C_Array(ltype.oftype,ltype.dimension[1:])
+
+def type_cond(ctx: CodegenContext,astnode : ASTNode):
+    tast  = astnode.children[1]
+    fast  = astnode.children[2]
+    ttype = unpack_C_Var(ast_type(ctx,tast))
+    ftype = unpack_C_Var(ast_type(ctx,fast))
+    if type(ttype) == C_Basetype and ttype.typename in ["float","double"]:
+        return C_Basetype("double")
+    if type(ftype) == C_Basetype and ftype.typename in ["float","double"]:
+        return C_Basetype("double")
+    return ttype
+
+def type_as(ctx: CodegenContext,astnode : ASTNode):
+    astype = astnode.metas[0]
+    return astype
+
+def type_addr(ctx: CodegenContext,astnode : ASTNode):
+    lhs   = astnode.children[0]
+    etype = unpack_C_Var(ast_type(ctx,lhs))
+    return C_Pointer(etype)
+
+def type_deaddr(ctx: CodegenContext,astnode : ASTNode):
+    lhs   = astnode.children[0]
+    etype = unpack_C_Var(ast_type(ctx,lhs))
+    if type(etype) == C_Pointer:
+        return etype.oftype
+    return etype # this should be unreachable!
+
+type_handlers = {
+    "call"     : type_call,
+    "var"      : type_var,
+    "integer"  : type_integer,
+    "float"    : type_float,
+    "string"   : type_string,
+    "incret"   : type_unary,
+    "decret"   : type_unary,
+    "retinc"   : type_unary,
+    "retdec"   : type_unary,
+    "neg"      : type_unary,
+    "mod"      : type_integral,
+    "shl"      : type_integral,
+    "shr"      : type_integral,
+    "bitand"   : type_integral,
+    "bitor"    : type_integral,
+    "bitxor"   : type_integral,
+    "or"       : type_integral,
+    "not"      : type_integral,
+    "add"      : type_arith,
+    "sub"      : type_arith,
+    "mul"      : type_arith,
+    "div"      : type_arith,
+    "assign"   : type_assign,
+    "comma"    : type_comma,
+    "sizeof"   : type_sizeof,
+    "attr"     : type_attr,
+    "ptr_attr" : type_ptr_attr,
+    "index"    : type_index,
+    "cond"     : type_cond,
+    "as"       : type_as,
+    "addr"     : type_addr,
+    "deaddr"   : type_deaddr,
+}
 
 def solve_addr(ctx: CodegenContext,astnode : ASTNode):
-    if astnode.nodeType == "var":
-        var_name = astnode.metas[0]
-        var_section , var_pos = ctx.allocator.get(var_name)
-        if var_section == "stack":
-            ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-        elif var_section == "image":
-            ctx.image.extend(i64(opcode["IMM"]) + i64(var_pos))
-    elif astnode.nodeType == "index":
-        etype = unpack_C_Var(ast_type(ctx,astnode.children[0]))
-        if etype is None: # if failed when inferencing , use long long 
-            etype = C_Basetype("long long")
-        if type(etype) == C_Pointer:
+    handler = addr_handlers.get(astnode.nodeType)
+    if handler is not None:
+        handler(ctx,astnode)
+
+# solve_addr handlers , each emits the address of its node
+
+def addr_var(ctx: CodegenContext,astnode : ASTNode):
+    var_name = astnode.metas[0]
+    var_section , var_pos = ctx.allocator.get(var_name)
+    if var_section == "stack":
+        ctx.image.emit("LEA",var_pos)
+    elif var_section == "image":
+        ctx.image.emit_addr("IMM",var_pos)
+
+def addr_index(ctx: CodegenContext,astnode : ASTNode):
+    etype = unpack_C_Var(ast_type(ctx,astnode.children[0]))
+    if etype is None: # if failed when inferencing , use long long 
+        etype = C_Basetype("long long")
+    if type(etype) == C_Pointer:
+        childtype = etype.oftype
+    elif type(etype) == C_Array:
+        if len(etype.dimension) == 1:
             childtype = etype.oftype
-        elif type(etype) == C_Array:
-            if len(etype.dimension) == 1:
-                childtype = etype.oftype
-            else:
-                childtype = C_Array(etype.oftype,etype.dimension[1:])
-        childsize = type_size(childtype)
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        solve_addr(ctx,lhs)
-        if type(etype) == C_Pointer:
-            ctx.image.extend(i64(opcode["LI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(childsize))
-        ctx.image.extend(i64(opcode["MUL"]))
-        ctx.image.extend(i64(opcode["ADD"]))
-    elif astnode.nodeType == "deaddr":
-        codegen_action(ctx,astnode.children[0])
-    elif astnode.nodeType == "attr":
-        field_name = astnode.metas[0]
-        lhs = astnode.children[0]
-        solve_addr(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
-        etype = unpack_C_Var(ast_type(ctx,lhs))
-        field_offset , field_type = struct_offset(etype,field_name)
-        ctx.image.extend(i64(opcode["IMM"]) + i64(field_offset))
-        ctx.image.extend(i64(opcode["ADD"]))
-    elif astnode.nodeType == "ptr_attr":
-        field_name = astnode.metas[0]
-        lhs = astnode.children[0]
-        solve_addr(ctx,lhs)
-        ctx.image.extend(i64(opcode["LI"]) + i64(opcode["PSH"]))
-        etype = unpack_C_Var(ast_type(ctx,lhs)).oftype
-        field_offset , field_type = struct_offset(etype,field_name)
-        ctx.image.extend(i64(opcode["IMM"]) + i64(field_offset))
-        ctx.image.extend(i64(opcode["ADD"]))
-    elif astnode.nodeType == "string":
-        literal_str = astnode.metas[0]
-        var_pos = ctx.literalpool.alloc(literal_str) # shall only be on image
-        ctx.image.extend(i64(opcode["IMM"]) + i64(var_pos))
+        else:
+            childtype = C_Array(etype.oftype,etype.dimension[1:])
+    childsize = type_size(childtype)
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    solve_addr(ctx,lhs)
+    if type(etype) == C_Pointer:
+        ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",childsize)
+    ctx.image.emit("MUL")
+    ctx.image.emit("ADD")
+
+def addr_deaddr(ctx: CodegenContext,astnode : ASTNode):
+    codegen_action(ctx,astnode.children[0])
+
+def addr_attr(ctx: CodegenContext,astnode : ASTNode):
+    field_name = astnode.metas[0]
+    lhs = astnode.children[0]
+    solve_addr(ctx,lhs)
+    ctx.image.emit("PSH")
+    etype = unpack_C_Var(ast_type(ctx,lhs))
+    field_offset , field_type = struct_offset(etype,field_name)
+    ctx.image.emit("IMM",field_offset)
+    ctx.image.emit("ADD")
+
+def addr_ptr_attr(ctx: CodegenContext,astnode : ASTNode):
+    field_name = astnode.metas[0]
+    lhs = astnode.children[0]
+    solve_addr(ctx,lhs)
+    ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    etype = unpack_C_Var(ast_type(ctx,lhs)).oftype
+    field_offset , field_type = struct_offset(etype,field_name)
+    ctx.image.emit("IMM",field_offset)
+    ctx.image.emit("ADD")
+
+def addr_string(ctx: CodegenContext,astnode : ASTNode):
+    literal_str = astnode.metas[0]
+    var_pos = ctx.literalpool.alloc(literal_str) # shall only be on image
+    ctx.image.emit_addr("IMM",var_pos)
+
+addr_handlers = {
+    "var"      : addr_var,
+    "index"    : addr_index,
+    "deaddr"   : addr_deaddr,
+    "attr"     : addr_attr,
+    "ptr_attr" : addr_ptr_attr,
+    "string"   : addr_string,
+}
 
 def codegen_action(ctx : CodegenContext,astnode : ASTNode):
-    print('codegen_action',astnode)
+    if trace:
+        log.debug('codegen_action %s',astnode)
+    handler = action_handlers.get(astnode.nodeType)
+    if handler is not None:
+        handler(ctx,astnode)
 
-    if astnode.nodeType == "call":
-        func_ast  : ASTNode = astnode.children[0]
-        args_asts : ASTNode = astnode.children[1:]
+# codegen_action handlers , one per nodeType
 
-        for arg_ast in args_asts:
-            codegen_action(ctx,arg_ast)
-            ctx.image.extend(i64(opcode["PSH"]))
+def gen_call(ctx: CodegenContext,astnode : ASTNode):
+    func_ast  : ASTNode = astnode.children[0]
+    args_asts : ASTNode = astnode.children[1:]
 
-        if func_ast.nodeType == "var": # calling with function name
-            func_name = func_ast.metas[0]
-            if func_name in builtin_funcs:
-                codegen_builtin_funcs(ctx,astnode)    
-            else:
-                bktype , func_pos = ctx.allocator.get(func_name)
-                if bktype == "stack":
-                    ctx.image.extend(i64(opcode["LEA"]) + i64(func_pos))
-                    ctx.image.extend(i64(opcode["LI"])  + i64(opcode["JSRR"]))
-                    ctx.image.extend(i64(opcode["ADJ"]) + i64(len(args_asts)))
-                elif bktype == "image":
-                    ctx.image.extend(i64(opcode["JSR"]) + i64(func_pos))
-                    ctx.image.extend(i64(opcode["ADJ"]) + i64(len(args_asts)))
-        else:
-            # otherwise call with evaluated address
-            codegen_action(ctx,func_ast)
-            ctx.image.extend(i64(opcode["JSRR"]))
-            ctx.image.extend(i64(opcode["ADJ"]) + i64(len(args_asts)))
-
-    elif astnode.nodeType == "string":
-        literal = astnode.metas[0]
-        image_pos = ctx.literalpool.alloc(literal)
-        ctx.image.extend(i64(opcode["IMM"]) + i64(image_pos))
-    
-    elif astnode.nodeType == "integer":
-        literal = astnode.metas[0]
-        ctx.image.extend(i64(opcode["IMM"]) + i64(literal))
-
-    elif astnode.nodeType == "float":
-        literal = astnode.metas[0]
-        ctx.image.extend(i64(opcode["IMM"]) + f64(literal))
-
-    elif astnode.nodeType == "var":
-        var_name = astnode.metas[0]
-        var_type_type, var_type = ctx.symtable.get((var_name,))
-        if type(var_type) == C_Const:
-            ctx.image.extend(i64(opcode["IMM"]) + i64(var_type.value))
-        else:
-            var_type : C_Var = ast_type(ctx,astnode)
-            var_section , var_pos  = ctx.allocator.get(var_name)
-            if var_section == "stack":
-                if type(var_type.oftype) == C_Basetype and var_type.oftype.typename in ["unsigned char","char"]:
-                    ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                    ctx.image.extend(i64(opcode["LC"]))
-                elif type(var_type.oftype) == C_Array:
-                    ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                else:
-                    ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                    ctx.image.extend(i64(opcode["LI"]))
-            elif var_section == "image":
-                if type(var_type.oftype) == C_Basetype and var_type.oftype.typename in ["unsigned char","char"]:
-                    ctx.image.extend(i64(opcode["IMM"]) + i64(var_pos))
-                    ctx.image.extend(i64(opcode["LC"]))
-                elif type(var_type.oftype) == C_Array:
-                    ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                else:
-                    ctx.image.extend(i64(opcode["IMM"]) + i64(var_pos))
-                    ctx.image.extend(i64(opcode["LI"]))
+    for arg_ast in args_asts:
+        codegen_action(ctx,arg_ast)
+        ctx.image.emit("PSH")
 
-    elif astnode.nodeType == "add":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    if func_ast.nodeType == "var": # calling with function name
+        func_name = func_ast.metas[0]
+        if func_name in builtin_funcs:
+            codegen_builtin_funcs(ctx,astnode)    
+        else:
+            bktype , func_pos = ctx.allocator.get(func_name)
+            if bktype == "stack":
+                ctx.image.emit("LEA",func_pos)
+                ctx.image.emit("LI")
+                ctx.image.emit("JSRR")
+                ctx.image.emit("ADJ",len(args_asts))
+            elif bktype == "image":
+                ctx.image.emit("JSR",func_pos)
+                ctx.image.emit("ADJ",len(args_asts))
+    else:
+        # otherwise call with evaluated address
+        codegen_action(ctx,func_ast)
+        ctx.image.emit("JSRR")
+        ctx.image.emit("ADJ",len(args_asts))
+
+def gen_string(ctx: CodegenContext,astnode : ASTNode):
+    literal = astnode.metas[0]
+    image_pos = ctx.literalpool.alloc(literal)
+    ctx.image.emit_addr("IMM",image_pos)
+
+def gen_integer(ctx: CodegenContext,astnode : ASTNode):
+    literal = astnode.metas[0]
+    ctx.image.emit("IMM",literal)
+
+def gen_float(ctx: CodegenContext,astnode : ASTNode):
+    literal = astnode.metas[0]
+    ctx.image.emit("IMM",float(literal)) # operand stored as its double bits
+
+def gen_var(ctx: CodegenContext,astnode : ASTNode):
+    var_name = astnode.metas[0]
+    var_type_type, var_type = ctx.symtable.get((var_name,))
+    if type(var_type) == C_Const:
+        ctx.image.emit("IMM",var_type.value)
+    else:
+        var_type : C_Var = ast_type(ctx,astnode)
+        var_section , var_pos  = ctx.allocator.get(var_name)
+        if var_section == "stack":
+            if type(var_type.oftype) == C_Basetype and var_type.oftype.typename in ["unsigned char","char"]:
+                ctx.image.emit("LEA",var_pos)
+                ctx.image.emit("LC")
+            elif type(var_type.oftype) == C_Array:
+                ctx.image.emit("LEA",var_pos)
+            else:
+                ctx.image.emit("LEA",var_pos)
+                ctx.image.emit("LI")
+        elif var_section == "image":
+            if type(var_type.oftype) == C_Basetype and var_type.oftype.typename in ["unsigned char","char"]:
+                ctx.image.emit_addr("IMM",var_pos)
+                ctx.image.emit("LC")
+            elif type(var_type.oftype) == C_Array:
+                ctx.image.emit("LEA",var_pos)
+            else:
+                ctx.image.emit_addr("IMM",var_pos)
+                ctx.image.emit("LI")
 
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        rtype = unpack_C_Var(ast_type(ctx,rhs))
+def gen_add(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
 
-        ltype_is_pointer = type(ltype) == C_Pointer
-        rtype_is_pointer = type(rtype) == C_Pointer
-        ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
-        rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
-        
-        if ltype_is_pointer:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            elemsize = type_size(ltype.oftype)
-            ctx.image.extend(i64(opcode["PSH"]))
-            ctx.image.extend(i64(opcode["IMM"]) + i64(elemsize))
-            ctx.image.extend(i64(opcode["MUL"]) + i64(opcode["ADD"]))
-        elif rtype_is_pointer:
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,lhs)
-            elemsize = type_size(rtype.oftype)
-            ctx.image.extend(i64(opcode["PSH"]))
-            ctx.image.extend(i64(opcode["IMM"]) + i64(elemsize))
-            ctx.image.extend(i64(opcode["MUL"]) + i64(opcode["ADD"]))
-        elif ltype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            if not rtype_is_double:
-                ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["FADD"]))
-        elif rtype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["FADD"]))
-        else:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["ADD"]))
-
-    elif astnode.nodeType == "sub":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        rtype = unpack_C_Var(ast_type(ctx,rhs))
-
-        ltype_is_pointer = type(ltype) == C_Pointer
-        rtype_is_pointer = type(rtype) == C_Pointer
-        ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
-        rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
-        
-        if ltype_is_pointer:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            elemsize = type_size(ltype.oftype)
-            ctx.image.extend(i64(opcode["PSH"]))
-            ctx.image.extend(i64(opcode["IMM"]) + i64(elemsize))
-            ctx.image.extend(i64(opcode["MUL"]) + i64(opcode["SUB"]))
-        elif rtype_is_pointer:
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,lhs)
-            elemsize = type_size(rtype.oftype)
-            ctx.image.extend(i64(opcode["PSH"]))
-            ctx.image.extend(i64(opcode["IMM"]) + i64(elemsize))
-            ctx.image.extend(i64(opcode["MUL"]) + i64(opcode["SUB"]))
-        elif ltype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            if not rtype_is_double:
-                ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["FSUB"]))
-        elif rtype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["FSUB"]))
-        else:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["SUB"]))
-
-    elif astnode.nodeType == "mul":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        rtype = unpack_C_Var(ast_type(ctx,rhs))
-
-        ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
-        rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
-
-        if ltype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            if not rtype_is_double:
-                ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["FMUL"]))
-        elif rtype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["FMUL"]))
-        else:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["MUL"]))
-
-    elif astnode.nodeType == "div":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        ltype = unpack_C_Var(ast_type(ctx,lhs))
-        rtype = unpack_C_Var(ast_type(ctx,rhs))
-
-        ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
-        rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
-
-        if ltype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            if not rtype_is_double:
-                ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["FDIV"]))
-        elif rtype_is_double:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["I2F"]))
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["FDIV"]))
-        else:
-            codegen_action(ctx,lhs)
-            ctx.image.extend(i64(opcode["PSH"]))
-            codegen_action(ctx,rhs)
-            ctx.image.extend(i64(opcode["DIV"]))
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    rtype = unpack_C_Var(ast_type(ctx,rhs))
 
-    elif astnode.nodeType == "mod":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    ltype_is_pointer = type(ltype) == C_Pointer
+    rtype_is_pointer = type(rtype) == C_Pointer
+    ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
+    rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
 
+    if ltype_is_pointer:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["MOD"]))
-
-    elif astnode.nodeType == "shl":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-
+        elemsize = type_size(ltype.oftype)
+        ctx.image.emit("PSH")
+        ctx.image.emit("IMM",elemsize)
+        ctx.image.emit("MUL")
+        ctx.image.emit("ADD")
+    elif rtype_is_pointer:
+        codegen_action(ctx,rhs)
+        ctx.image.emit("PSH")
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        elemsize = type_size(rtype.oftype)
+        ctx.image.emit("PSH")
+        ctx.image.emit("IMM",elemsize)
+        ctx.image.emit("MUL")
+        ctx.image.emit("ADD")
+    elif ltype_is_double:
+        codegen_action(ctx,lhs)
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["SHL"]))
-
-    elif astnode.nodeType == "shr":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-
+        if not rtype_is_double:
+            ctx.image.emit("I2F")
+        ctx.image.emit("FADD")
+    elif rtype_is_double:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        ctx.image.emit("I2F")
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["SHR"]))
-
-    elif astnode.nodeType == "bitand":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-
+        ctx.image.emit("FADD")
+    else:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["AND"]))
+        ctx.image.emit("ADD")
 
-    elif astnode.nodeType == "bitor":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+def gen_sub(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
 
-        codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
-        codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["OR"]))
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    rtype = unpack_C_Var(ast_type(ctx,rhs))
 
-    elif astnode.nodeType == "bitxor":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    ltype_is_pointer = type(ltype) == C_Pointer
+    rtype_is_pointer = type(rtype) == C_Pointer
+    ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
+    rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
 
+    if ltype_is_pointer:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode["XOR"]))
-
-    elif astnode.nodeType == "bitnot":
-        lhs = astnode.children[0]
+        elemsize = type_size(ltype.oftype)
+        ctx.image.emit("PSH")
+        ctx.image.emit("IMM",elemsize)
+        ctx.image.emit("MUL")
+        ctx.image.emit("SUB")
+    elif rtype_is_pointer:
+        codegen_action(ctx,rhs)
+        ctx.image.emit("PSH")
+        codegen_action(ctx,lhs)
+        elemsize = type_size(rtype.oftype)
+        ctx.image.emit("PSH")
+        ctx.image.emit("IMM",elemsize)
+        ctx.image.emit("MUL")
+        ctx.image.emit("SUB")
+    elif ltype_is_double:
+        codegen_action(ctx,lhs)
+        ctx.image.emit("PSH")
+        codegen_action(ctx,rhs)
+        if not rtype_is_double:
+            ctx.image.emit("I2F")
+        ctx.image.emit("FSUB")
+    elif rtype_is_double:
+        codegen_action(ctx,lhs)
+        ctx.image.emit("I2F")
+        ctx.image.emit("PSH")
+        codegen_action(ctx,rhs)
+        ctx.image.emit("FSUB")
+    else:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["NOT"]))
+        ctx.image.emit("PSH")
+        codegen_action(ctx,rhs)
+        ctx.image.emit("SUB")
 
-    elif astnode.nodeType == "neg":
-        lhs = astnode.children[0]
+def gen_mul(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    rtype = unpack_C_Var(ast_type(ctx,rhs))
 
-        ctx.image.extend(i64(opcode["IMM"]) + i64(0) + i64(opcode["PSH"]))
-        codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["SUB"]))
+    ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
+    rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
 
-    elif astnode.nodeType in ["eq","ne","lt","gt","le","ge"]:
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    if ltype_is_double:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.extend(i64(opcode[astnode.nodeType.upper()]))
-
-    elif astnode.nodeType == "and":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        
+        if not rtype_is_double:
+            ctx.image.emit("I2F")
+        ctx.image.emit("FMUL")
+    elif rtype_is_double:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["BZ"]))
-        bz_pos = ctx.image.extend(i64(0))
+        ctx.image.emit("I2F")
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.block[bz_pos:bz_pos + 8] = i64(len(ctx.image.block))
-
-    elif astnode.nodeType == "or":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
-        
+        ctx.image.emit("FMUL")
+    else:
         codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["BNZ"]))
-        bz_pos = ctx.image.extend(i64(0))
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-        ctx.image.block[bz_pos:bz_pos + 8] = i64(len(ctx.image.block))
+        ctx.image.emit("MUL")
 
-    elif astnode.nodeType == "not":
-        lhs = astnode.children[0]
-        ctx.image.extend(i64(opcode["IMM"]) + i64(0) + i64(opcode["PSH"]))
-        codegen_action(ctx,lhs)
-        ctx.image.extend(i64(opcode["EQ"]))
+def gen_div(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    rtype = unpack_C_Var(ast_type(ctx,rhs))
+
+    ltype_is_double  = type(ltype) == C_Basetype and ltype.typename in ["float","double"]
+    rtype_is_double  = type(rtype) == C_Basetype and rtype.typename in ["float","double"] 
 
-    elif astnode.nodeType == "comma":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    if ltype_is_double:
         codegen_action(ctx,lhs)
+        ctx.image.emit("PSH")
         codegen_action(ctx,rhs)
-
-    elif astnode.nodeType == "deaddr":
-        lhs   = astnode.children[0]
-        etype = unpack_C_Var(ast_type(ctx,lhs))
+        if not rtype_is_double:
+            ctx.image.emit("I2F")
+        ctx.image.emit("FDIV")
+    elif rtype_is_double:
         codegen_action(ctx,lhs)
-        if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
+        ctx.image.emit("I2F")
+        ctx.image.emit("PSH")
+        codegen_action(ctx,rhs)
+        ctx.image.emit("FDIV")
+    else:
+        codegen_action(ctx,lhs)
+        ctx.image.emit("PSH")
+        codegen_action(ctx,rhs)
+        ctx.image.emit("DIV")
+
+def gen_mod(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("MOD")
+
+def gen_shl(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("SHL")
+
+def gen_shr(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("SHR")
+
+def gen_bitand(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("AND")
+
+def gen_bitor(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("OR")
+
+def gen_bitxor(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit("XOR")
+
+def gen_bitnot(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    codegen_action(ctx,lhs)
+    ctx.image.emit("NOT")
+
+def gen_neg(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+
+    ltype = unpack_C_Var(ast_type(ctx,lhs))
+    if type(ltype) == C_Basetype and ltype.typename in ["float","double"]:
+        ctx.image.emit("IMM",0.0) # 0.0 - x , like optimizer.fold_unary
+        ctx.image.emit("PSH")
+        codegen_action(ctx,lhs)
+        ctx.image.emit("FSUB")
+        return
+    ctx.image.emit("IMM",0)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,lhs)
+    ctx.image.emit("SUB")
+
+def gen_compare(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    codegen_action(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit(astnode.nodeType.upper())
+
+def gen_and(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    exit_label = Label()
+    ctx.image.emit("BZ",exit_label)
+    codegen_action(ctx,rhs)
+    ctx.image.bind(exit_label)
+
+def gen_or(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+
+    codegen_action(ctx,lhs)
+    exit_label = Label()
+    ctx.image.emit("BNZ",exit_label)
+    codegen_action(ctx,rhs)
+    ctx.image.bind(exit_label)
+
+def gen_not(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    ctx.image.emit("IMM",0)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,lhs)
+    ctx.image.emit("EQ")
+
+def gen_comma(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
+    codegen_action(ctx,lhs)
+    codegen_action(ctx,rhs)
+
+def gen_deaddr(ctx: CodegenContext,astnode : ASTNode):
+    lhs   = astnode.children[0]
+    etype = unpack_C_Var(ast_type(ctx,lhs))
+    codegen_action(ctx,lhs)
+    if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+
+def gen_addr(ctx: CodegenContext,astnode : ASTNode):
+    lhs   = astnode.children[0]
+    solve_addr(ctx,lhs)
+
+def gen_index(ctx: CodegenContext,astnode : ASTNode):
+    solve_addr(ctx,astnode)
+    var_type = unpack_C_Var(ast_type(ctx,astnode))
+    if type(var_type) == C_Basetype and var_type.typename in ['char','unsigned char']:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+
+def gen_sizeof(ctx: CodegenContext,astnode : ASTNode):
+    child : ASTNode = astnode.children[0]
+    if child.nodeType == "var":
+        var_name = child.metas[0]
+        sztypetype , sztype = ctx.symtable.get((var_name,))
+        sztype : C_Var
+        sztype = sztype.oftype
+    elif child.nodeType == "as":
+        sztype = child.metas[0]
+    size = type_size(sztype)
+    ctx.image.emit("IMM",size)
+
+def gen_ret(ctx: CodegenContext,astnode : ASTNode):
+    if astnode.children[0] is not None:
+        codegen_action(ctx,astnode.children[0])
+    ctx.image.emit("LEV")
+
+def gen_attr(ctx: CodegenContext,astnode : ASTNode):
+    solve_addr(ctx,astnode)
+    etype = unpack_C_Var(ast_type(ctx,astnode))
+    if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+
+def gen_ptr_attr(ctx: CodegenContext,astnode : ASTNode):
+    solve_addr(ctx,astnode)
+    etype = unpack_C_Var(ast_type(ctx,astnode))
+    if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+
+def gen_cond(ctx: CodegenContext,astnode : ASTNode):
+    cond_ast , tast , fast = astnode.children
+    false_label , exit_label = Label() , Label()
+    codegen_action(ctx,cond_ast)
+    ctx.image.emit("BZ",false_label)
+    codegen_action(ctx,tast)
+    ctx.image.emit("JMP",exit_label)
+    ctx.image.bind(false_label)
+    codegen_action(ctx,fast)
+    ctx.image.bind(exit_label)
+
+def gen_if(ctx: CodegenContext,astnode : ASTNode):
+    cond_ast , branch = astnode.children
+    exit_label = Label()
+    codegen_action(ctx,cond_ast)
+    ctx.image.emit("BZ",exit_label)
+    codegen_action(ctx,branch)
+    ctx.image.bind(exit_label)
+
+def gen_incret(ctx: CodegenContext,astnode : ASTNode):
+    target = astnode.children[0]
+    target_type = unpack_C_Var(ast_type(ctx,target))
+    solve_addr(ctx,target)
+    ctx.image.emit("PSH")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("ADD")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("SC")
+    else:
+        ctx.image.emit("SI")
+
+def gen_decret(ctx: CodegenContext,astnode : ASTNode):
+    target = astnode.children[0]
+    target_type = unpack_C_Var(ast_type(ctx,target))
+    solve_addr(ctx,target)
+    ctx.image.emit("PSH")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("SUB")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("SC")
+    else:
+        ctx.image.emit("SI")
+
+def gen_retinc(ctx: CodegenContext,astnode : ASTNode):
+    target = astnode.children[0]
+    target_type = unpack_C_Var(ast_type(ctx,target))
+    solve_addr(ctx,target)
+    ctx.image.emit("PSH")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("ADD")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("SC")
+    else:
+        ctx.image.emit("SI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("SUB")
+
+def gen_retdec(ctx: CodegenContext,astnode : ASTNode):
+    target = astnode.children[0]
+    target_type = unpack_C_Var(ast_type(ctx,target))
+    solve_addr(ctx,target)
+    ctx.image.emit("PSH")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("LC")
+    else:
+        ctx.image.emit("LI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("SUB")
+    if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
+        ctx.image.emit("SC")
+    else:
+        ctx.image.emit("SI")
+    ctx.image.emit("PSH")
+    ctx.image.emit("IMM",1)
+    ctx.image.emit("ADD")
+
+def gen_as(ctx: CodegenContext,astnode : ASTNode):
+    child       = astnode.children[0]
+    codegen_action(ctx,child)
+    target_type = astnode.metas[0]
+    etype       = unpack_C_Var(ast_type(ctx,child))
+    if type(etype) == C_Basetype and etype.typename in ["float","double"]:
+        if type(target_type) == C_Basetype and target_type.typename not in ["float","double"]:
+            ctx.image.emit("F2I")
+    else:
+        if type(target_type) == C_Basetype and target_type.typename in ["float","double"]:
+            ctx.image.emit("I2F")
+
+def gen_break(ctx: CodegenContext,astnode : ASTNode):
+    if ctx.flowCtx is not None:
+        ctx.image.emit("JMP",ctx.flowCtx.break_label)
+
+def gen_continue(ctx: CodegenContext,astnode : ASTNode):
+    if ctx.flowCtx is not None:
+        ctx.image.emit("JMP",ctx.flowCtx.continue_label)
+
+def gen_while(ctx: CodegenContext,astnode : ASTNode):
+    cond_ast , loop_ast = astnode.children
+    loop_label = Label()
+    ctx.image.bind(loop_label)
+    codegen_action(ctx,cond_ast)
+
+    # create a new flowContext , continue goes back to the condition
+    exit_label = Label()
+    ctx = CodegenContext(
+        ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
+        FlowContext(exit_label,loop_label),ctx.types
+    )
 
-    elif astnode.nodeType == "addr":
-        lhs   = astnode.children[0]
-        solve_addr(ctx,lhs)
+    ctx.image.emit("BZ",exit_label)
+    codegen_action(ctx,loop_ast)
+    ctx.image.emit("JMP",loop_label)
+    ctx.image.bind(exit_label)
 
-    elif astnode.nodeType == "index":
-        solve_addr(ctx,astnode)
-        var_type = unpack_C_Var(ast_type(ctx,astnode))
-        if type(var_type) == C_Basetype and var_type.typename in ['char','unsigned char']:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-
-    elif astnode.nodeType == "actions":
-        codegen_actions(ctx,astnode)
-
-    elif astnode.nodeType == "sizeof":
-        child : ASTNode = astnode.children[0]
-        if child.nodeType == "var":
-            var_name = child.metas[0]
-            sztypetype , sztype = ctx.symtable.get((var_name,))
-            sztype : C_Var
-            sztype = sztype.oftype
-        elif child.nodeType == "as":
-            sztype = child.metas[0]
-        size = type_size(sztype)
-        ctx.image.extend(i64(opcode["IMM"]) + i64(size))
-
-    elif astnode.nodeType == "ret":
-        if astnode.children[0] is not None:
-            codegen_action(ctx,astnode.children[0])
-        ctx.image.extend(i64(opcode["LEV"]))
-
-    elif astnode.nodeType == "attr":
-        solve_addr(ctx,astnode)
-        etype = unpack_C_Var(ast_type(ctx,astnode))
-        if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
+def gen_do_while(ctx: CodegenContext,astnode : ASTNode):
+    cond_ast , loop_ast = astnode.children
 
-    elif astnode.nodeType == "ptr_attr":
-        solve_addr(ctx,astnode)
-        etype = unpack_C_Var(ast_type(ctx,astnode))
-        if type(etype) == C_Basetype and etype.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-
-    elif astnode.nodeType in ["cond","ifelse"] :
-        cond_ast , tast , fast = astnode.children
-        codegen_action(ctx,cond_ast)
-        ctx.image.extend(i64(opcode["BZ"]))
-        fpos  = ctx.image.extend(i64(0))
-        codegen_action(ctx,tast)
-        ctx.image.extend(i64(opcode["JMP"]))
-        tpos  = ctx.image.extend(i64(0))
-        fdest = len(ctx.image.block)
-        codegen_action(ctx,fast)
-        tdest = len(ctx.image.block)
-
-        ctx.image.block[fpos:fpos+8] = i64(fdest)
-        ctx.image.block[tpos:tpos+8] = i64(tdest)
-
-    elif astnode.nodeType == "if":
-        cond_ast , branch = astnode.children
-        codegen_action(ctx,cond_ast)
-        ctx.image.extend(i64(opcode["BZ"]))
-        fpos  = ctx.image.extend(i64(0))
-        codegen_action(ctx,branch)
-        ctx.image.block[fpos:fpos+8] = i64(len(ctx.image.block))
-
-    elif astnode.nodeType == "incret":
-        target = astnode.children[0]
-        target_type = unpack_C_Var(ast_type(ctx,target))
-        solve_addr(ctx,target)
-        ctx.image.extend(i64(opcode["PSH"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["ADD"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["SC"]))
-        else:
-            ctx.image.extend(i64(opcode["SI"]))
-
-    elif astnode.nodeType == "decret":
-        target = astnode.children[0]
-        target_type = unpack_C_Var(ast_type(ctx,target))
-        solve_addr(ctx,target)
-        ctx.image.extend(i64(opcode["PSH"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["SUB"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["SC"]))
-        else:
-            ctx.image.extend(i64(opcode["SI"]))
-
-    elif astnode.nodeType == "retinc":
-        target = astnode.children[0]
-        target_type = unpack_C_Var(ast_type(ctx,target))
-        solve_addr(ctx,target)
-        ctx.image.extend(i64(opcode["PSH"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["ADD"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["SC"]))
-        else:
-            ctx.image.extend(i64(opcode["SI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["SUB"]))
-
-    elif astnode.nodeType == "retdec":
-        target = astnode.children[0]
-        target_type = unpack_C_Var(ast_type(ctx,target))
-        solve_addr(ctx,target)
-        ctx.image.extend(i64(opcode["PSH"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["LC"]))
-        else:
-            ctx.image.extend(i64(opcode["LI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["SUB"]))
-        if type(target_type) == C_Basetype and target_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["SC"]))
-        else:
-            ctx.image.extend(i64(opcode["SI"]))
-        ctx.image.extend(i64(opcode["PSH"]))
-        ctx.image.extend(i64(opcode["IMM"]) + i64(1))
-        ctx.image.extend(i64(opcode["ADD"]))
-
-    elif astnode.nodeType == "as":
-        child       = astnode.children[0]
-        codegen_action(ctx,child)
-        target_type = astnode.metas[0]
-        etype       = unpack_C_Var(ast_type(ctx,child))
-        if type(etype) == C_Basetype and etype.typename in ["float","double"]:
-            if type(target_type) == C_Basetype and target_type.typename not in ["float","double"]:
-                ctx.image.extend(i64(opcode["F2I"]))
+    # continue goes back to the top of the body
+    loop_label , exit_label = Label() , Label()
+    oldctx = ctx
+    ctx = CodegenContext(
+        ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
+        FlowContext(exit_label,loop_label),ctx.types
+    )
+
+    ctx.image.bind(loop_label)
+    codegen_action(ctx,loop_ast)
+    codegen_action(oldctx,cond_ast)
+    ctx.image.emit("BNZ",loop_label)
+    ctx.image.bind(exit_label)
+
+def gen_for(ctx: CodegenContext,astnode : ASTNode):
+    init_ast , cond_ast , inc_ast , loop_ast = astnode.children
+
+    # continue goes to the increment clause
+    loop_label , inc_label , exit_label = Label() , Label() , Label()
+    oldctx = ctx
+    ctx = CodegenContext(
+        ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
+        FlowContext(exit_label,inc_label),ctx.types
+    )
+
+    codegen_action(oldctx,init_ast)
+    ctx.image.bind(loop_label)
+    codegen_action(oldctx,cond_ast)
+    ctx.image.emit("BZ",exit_label)
+    codegen_action(ctx,loop_ast)
+    ctx.image.bind(inc_label)
+    codegen_action(oldctx,inc_ast)
+    ctx.image.emit("JMP",loop_label)
+    ctx.image.bind(exit_label)
+
+def gen_init_assign(ctx: CodegenContext,astnode : ASTNode):
+    var_ast : ASTNode = astnode.children[0]
+    lst_ast : ASTNode = astnode.children[1]
+
+    var_name = var_ast.metas[0]
+    var_type_type , var_type = ctx.symtable.get((var_name,))
+    var_type = var_type.oftype
+    var_section   , var_pos  = ctx.allocator.get(var_name)# var_section shall only be stack here
+    initlst  = lst_ast.metas[0]
+
+    def assign_element(var_type : Any,val_ast : ASTNode,var_pos : int):
+        if type(var_type) == C_Basetype and var_type.typename in ["unsigned char","char"]:
+            ctx.image.emit("LEA",var_pos)
+            ctx.image.emit("PSH")
+            codegen_action(ctx,val_ast)
+            ctx.image.emit("SC")
         else:
-            if type(target_type) == C_Basetype and target_type.typename in ["float","double"]:
-                ctx.image.extend(i64(opcode["I2F"]))
-
-    elif astnode.nodeType == "break":
-        if ctx.flowCtx is not None:
-            ctx.image.extend(i64(opcode["JMP"]))
-            brk_pos = ctx.image.extend(i64(0))
-            ctx.flowCtx.break_pos_lst.append(brk_pos)
-
-    elif astnode.nodeType == "continue":
-        if ctx.flowCtx is not None:
-            ctx.image.extend(i64(opcode["JMP"]))
-            cont_pos = ctx.image.extend(i64(0))
-            ctx.flowCtx.continue_pos_lst.append(cont_pos)
-
-    elif astnode.nodeType == "while":
-        cond_ast , loop_ast = astnode.children
-        loop_dest = len(ctx.image.block)
-        codegen_action(ctx,cond_ast)
-
-        # create a new flowContext
-        ctx = CodegenContext(
-            ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
-            FlowContext([],[])
-        )
-
-        ctx.image.extend(i64(opcode["BZ"]))
-        exit_pos  = ctx.image.extend(i64(0))
-        codegen_action(ctx,loop_ast)
-        ctx.image.extend(i64(opcode["JMP"]))
-        ctx.image.extend(i64(loop_dest))
-        exit_dest = len(ctx.image.block)
-        ctx.image.block[exit_pos:exit_pos + 8] = i64(exit_dest)
-
-        for cont_pos in ctx.flowCtx.continue_pos_lst:
-            ctx.image.block[cont_pos: cont_pos + 8] = i64(loop_dest)
-
-        for brk_pos in ctx.flowCtx.break_pos_lst:
-            ctx.image.block[brk_pos: brk_pos + 8] = i64(exit_dest)
-
-    elif astnode.nodeType == "do_while":
-        cond_ast , loop_ast = astnode.children
-        
-        oldctx = ctx
-        ctx = CodegenContext(
-            ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
-            FlowContext([],[])
-        )
-
-        loop_dest = len(ctx.image.block)
-        codegen_action(ctx,loop_ast)
-        codegen_action(oldctx,cond_ast)
-        ctx.image.extend(i64(opcode["BNZ"]))
-        ctx.image.extend(i64(loop_dest))
-        exit_dest = len(ctx.image.block)
-
-        for cont_pos in ctx.flowCtx.continue_pos_lst:
-            ctx.image.block[cont_pos: cont_pos + 8] = i64(loop_dest)
-
-        for brk_pos in ctx.flowCtx.break_pos_lst:
-            ctx.image.block[brk_pos: brk_pos + 8] = i64(exit_dest)
-
-    elif astnode.nodeType == "for":
-        init_ast , cond_ast , inc_ast , loop_ast = astnode.children
-        
-        oldctx = ctx
-        ctx = CodegenContext(
-            ctx.image,ctx.literalpool,ctx.allocator,ctx.symtable,
-            FlowContext([],[])
-        )
-
-        codegen_action(oldctx,init_ast)
-        loop_dest = len(ctx.image.block)
-        codegen_action(oldctx,cond_ast)
-        ctx.image.extend(i64(opcode["BZ"]))
-        exit_pos  = ctx.image.extend(i64(0))
-        codegen_action(ctx,loop_ast)
-        inc_dest  = len(ctx.image.block)
-        codegen_action(oldctx,inc_ast)
-        ctx.image.extend(i64(opcode["JMP"]))
-        ctx.image.extend(i64(loop_dest))
-        exit_dest = len(ctx.image.block)
-        ctx.image.block[exit_pos:exit_pos + 8] = i64(exit_dest)
-
-        for cont_pos in ctx.flowCtx.continue_pos_lst:
-            ctx.image.block[cont_pos: cont_pos + 8] = i64(inc_dest)
-
-        for brk_pos in ctx.flowCtx.break_pos_lst:
-            ctx.image.block[brk_pos: brk_pos + 8] = i64(exit_dest)
-
-
-    elif astnode.nodeType == "init_assign":
-        var_ast : ASTNode = astnode.children[0]
-        lst_ast : ASTNode = astnode.children[1]
-
-        var_name = var_ast.metas[0]
-        var_type_type , var_type = ctx.symtable.get((var_name,))
-        var_type = var_type.oftype
-        var_section   , var_pos  = ctx.allocator.get(var_name)# var_section shall only be stack here
-        initlst  = lst_ast.metas[0]
-
-        def assign_element(var_type : Any,val_ast : ASTNode,var_pos : int):
-            if type(var_type) == C_Basetype and var_type.typename in ["unsigned char","char"]:
-                ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                ctx.image.extend(i64(opcode["PSH"]))
-                codegen_action(ctx,val_ast)
-                ctx.image.extend(i64(opcode["SC"]))
+            ctx.image.emit("LEA",var_pos)
+            ctx.image.emit("PSH")
+            codegen_action(ctx,val_ast)
+            ctx.image.emit("SI")
+
+    def init_assign(var_type: Any,content: list[tuple],var_pos: int):
+        if type(var_type) == C_Array:
+            if len(var_type.dimension) == 1:
+                childtype = var_type.oftype
             else:
-                ctx.image.extend(i64(opcode["LEA"]) + i64(var_pos))
-                ctx.image.extend(i64(opcode["PSH"]))
-                codegen_action(ctx,val_ast)
-                ctx.image.extend(i64(opcode["SI"]))
-
-        def init_assign(var_type: Any,content: list[tuple],var_pos: int):
-            if type(var_type) == C_Array:
-                if len(var_type.dimension) == 1:
-                    childtype = var_type.oftype
+                childtype = C_Array(var_type.oftype,var_type.dimension[1:])
+            childsize = type_size(childtype)
+            for idx,elemast in content:
+                elemast : ASTNode # should be a "initlist"
+                if elemast.nodeType == "initlist":
+                    init_assign(childtype,elemast.metas[0],var_pos + idx * childsize)
                 else:
-                    childtype = C_Array(var_type.oftype,var_type.dimension[1:])
-                childsize = type_size(childtype)
-                for idx,elemast in content:
-                    elemast : ASTNode # should be a "initlist"
-                    if elemast.nodeType == "initlist":
-                        init_assign(childtype,elemast.metas[0],var_pos + idx * childsize)
-                    else:
-                        init_assign(childtype,elemast,var_pos + idx * childsize)
-            elif type(var_type) == C_Struct:
-                for idx,elemast in content:
-                    if type(idx) == int:
-                        field_offset , field_type = struct_idx_offset(var_type,idx)
-                    elif type(idx) == str:
-                        field_offset , field_type = struct_offset(var_type,idx)
-                    if elemast.nodeType == "initlist":
-                        initlst = elemast.metas[0]
-                        init_assign(field_type,initlst,var_pos + field_offset)
-                    else:
-                        init_assign(field_type,elemast,var_pos + field_offset)
-            else:
-                assign_element(var_type,content,var_pos)        
-        
-        init_assign(var_type,initlst,var_pos)
+                    init_assign(childtype,elemast,var_pos + idx * childsize)
+        elif type(var_type) == C_Struct:
+            for idx,elemast in content:
+                if type(idx) == int:
+                    field_offset , field_type = struct_idx_offset(var_type,idx)
+                elif type(idx) == str:
+                    field_offset , field_type = struct_offset(var_type,idx)
+                if elemast.nodeType == "initlist":
+                    initlst = elemast.metas[0]
+                    init_assign(field_type,initlst,var_pos + field_offset)
+                else:
+                    init_assign(field_type,elemast,var_pos + field_offset)
+        else:
+            assign_element(var_type,content,var_pos)        
+
+    init_assign(var_type,initlst,var_pos)
+
+def gen_assign(ctx: CodegenContext,astnode : ASTNode):
+    lhs = astnode.children[0]
+    rhs = astnode.children[1]
 
-    elif astnode.nodeType == "assign":
-        lhs = astnode.children[0]
-        rhs = astnode.children[1]
+    lhs_type = unpack_C_Var(ast_type(ctx,lhs))
+    if lhs_type is None or type(lhs_type) == C_Basetype and lhs_type.typename in ["unsigned char","char"]:
+        store = "SC"
+    else:
+        store = "SI"
 
-        solve_addr(ctx,lhs)
-        ctx.image.extend(i64(opcode["PSH"]))
+    if ctx.image.fused and lhs.nodeType == "var":
+        # store straight to the variable , no address on the stack
+        var_section , var_pos = ctx.allocator.get(lhs.metas[0])
         codegen_action(ctx,rhs)
+        ctx.image.emit(fused_stores[(var_section,store)],var_pos)
+        return
 
-        lhs_type = unpack_C_Var(ast_type(ctx,lhs))
-        if lhs_type is None or type(lhs_type) == C_Basetype and lhs_type.typename in ["unsigned char","char"]:
-            ctx.image.extend(i64(opcode["SC"]))
-        else:
-            ctx.image.extend(i64(opcode["SI"]))
+    solve_addr(ctx,lhs)
+    ctx.image.emit("PSH")
+    codegen_action(ctx,rhs)
+    ctx.image.emit(store)
+
+action_handlers = {
+    "call"        : gen_call,
+    "string"      : gen_string,
+    "integer"     : gen_integer,
+    "float"       : gen_float,
+    "var"         : gen_var,
+    "add"         : gen_add,
+    "sub"         : gen_sub,
+    "mul"         : gen_mul,
+    "div"         : gen_div,
+    "mod"         : gen_mod,
+    "shl"         : gen_shl,
+    "shr"         : gen_shr,
+    "bitand"      : gen_bitand,
+    "bitor"       : gen_bitor,
+    "bitxor"      : gen_bitxor,
+    "bitnot"      : gen_bitnot,
+    "neg"         : gen_neg,
+    "eq"          : gen_compare,
+    "ne"          : gen_compare,
+    "lt"          : gen_compare,
+    "gt"          : gen_compare,
+    "le"          : gen_compare,
+    "ge"          : gen_compare,
+    "and"         : gen_and,
+    "or"          : gen_or,
+    "not"         : gen_not,
+    "comma"       : gen_comma,
+    "deaddr"      : gen_deaddr,
+    "addr"        : gen_addr,
+    "index"       : gen_index,
+    "actions"     : codegen_actions,
+    "sizeof"      : gen_sizeof,
+    "ret"         : gen_ret,
+    "attr"        : gen_attr,
+    "ptr_attr"    : gen_ptr_attr,
+    "cond"        : gen_cond,
+    "ifelse"      : gen_cond,
+    "if"          : gen_if,
+    "incret"      : gen_incret,
+    "decret"      : gen_decret,
+    "retinc"      : gen_retinc,
+    "retdec"      : gen_retdec,
+    "as"          : gen_as,
+    "break"       : gen_break,
+    "continue"    : gen_continue,
+    "while"       : gen_while,
+    "do_while"    : gen_do_while,
+    "for"         : gen_for,
+    "init_assign" : gen_init_assign,
+    "assign"      : gen_assign,
+}
 
 def i8(x : int) -> bytes:
     return x.to_bytes(1,'little',signed=True)
@@ -1065,14 +1471,34 @@ def program_symtab_init(ctx : CodegenContext,astnode : ASTNode):
 
     symtable : SymTable = astnode.metas[0]
     symdict  : dict     = symtable.mapper
-
-    for var_name_tuple, (var_type,typeinfo) in symdict.items():
-        if var_type != 'var':
-            continue
-        var_name = var_name_tuple[0]
-        typeinfo : C_Var
-        vartype = typeinfo.oftype
-        allocvar(ctx,var_name,vartype)
+    initialized = static_names(astnode)
+
+    def is_bss(var_name,vartype) -> bool:
+        return type(vartype) != C_Func and var_name not in initialized
+
+    # zero-initialised globals first , as one run the packer keeps off disk
+    bss_start = ctx.allocator.backend.end()
+    for bss in [True,False]:
+        for var_name_tuple, (var_type,typeinfo) in symdict.items():
+            if var_type != 'var':
+                continue
+            var_name = var_name_tuple[0]
+            typeinfo : C_Var
+            vartype = typeinfo.oftype
+            if is_bss(var_name,vartype) == bss:
+                allocvar(ctx,var_name,vartype)
+        if bss:
+            ctx.image.bss = (bss_start,ctx.allocator.backend.align(8) - bss_start)
+
+def static_names(astroot : ASTNode) -> set:
+    '''globals given a value by static_init'''
+    names = set()
+    for child in astroot.children:
+        if child.nodeType == "actions":
+            names |= static_names(child)
+        elif child.nodeType in ["assign","init_assign"]:
+            names.add(child.children[0].metas[0])
+    return names
 
 def type_size(var_type) -> int:
     if type(var_type) == C_Struct:
@@ -1149,7 +1575,7 @@ def poolinit(ctx : CodegenContext ,astnode : ASTNode):
             ctx.literalpool.alloc(node.metas[0])
         if node.nodeType == "initlist":
             for _,ast in node.metas[0]:
-                if type(ast) == ASTNode:
+                if type(ast) == ASTNode or type(ast) == ASTView:
                     traverse(ast)
         for child in node.children:
             traverse(child)
@@ -1162,6 +1588,7 @@ def static_init(ctx : CodegenContext, astroot : ASTNode):
             if type(var_type) == C_Pointer:
                 target_addr = ctx.literalpool.alloc(literal_ast.metas[0]) 
                 ctx.image.block[var_pos:var_pos + 8] = i64(target_addr)
+                ctx.image.addr_refs.append(var_pos)
             elif type(var_type) == C_Array:
                 string_literal = literal_ast.metas[0]
                 for i,c in enumerate(string_literal):
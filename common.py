@@ -1,10 +1,35 @@
+import logging
 from typing import Any
+from array import array
+from contextlib import contextmanager
 from dataclasses import dataclass
 
-@dataclass
+# diagnostics of every stage , silent unless compiler.py --verbose adds a handler
+log = logging.getLogger("c4")
+log.addHandler(logging.NullHandler())
+
+class NullReport:
+    '''stands in for timereport.TimeReport when no report is asked for'''
+    enabled = False
+
+    @contextmanager
+    def phase(self,name: str):
+        yield {}
+
+# token kinds , small ints so the parser compares them cheaply
+TK_IDENTIFIER = 0
+TK_OPERATOR   = 1
+TK_INTEGER    = 2
+TK_FLOAT      = 3
+TK_STRING     = 4
+TK_MACRO      = 5
+
+tktype_name = ("identifier","operator","integer","float","string","macro")
+
+@dataclass(slots=True)
 class Token:
-    tktype : str
-    value  : Any
+    tktype : int # one of TK_*
+    value  : Any # identifiers and operators are interned str
     line   : int
 
 @dataclass
@@ -13,6 +38,98 @@ class ASTNode:
     children : list[Any]
     metas    : tuple[Any]
 
+class ASTArena:
+    '''
+    struct-of-arrays AST storage , the compact alternative to ASTNode trees.
+    node i has kind kinds[i] (an index into kind_names) , its first child
+    and next sibling (-1 for none) and metas[i]. nodes are added bottom up
+    through node() , which hands back an ASTView
+    '''
+    __slots__ = ("kinds","first_child","next_sibling","parented","metas","kind_names","kind_ids")
+
+    def __init__(self):
+        self.kinds        = array('H')
+        self.first_child  = array('i')
+        self.next_sibling = array('i')
+        self.parented     = bytearray() # already linked under a parent
+        self.metas        = []
+        self.kind_names   = [None]      # kind 0 stands for a None child
+        self.kind_ids     = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self,kind: int,first_child: int,metas: tuple) -> int:
+        idx = len(self.kinds)
+        self.kinds.append(kind)
+        self.first_child.append(first_child)
+        self.next_sibling.append(-1)
+        self.parented.append(0)
+        self.metas.append(metas)
+        return idx
+
+    def link(self,child) -> int:
+        '''index to chain under a new parent , shared subtrees get a shallow copy'''
+        if child is None:
+            return self.add(0,-1,())
+        idx = child.idx
+        if self.parented[idx]:
+            idx = self.add(self.kinds[idx],self.first_child[idx],self.metas[idx])
+        self.parented[idx] = 1
+        return idx
+
+    def node(self,nodeType: str,children: list,metas: tuple) -> "ASTView":
+        kind = self.kind_ids.get(nodeType)
+        if kind is None:
+            kind = self.kind_ids[nodeType] = len(self.kind_names)
+            self.kind_names.append(nodeType)
+        first = prev = -1
+        for child in children:
+            idx = self.link(child)
+            if prev < 0:
+                first = idx
+            else:
+                self.next_sibling[prev] = idx
+            prev = idx
+        return ASTView(self,self.add(kind,first,metas))
+
+class ASTView:
+    '''read-only node of an ASTArena with the ASTNode attributes'''
+    __slots__ = ("arena","idx")
+
+    def __init__(self,arena: ASTArena,idx: int):
+        self.arena = arena
+        self.idx   = idx
+
+    @property
+    def nodeType(self) -> str:
+        return self.arena.kind_names[self.arena.kinds[self.idx]]
+
+    @property
+    def metas(self) -> tuple:
+        return self.arena.metas[self.idx]
+
+    @property
+    def children(self) -> list:
+        arena    = self.arena
+        children = []
+        idx      = arena.first_child[self.idx]
+        while idx >= 0:
+            children.append(ASTView(arena,idx) if arena.kinds[idx] else None)
+            idx = arena.next_sibling[idx]
+        return children
+
+    def __eq__(self,other):
+        return type(other) == ASTView and other.arena is self.arena and other.idx == self.idx
+
+    def __hash__(self):
+        return self.idx
+
+    def __repr__(self):
+        return "ASTNode(nodeType={0!r}, children={1!r}, metas={2!r})".format(
+            self.nodeType,self.children,self.metas
+        )
+
 @dataclass
 class C_Basetype:
     typename : str
@@ -1,44 +1,218 @@
 import os
 import sys
+import signal
 import lexer
 import parser
 import codegen
 import preprocess
+import optimizer
+import peephole
 import packer
+import logging
+import buildcache
+from contextlib import contextmanager
+from common import log , NullReport
+
+stackspace    = 1 * 1024 * 1024
+build_options = "fused=1 peephole=1 stackspace={0}".format(stackspace) # part of the cache key
 
 def show_help():
-    print("compiler.py [source] [target]")
+    print("compiler.py [source] [target] [--disasm listing] [--time-report[=json]] [--verbose] [--no-cache]")
+    print("compiler.py -c source object")
+    print("compiler.py --link object ... -o target [--disasm listing]")
+    print("compiler.py --batch [source | @manifest] ... -o outdir [-j jobs]")
     print("    defaults:                ")
     print("        source = hi.c        ")
     print("        target = out.vm      ")
+    print("    --disasm writes a listing of the image to listing")
+    print("    --time-report prints time , peak memory and counts per phase")
+    print("    --verbose logs diagnostics to stderr")
+    print("    --no-cache always compiles , images are cached in $C4_CACHE_DIR or ~/.cache/c4")
+    print("    -c compiles source to a relocatable object , --link links objects")
+    print("       into an image , so only the changed units are recompiled")
+    print("    --batch compiles every source to outdir/<name>.vm in parallel ,")
+    print("            a manifest lists one source per line")
 
 def source_check(source_path):
     if not os.path.isfile(source_path):
         print("[ERRO] source_path = {0} , not exists".format(source_path))
         sys.exit(1)
 
-def compile(source_path,target_path):
+def timed_out(signum,frame):
+    raise TimeoutError("compile timed out")
+
+@contextmanager
+def time_limit(seconds: float):
+    '''TimeoutError out of the body after seconds (SIGALRM , main thread only)'''
+    previous = signal.signal(signal.SIGALRM,timed_out)
+    signal.setitimer(signal.ITIMER_REAL,seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL,0)
+        signal.signal(signal.SIGALRM,previous)
+
+def compile(source_path,target_path,disasm_path = None,report = None,cache = None):
+    '''
+    report , a timereport.TimeReport , times each phase. the token stream
+    is then built phase by phase instead of lazily so each is measured alone.
+    cache , a buildcache.BuildCache , is looked up before lexing (not when
+    a listing is asked for , that needs the raw image) and filled after
+    '''
     source_check(source_path)
+    if report is None:
+        report = NullReport()
     
     # read source file to src
+    with report.phase("read") as counts:
+        with open(source_path,'r',encoding='utf-8') as f:
+            src = f.read()
+        counts["bytes"] = len(src)
+
+    cwd = os.path.dirname(__file__) # cwd for #include
+    packed_image = None
+    if cache is not None:
+        with report.phase("cache") as counts:
+            key = cache.key(src,cwd,build_options)
+            if disasm_path is None:
+                packed_image = cache.get(key)
+            counts["hit"] = int(packed_image is not None)
+    if packed_image is None:
+        packed_image = build(src,cwd,disasm_path,report)
+        if cache is not None:
+            cache.put(key,packed_image)
+    else:
+        log.info("cache hit: %s",cache.path(key))
+
+    with report.phase("write") as counts:
+        with open(target_path,'wb') as f:
+            f.write(packed_image)
+        counts["bytes"] = len(packed_image)
+    print("compiled successfully!")
+
+def compile_object(source_path,target_path,report = None):
+    '''source_path to the object file target_path , see build_object'''
+    source_check(source_path)
+    if report is None:
+        report = NullReport()
     with open(source_path,'r',encoding='utf-8') as f:
         src = f.read()
-    
-    # tokenize
-    tokens = lexer.tokenize(src)
+    obj = build_object(src,os.path.dirname(__file__),report)
+    with open(target_path,'wb') as f:
+        f.write(obj)
+    print("compiled successfully!")
 
-    # preprocess
-    cwd = os.path.dirname(__file__) # cwd for #include
-    tokens = preprocess.entry(tokens,cwd)
+def link_objects(object_paths,target_path,disasm_path = None,report = None):
+    import linker
+    objects = []
+    for path in object_paths:
+        source_check(path)
+        with open(path,'rb') as f:
+            objects.append(f.read())
+    try:
+        packed_image = link(objects,disasm_path,report)
+    except linker.LinkError as e:
+        print("[ERRO] {0}".format(e))
+        sys.exit(1)
+    with open(target_path,'wb') as f:
+        f.write(packed_image)
+    print("linked successfully!")
+
+def build(src: str,cwd: str,disasm_path = None,report = None) -> bytes:
+    '''source text to a packed image , #include is resolved from cwd'''
+    if report is None:
+        report = NullReport()
+    ASTRoot = front_end(src,cwd,report)
+
+    # codegen , then peephole and superinstruction selection over the code
+    with report.phase("codegen") as counts:
+        peephole_pass , fused_pass = bytecode_passes()
+        raw_image = codegen.entry(ASTRoot,passes=(peephole_pass,fused_pass),fused=True)
+        if report.enabled:
+            count_code(counts,raw_image,peephole_pass,fused_pass)
+    log.info("peephole removed: %s",peephole_pass.removed)
+    log.info("fused: %s",fused_pass.removed)
+    return back_end(raw_image,disasm_path,report)
+
+def build_object(src: str,cwd: str,report = None) -> bytes:
+    '''source text to an object file for link , see build'''
+    import linker
+    if report is None:
+        report = NullReport()
+    ASTRoot = front_end(src,cwd,report)
+    with report.phase("codegen") as counts:
+        peephole_pass , fused_pass = bytecode_passes()
+        obj = codegen.object_entry(ASTRoot,passes=(peephole_pass,fused_pass),fused=True)
+        counts["relocs"]   = len(obj.relocs)
+        counts["peephole"] = sum(peephole_pass.removed.values())
+        counts["fused"]    = sum(fused_pass.removed.values())
+    log.info("peephole removed: %s",peephole_pass.removed)
+    log.info("fused: %s",fused_pass.removed)
+    return linker.dump_object(obj)
+
+def link(objects: list,disasm_path = None,report = None) -> bytes:
+    '''object files (as bytes) to a packed image'''
+    import linker
+    if report is None:
+        report = NullReport()
+    with report.phase("link") as counts:
+        raw_image = linker.link([linker.load_object(obj) for obj in objects])
+        counts["objects"] = len(objects)
+        counts["symbols"] = len(raw_image.symbols)
+    return back_end(raw_image,disasm_path,report)
+
+def bytecode_passes() -> tuple:
+    return peephole.Peephole() , peephole.Peephole(peephole.fused_patterns)
+
+def count_code(counts: dict,raw_image,peephole_pass,fused_pass):
+    import disasm
+    counts["instructions"] = sum(len(disasm.decode(disasm.words(raw_image),start,start + size))
+                                 for kind , start , size in packer.sections(raw_image) if kind == packer.TEXT)
+    counts["peephole"] = sum(peephole_pass.removed.values())
+    counts["fused"]    = sum(fused_pass.removed.values())
+
+def front_end(src: str,cwd: str,report):
+    '''source text to the folded AST'''
+    if report.enabled:
+        import timereport
+    # tokenize & preprocess lazily , tokens are pulled by the parser
+    # so only its lookahead window is ever held in memory
+    with report.phase("tokenize") as counts:
+        tokens = lexer.iter_tokens(src)
+        if report.enabled:
+            tokens = list(tokens)
+            counts["tokens"] = len(tokens)
+    with report.phase("preprocess") as counts:
+        tokens = preprocess.iter_entry(tokens,cwd)
+        if report.enabled:
+            tokens = list(tokens)
+            counts["tokens"] = len(tokens)
 
     # parse
-    ASTRoot = parser.parse(tokens)
+    with report.phase("parse") as counts:
+        c_parser = parser.Parser(tokens)
+        ASTRoot  = c_parser.program()
+        if report.enabled:
+            counts["nodes"] = timereport.count_nodes(ASTRoot)
+    log.info("rescanned tokens: %s",c_parser.rescanned)
 
-    # codegen
-    raw_image = codegen.entry(ASTRoot)
+    # constant folding
+    with report.phase("fold") as counts:
+        folder  = optimizer.Folder()
+        ASTRoot = folder.fold(ASTRoot,ASTRoot.metas[0])
+        if report.enabled:
+            counts["nodes"] = timereport.count_nodes(ASTRoot)
+    log.info("folded: %s",folder.folded)
+    return ASTRoot
 
-    print("raw_image:",raw_image)
-    # sys.exit(1) # codegen WIP
+def back_end(raw_image,disasm_path,report) -> bytes:
+    '''raw image to a packed image , with the listing if asked for'''
+    if disasm_path is not None:
+        import disasm
+        with report.phase("disasm"):
+            disasm.write(raw_image,disasm_path)
+
+    log.debug("raw_image: %s",raw_image)
 
     # if you wanna make a embed long long array
     # just convert it to qword_array by decommenting code below
@@ -46,22 +220,72 @@ def compile(source_path,target_path):
     # sys.exit(1) # codegen WIP
 
     # pack
-    packed_image = packer.packer(raw_image,ratio=None,stackspace=1 * 1024 * 1024)
-
-    with open(target_path,'wb') as f:
-        f.write(packed_image)
-    print("compiled successfully!")
+    with report.phase("pack") as counts:
+        packed_image = packer.packer(raw_image,ratio=None,stackspace=stackspace)
+        counts["bytes"] = len(packed_image)
+    return packed_image
 
 if __name__ == '__main__':
     source = "hi.c"
     target = "out.vm"
 
+    disasm_path = None
+
+    args = sys.argv[1:]
+    if "--batch" in args:
+        import batch
+        sys.exit(batch.main(args))
+    if "--disasm" in args:
+        idx = args.index("--disasm")
+        if idx + 1 >= len(args):
+            show_help()
+            sys.exit(1)
+        disasm_path = args[idx + 1]
+        del args[idx:idx + 2]
+
     if len(sys.argv) == 1:
         show_help()
         sys.exit(0)
-    if len(sys.argv) >= 2:
-        source = sys.argv[1]
-    if len(sys.argv) >= 3:
-        target = sys.argv[2]
 
-    compile(source,target)
\ No newline at end of file
+    # reports go to stderr , like cc -ftime-report
+    report = None
+    report_format = None
+    cache  = buildcache.BuildCache()
+    for arg in list(args):
+        if arg in ["--time-report","--time-report=text","--time-report=json"]:
+            import timereport
+            report = timereport.TimeReport()
+            report_format = "json" if arg.endswith("json") else "text"
+            args.remove(arg)
+        elif arg == "--verbose":
+            logging.basicConfig(level=logging.DEBUG,format="%(message)s")
+            args.remove(arg)
+        elif arg == "--no-cache":
+            cache = None
+            args.remove(arg)
+
+    if "--link" in args:
+        args.remove("--link")
+        if "-o" in args:
+            idx = args.index("-o")
+            if idx + 1 >= len(args):
+                show_help()
+                sys.exit(1)
+            target = args[idx + 1]
+            del args[idx:idx + 2]
+        link_objects(args,target,disasm_path,report)
+    elif "-c" in args:
+        args.remove("-c")
+        if len(args) != 2:
+            show_help()
+            sys.exit(1)
+        compile_object(args[0],args[1],report)
+    else:
+        if len(args) >= 1:
+            source = args[0]
+        if len(args) >= 2:
+            target = args[1]
+        compile(source,target,disasm_path,report,cache)
+    if report is not None:
+        report.stop()
+        print(report.json() if report_format == "json" else report.text(),file=sys.stderr)
\ No newline at end of file
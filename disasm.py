@@ -0,0 +1,117 @@
+'''
+disassembler for codegen images , only run when asked for (compiler.py
+--disasm). text is walked instruction by instruction from the operand
+counts , data and the literal pool are dumped as words. functions are
+labelled from the allocator symbol map , branch targets as L<position>
+'''
+
+from array import array
+from codegen import opcode , operand_ops
+from peephole import branch_ops
+import packer
+
+rev_opcode = {v: k for k, v in opcode.items()}
+
+section_names = {
+    packer.TEXT   : ".text",
+    packer.RODATA : ".rodata",
+    packer.DATA   : ".data",
+    packer.BSS    : ".bss",
+}
+
+def words(block) -> array:
+    '''the whole image as int64 words in one go'''
+    res = array('q')
+    res.frombytes(memoryview(block)[:len(block) // 8 * 8])
+    return res
+
+def decode(code: array,start: int,end: int) -> list:
+    '''[(pos,op,operand)] over [start,end) , op is None for a word that is not an opcode'''
+    instrs = []
+    idx , last = start // 8 , end // 8
+    while idx < last:
+        op = rev_opcode.get(code[idx])
+        if op is None:
+            instrs.append((8 * idx,None,code[idx]))
+            idx += 1
+        elif op in operand_ops and idx + 1 < last:
+            instrs.append((8 * idx,op,code[idx + 1]))
+            idx += 2
+        else:
+            instrs.append((8 * idx,op,None))
+            idx += 1
+    return instrs
+
+def layout(raw_image) -> list:
+    '''sections of a codegen.RawImage , bytes without a layout are taken as text'''
+    if hasattr(raw_image,"symbols"):
+        return packer.sections(raw_image)
+    return [(packer.TEXT,0,len(raw_image))]
+
+def lines(raw_image,symbols: dict = None):
+    '''the listing , one line at a time'''
+    if symbols is None:
+        symbols = getattr(raw_image,"symbols",{})
+    funcs   = {pos: name for name , (kind , pos) in symbols.items() if kind == "func"}
+    objects = {pos: name for name , (kind , pos) in symbols.items() if kind == "object"}
+    code    = words(raw_image)
+    table   = layout(raw_image)
+
+    text = {}
+    for kind , start , size in table:
+        if kind == packer.TEXT:
+            text[start] = decode(code,start,start + size)
+    targets = {operand for instrs in text.values() for _ , op , operand in instrs if op in branch_ops}
+    # function slots (JMP ent) in data , called through by JSR
+    slots = {}
+    for kind , start , size in table:
+        if kind == packer.DATA:
+            for idx in range(start // 8,(start + size) // 8 - 1):
+                if code[idx] == opcode["JMP"] and code[idx + 1] in funcs:
+                    slots[8 * idx] = funcs[code[idx + 1]]
+
+    def label(pos: int) -> str:
+        return funcs.get(pos) or slots.get(pos) or "L{0}".format(pos)
+
+    for kind , start , size in table:
+        yield "; {0} {1}..{2}".format(section_names[kind],start,start + size)
+        if kind == packer.BSS:
+            for pos in sorted(pos for pos in objects if start <= pos < start + size):
+                yield "{0:<8} {1}".format(pos,objects[pos])
+        elif kind == packer.TEXT:
+            for pos , op , operand in text[start]:
+                if pos in funcs:
+                    yield ""
+                    yield funcs[pos] + ":"
+                elif pos in targets:
+                    yield label(pos) + ":"
+                if op is None:
+                    yield "{0:<8}     .quad {1}".format(pos,operand)
+                elif operand is None:
+                    yield "{0:<8}     {1}".format(pos,op)
+                elif op in branch_ops:
+                    yield "{0:<8}     {1:<5} {2:<22} ; {3}".format(pos,op,operand,label(operand))
+                elif operand in objects and op not in {"LEA","LLI","LLC","SLI","SLC","ENT","ADJ"}:
+                    yield "{0:<8}     {1:<5} {2:<22} ; {3}".format(pos,op,operand,objects[operand])
+                else:
+                    yield "{0:<8}     {1:<5} {2}".format(pos,op,operand)
+        else:
+            for pos in range(start,start + size,8):
+                raw = bytes(raw_image[pos:min(pos + 8,start + size)])
+                text_repr = "".join(chr(b) if 32 <= b <= 126 else "." for b in raw)
+                if pos in objects:
+                    comment = objects[pos]
+                elif pos in slots:
+                    comment = "JMP " + slots[pos]
+                else:
+                    comment = text_repr
+                yield "{0:<8} .quad {1:<22} ; {2}".format(pos,int.from_bytes(raw,'little',signed=True),comment)
+
+def dump(raw_image,stream,symbols: dict = None):
+    for line in lines(raw_image,symbols):
+        stream.write(line)
+        stream.write("\n")
+
+def write(raw_image,path: str,symbols: dict = None):
+    with open(path,'w',encoding='utf-8') as f:
+        dump(raw_image,f,symbols)
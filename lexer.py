@@ -1,7 +1,139 @@
+import re
 import builtins
-from common import Token
+from sys import intern
+from typing import Iterator
+from common import *
+
+# kind of the newline tokens tokenize_charwise sweeps out at the end
+TK_NEWLINE = -1
+
+# master pattern for the single-pass tokenizer
+# group 1 swallows the whitespace in front of a lexeme , group 2 is the
+# lexeme itself. alternatives are tried in order so longer operators come
+# first , the lexeme is then classified by its first character
+token_pattern = re.compile(r"""
+    ([ \t\r\f\v\n]*)
+    (
+      [A-Za-z_][A-Za-z0-9_]*
+    | //[^\n]*
+    | /\*(?:[^*]|\*(?!/))*(?:\*/|$)
+    | <<=?|>>=?|&&|\|\||\+\+|--|->|[-+*/^&|!<>=~%]=?|[()\[\]{},;.?:]
+    | 0x[0-9A-Fa-f]*|0[0-7]+|(?:0|[1-9][0-9]*)(?:\.[0-9]*|e-?[0-9]+)?
+    | '(?:\\.|[^\\'])*(?:'|$)
+    | "(?:\\.|[^\\"])*(?:"|$)
+    | \#[^\n]*
+    | .
+    )
+""",re.VERBOSE | re.DOTALL)
+
+# first character of a lexeme -> lexeme kind
+# identifiers and operators map straight to their token kind
+lexeme_kind = {}
+for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_":
+    lexeme_kind[c] = TK_IDENTIFIER
+for c in "+-*^&|!<>=~%()[]{},;.?:":
+    lexeme_kind[c] = TK_OPERATOR
+for c in "0123456789":
+    lexeme_kind[c] = "number"
+lexeme_kind['/']  = "slash" # operator or comment
+lexeme_kind['"']  = "string"
+lexeme_kind['\''] = "char"
+lexeme_kind['#']  = "macro"
+
+escape_pattern = re.compile(r"\\(x..|[0-7]{1,3}|.)",re.DOTALL)
+
+escape_table = {'n':'\n','t':'\t'}
+
+def unescape_match(matchobj) -> str:
+    esc = matchobj.group(1)
+    if esc[0] == 'x' and len(esc) == 3:
+        return builtins.chr(int(esc[1:],16))
+    if esc[0] in "01234567":
+        return builtins.chr(int(esc,8))
+    return escape_table.get(esc,esc)
+
+def unescape(body: str) -> str:
+    if '\\' not in body:
+        return body
+    return escape_pattern.sub(unescape_match,body)
+
+def number_token(text: str,line: int) -> Token:
+    if text[:2] == "0x":
+        return Token(TK_INTEGER,int(text[2:] or "0",16),line)
+    if '.' in text or 'e' in text:
+        return Token(TK_FLOAT,float(text),line)
+    if len(text) > 1 and text[0] == '0':
+        return Token(TK_INTEGER,int(text,8),line)
+    return Token(TK_INTEGER,int(text),line)
+
+def iter_tokens(src: str) -> Iterator[Token]:
+    '''
+    single pass tokenizer driven by token_pattern and lexeme_kind,
+    yields the same token stream as tokenize_charwise one token at a time
+    except where the old loop was wrong : lowercase hex digits (0xff is
+    255 , the loop raised ValueError) and octal escapes ('\\101' is 65 ,
+    the loop gave 1 and raised IndexError inside strings)
+    '''
+    kind_of = lexeme_kind.get
+    pending = None # [text,line] of the last string literal , held back for "a" "b" merging
+
+    line_cnt      = 1
+    at_line_start = True # no token emitted since last newline (for macros)
+    for space, text in map(re.Match.groups,token_pattern.finditer(src)):
+        if space and '\n' in space:
+            line_cnt += space.count('\n')
+            at_line_start = True
+        kind = kind_of(text[0])
+        if kind == TK_IDENTIFIER or kind == TK_OPERATOR:
+            tk = Token(kind,intern(text),line_cnt)
+        elif kind == "number":
+            tk = number_token(text,line_cnt)
+        elif kind == "slash":
+            if text == "/" or text == "/=":
+                tk = Token(TK_OPERATOR,intern(text),line_cnt)
+            else:
+                # comments
+                line_cnt += text.count('\n')
+                continue
+        elif kind == "string":
+            body = text[1:-1] if len(text) > 1 and text[-1] == '"' else text[1:]
+            buf  = unescape(body)
+            # merge "a" "b" to "ab"
+            if pending is not None:
+                pending[0] += buf
+            else:
+                pending = [buf,line_cnt]
+            line_cnt += text.count('\n')
+            at_line_start = False
+            continue
+        elif kind == "char":
+            body = text[1:-1] if len(text) > 1 and text[-1] == '\'' else text[1:]
+            buf  = unescape(body)
+            tk   = Token(TK_INTEGER,ord(buf[-1]) if buf else 0,line_cnt)
+            line_cnt += text.count('\n')
+        elif kind == "macro":
+            if not at_line_start:
+                continue # stray '#' in the middle of a line is discarded
+            tk = Token(TK_MACRO,text[1:],line_cnt)
+        else:
+            continue # unknown characters
+        at_line_start = False
+        if pending is not None:
+            yield Token(TK_STRING,*pending)
+            pending = None
+        yield tk
+
+    if pending is not None:
+        yield Token(TK_STRING,*pending)
 
 def tokenize(src: str) -> list[Token]:
+    return list(iter_tokens(src))
+
+def tokenize_charwise(src: str) -> list[Token]:
+    '''
+    reference char-by-char tokenizer, kept for cross-checking
+    and for bench/lexer_bench.py , see iter_tokens for where they differ
+    '''
     # tokenize config
     
     # identifier charset
@@ -21,7 +153,7 @@ def tokenize(src: str) -> list[Token]:
         if chr == '\n':
             # newline
             tokens.append(
-                Token("newline",chr,line_cnt)
+                Token(TK_NEWLINE,chr,line_cnt)
             )
             line_cnt += 1
             idx += 1
@@ -32,7 +164,7 @@ def tokenize(src: str) -> list[Token]:
                 buf += src[idx]
                 idx += 1
             tokens.append(
-                Token("identifier",buf,line_cnt)
+                Token(TK_IDENTIFIER,buf,line_cnt)
             )
         elif chr == "0":
             buf = "" ; idx += 1
@@ -42,7 +174,7 @@ def tokenize(src: str) -> list[Token]:
                     buf += src[idx]
                     idx += 1
                 tokens.append(
-                    Token("integer",int(buf,8),line_cnt)
+                    Token(TK_INTEGER,int(buf,8),line_cnt)
                 )
             elif idx < len(src) and src[idx] == 'x':
                 # hex mode
@@ -50,13 +182,13 @@ def tokenize(src: str) -> list[Token]:
                 while idx < len(src) and src[idx] in "0123456789ABCDEF":
                     buf += src[idx]
                     idx += 1
-                tokens.append(Token("integer",int(buf,16),line_cnt))
+                tokens.append(Token(TK_INTEGER,int(buf,16),line_cnt))
             elif idx < len(src) and src[idx] == '.': 
                 buf = "0." ; idx += 1
                 while idx < len(src) and src[idx] in "0123456789":
                     buf += src[idx]
                     idx += 1
-                tokens.append(Token("float",float(buf),line_cnt))
+                tokens.append(Token(TK_FLOAT,float(buf),line_cnt))
             elif idx < len(src) and src[idx] == 'e': 
                 buf = "0e" ; idx += 1
                 if idx < len(src) and src[idx] == '-':
@@ -65,9 +197,9 @@ def tokenize(src: str) -> list[Token]:
                 while idx < len(src) and src[idx] in "0123456789":
                     buf += src[idx]
                     idx += 1
-                tokens.append(Token("float",float(buf),line_cnt))
+                tokens.append(Token(TK_FLOAT,float(buf),line_cnt))
             else:
-                tokens.append(Token("integer",0,line_cnt))
+                tokens.append(Token(TK_INTEGER,0,line_cnt))
         elif chr in "123456789":
             # decimal mode
             buf = chr ; idx += 1 ; hasDot = False ; hasE = False
@@ -94,9 +226,9 @@ def tokenize(src: str) -> list[Token]:
                     buf += src[idx]
                     idx += 1
             if hasDot or hasE:
-                tokens.append(Token("float",float(buf),line_cnt))
+                tokens.append(Token(TK_FLOAT,float(buf),line_cnt))
             else:
-                tokens.append(Token("integer",int(buf),line_cnt))
+                tokens.append(Token(TK_INTEGER,int(buf),line_cnt))
         elif chr == "\'":
             buf = "\x00" ; idx += 1
             while idx < len(src) and src[idx] != '\'':
@@ -134,7 +266,7 @@ def tokenize(src: str) -> list[Token]:
                     buf = src[idx]
                     idx += 1
             idx += 1 # '
-            tokens.append(Token("integer",ord(buf),line_cnt))
+            tokens.append(Token(TK_INTEGER,ord(buf),line_cnt))
         elif chr == "\"":
             buf = "" ; idx += 1
             while idx < len(src) and src[idx] != '\"':
@@ -175,29 +307,29 @@ def tokenize(src: str) -> list[Token]:
 
             # merge "a" "b" to "ab"
             tidx = len(tokens) - 1
-            while tidx >= 0 and tokens[tidx].tktype == "newline":
+            while tidx >= 0 and tokens[tidx].tktype == TK_NEWLINE:
                 tidx -= 1
-            if tokens[tidx].tktype == "string":
+            if tokens[tidx].tktype == TK_STRING:
                 tokens[tidx].value += buf
             else:
-                tokens.append(Token("string",buf,line_cnt))
+                tokens.append(Token(TK_STRING,buf,line_cnt))
         elif chr in "+-*/^&|!<>=~%":
             idx += 1
             if idx < len(src) and src[idx] == "=":
                 # >= <= != == &= +=
-                tokens.append(Token("operator",chr + "=",line_cnt))
+                tokens.append(Token(TK_OPERATOR,chr + "=",line_cnt))
                 idx += 1
             elif chr in "&|+-<>" and idx < len(src) and src[idx] == chr:
                 # && || ++ -- >> <<
                 idx += 1
                 if chr in '<>' and idx < len(src) and src[idx] == '=':
-                    tokens.append(Token("operator",chr * 2 + '=',line_cnt))
+                    tokens.append(Token(TK_OPERATOR,chr * 2 + '=',line_cnt))
                     idx += 1
                 else:
-                    tokens.append(Token("operator",chr * 2,line_cnt))
+                    tokens.append(Token(TK_OPERATOR,chr * 2,line_cnt))
             elif chr == '-' and idx < len(src) and src[idx] == '>':
                 idx += 1
-                tokens.append(Token("operator",'->',line_cnt))
+                tokens.append(Token(TK_OPERATOR,'->',line_cnt))
             elif chr == '/' and idx < len(src):
                 if src[idx] == '/':
                     while idx < len(src) and src[idx] != '\n':
@@ -214,22 +346,22 @@ def tokenize(src: str) -> list[Token]:
                             idx += 1
                             break
                 else:
-                    tokens.append(Token("operator",chr,line_cnt))
+                    tokens.append(Token(TK_OPERATOR,chr,line_cnt))
             else:
-                tokens.append(Token("operator",chr,line_cnt))
+                tokens.append(Token(TK_OPERATOR,chr,line_cnt))
         elif chr in "()[]{},;.?:":
             # one char operator with no combiner
             idx += 1
-            tokens.append(Token("operator",chr,line_cnt))
+            tokens.append(Token(TK_OPERATOR,chr,line_cnt))
         elif chr == '#':
             # macros
-            if not tokens or tokens[-1].tktype == "newline":
+            if not tokens or tokens[-1].tktype == TK_NEWLINE:
                 idx += 1
                 buf = ""
                 while idx < len(src) and src[idx] != '\n':
                     buf += src[idx]
                     idx += 1
-                tokens.append(Token("macro",buf,line_cnt))
+                tokens.append(Token(TK_MACRO,buf,line_cnt))
             else:
                 while idx < len(src) and src[idx] != '\n':
                     idx += 1
@@ -241,14 +373,14 @@ def tokenize(src: str) -> list[Token]:
                 while idx < len(src) and src[idx] in "0123456789":
                     buf += src[idx]
                     idx += 1
-                tokens.append(Token("float",float(buf),line_cnt))
+                tokens.append(Token(TK_FLOAT,float(buf),line_cnt))
         else:
             idx += 1
 
     # remove newline from token stream
     swept_tokens = []
     for tk in tokens:
-        if tk.tktype == "newline":
+        if tk.tktype == TK_NEWLINE:
             continue
         swept_tokens.append(tk)
     return swept_tokens
\ No newline at end of file
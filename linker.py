@@ -0,0 +1,197 @@
+'''
+object files and the linker turning them into one image
+
+an object file (little endian qwords) : magic , block size , then the
+(start,size) of its bss , data , rodata and text sections , the reloc ,
+symbol and import counts , the relocs , every symbol as its kind , start ,
+size , name length and the name padded to 8 bytes , every import as its
+slot , name length and padded name , then the block without its bss
+
+link lays the units out section by section ([_main slot , every bss ,
+every data , every rodata , every text]) , keeping each section at its
+old address modulo 8 , and rebases the relocated words. the bytecode
+passes already ran per unit , so linking does no code work. an import , or a second
+definition of a zero-initialised global of the same size (a common
+symbol) , is an alias : positions inside it are sent to the definition
+'''
+
+import bisect
+import codegen
+from codegen import ObjectFile , RawImage
+from packer import align_up , symbol_kinds
+
+OBJECT = int.from_bytes(b"c4ob",'little') | 1 << 32
+
+section_names = ("bss","data","rodata","text")
+
+class LinkError(Exception):
+    pass
+
+def qwords(*xs) -> bytes:
+    return b''.join(x.to_bytes(8,'little',signed=True) for x in xs)
+
+def name_bytes(name: str) -> bytes:
+    encoded = name.encode()
+    return qwords(len(encoded)) + encoded + b'\0' * (align_up(len(encoded),8) - len(encoded))
+
+def dump_object(obj: ObjectFile) -> bytes:
+    fields = [OBJECT,len(obj.block)]
+    for name in section_names:
+        fields.extend(getattr(obj,name))
+    fields.extend((len(obj.relocs),len(obj.symbols),len(obj.imports)))
+    res = bytearray(qwords(*fields))
+    res.extend(qwords(*obj.relocs))
+    for name , (kind , start , size) in obj.symbols.items():
+        res.extend(qwords(symbol_kinds[kind],start,size) + name_bytes(name))
+    for name , slot in obj.imports.items():
+        res.extend(qwords(slot) + name_bytes(name))
+    bss_start , bss_size = obj.bss
+    block = obj.block[:bss_start] + obj.block[bss_start + bss_size:] # bss is zeros
+    res.extend(block + b'\0' * (align_up(len(block),8) - len(block)))
+    return bytes(res)
+
+def load_object(data: bytes) -> ObjectFile:
+    pos = 0
+    def qword() -> int:
+        nonlocal pos
+        pos += 8
+        return int.from_bytes(data[pos - 8:pos],'little',signed=True)
+    def name() -> str:
+        nonlocal pos
+        length = qword()
+        res = data[pos:pos + length].decode()
+        pos += align_up(length,8)
+        return res
+
+    if len(data) < 8 or qword() != OBJECT:
+        raise LinkError("not an object file")
+    block_size = qword()
+    obj = ObjectFile(None)
+    for section in section_names:
+        setattr(obj,section,(qword(),qword()))
+    reloc_count , symbol_count , import_count = qword() , qword() , qword()
+    obj.relocs = [qword() for _ in range(reloc_count)]
+    rev_kinds = {v: k for k, v in symbol_kinds.items()}
+    for _ in range(symbol_count):
+        kind , start , size = rev_kinds[qword()] , qword() , qword()
+        obj.symbols[name()] = (kind,start,size)
+    for _ in range(import_count):
+        slot = qword()
+        obj.imports[name()] = slot
+    bss_start , bss_size = obj.bss
+    stored = data[pos:pos + block_size - bss_size]
+    obj.block = bytearray(stored[:bss_start]) + bytearray(bss_size) + stored[bss_start:]
+    return obj
+
+def write_object(obj: ObjectFile,path: str):
+    with open(path,'wb') as f:
+        f.write(dump_object(obj))
+
+def read_object(path: str) -> ObjectFile:
+    with open(path,'rb') as f:
+        return load_object(f.read())
+
+class Unit:
+    '''an object placed in the image , ranges map its positions to the image'''
+    def __init__(self,obj: ObjectFile):
+        self.obj     = obj
+        self.starts  = [] # sorted unit starts of the placed sections
+        self.ranges  = [] # (start,size,image start) in the same order
+        self.aliases = [] # (start,size,image start) of imports and commons
+
+    def place(self,start: int,size: int,at: int):
+        idx = bisect.bisect(self.starts,start)
+        self.starts.insert(idx,start)
+        self.ranges.insert(idx,(start,size,at))
+
+    def position(self,pos: int) -> int:
+        '''image position of the unit position pos'''
+        for start , size , at in self.aliases:
+            if start <= pos < start + size:
+                return at + pos - start
+        idx = bisect.bisect(self.starts,pos) - 1
+        if idx < 0:
+            raise LinkError("position {0} outside every section".format(pos))
+        start , _ , at = self.ranges[idx]
+        return at + pos - start
+
+def is_common(obj: ObjectFile,symbol: tuple) -> bool:
+    kind , start , size = symbol
+    bss_start , bss_size = obj.bss
+    return kind == "object" and bss_start <= start and start + size <= bss_start + bss_size
+
+def resolve(units: list) -> tuple:
+    '''
+    name:(unit,symbol) of every definition and the (unit,name,symbol)
+    of the common symbols defined again
+    '''
+    defined = {}
+    commons = []
+    for unit in units:
+        for name , symbol in unit.obj.symbols.items():
+            if name not in defined:
+                defined[name] = (unit,symbol)
+                continue
+            first_unit , first = defined[name]
+            if not (is_common(unit.obj,symbol) and is_common(first_unit.obj,first) and symbol[2] == first[2]):
+                raise LinkError("duplicate symbol {0}".format(name))
+            commons.append((unit,name,symbol))
+    for unit in units:
+        for name in unit.obj.imports:
+            if name not in defined or defined[name][1][0] != "func":
+                raise LinkError("undefined symbol {0}".format(name))
+    if "main" not in defined or defined["main"][1][0] != "func":
+        raise LinkError("undefined symbol main")
+    return defined , commons
+
+def link(objects: list) -> RawImage:
+    '''resolve and relocate objects into one RawImage for packer.packer'''
+    units = [Unit(obj) for obj in objects]
+    defined , commons = resolve(units)
+
+    # layout , the _main slot first then one section kind after the other
+    block = bytearray(codegen.i64(codegen.opcode["JMP"]) + codegen.i64(0))
+    kind_ranges = {}
+    for name in section_names:
+        if name == "text":
+            block.extend(b'\0' * (align_up(len(block),8) - len(block)))
+        kind_start = len(block)
+        for unit in units:
+            start , size = getattr(unit.obj,name)
+            block.extend(b'\0' * ((start - len(block)) % 8))
+            if size != 0:
+                unit.place(start,size,len(block))
+            block.extend(unit.obj.block[start:start + size])
+        if name in ["bss","rodata"]:
+            block.extend(b'\0' * (align_up(len(block),8) - len(block)))
+        kind_ranges[name] = (kind_start,len(block) - kind_start)
+
+    for name , (unit , (_ , start , _)) in defined.items():
+        definition = unit.position(start)
+        for other in units:
+            if other is not unit and name in other.obj.imports:
+                other.aliases.append((other.obj.imports[name],16,definition))
+    for unit , name , (_ , start , size) in commons:
+        first_unit , first = defined[name]
+        unit.aliases.append((start,size,first_unit.position(first[1])))
+
+    # relocation
+    for unit in units:
+        for pos in unit.obj.relocs:
+            value = int.from_bytes(unit.obj.block[pos:pos + 8],'little',signed=True)
+            at    = unit.position(pos)
+            block[at:at + 8] = codegen.i64(unit.position(value))
+    main_unit , main = defined["main"]
+    main_slot = main_unit.position(main[1])
+    block[8:16] = block[main_slot + 8:main_slot + 16]
+
+    res = RawImage(block)
+    res.bss     = kind_ranges["bss"]
+    res.rodata  = kind_ranges["rodata"]
+    res.symbols = {}
+    for name , (unit , (kind , start , _)) in defined.items():
+        at = unit.position(start)
+        if kind == "func":
+            at = int.from_bytes(block[at + 8:at + 16],'little',signed=True)
+        res.symbols[name] = (kind,at)
+    return res
@@ -0,0 +1,260 @@
+'''
+AST level optimisations , run between parser.parse and codegen.entry.
+folding follows what the VM would compute : 64 bit wrapping integers ,
+C division and remainder , doubles only where codegen emits F* opcodes
+'''
+
+import math
+from common import *
+from parser import SymTable
+from codegen import type_size
+
+INT64_MIN = -(1 << 63)
+
+def wrap(x: int) -> int:
+    '''to a signed 64 bit value'''
+    return ((x - INT64_MIN) & 0xffffffffffffffff) + INT64_MIN
+
+def c_div(a: int,b: int) -> int:
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def c_mod(a: int,b: int) -> int:
+    return a - b * c_div(a,b)
+
+def is_double(var_type) -> bool:
+    return type(var_type) == C_Basetype and var_type.typename in ["float","double"]
+
+# integer operators : nodeType to fold function , None when not foldable
+integer_operators = {
+    "add"    : lambda a,b: a + b,
+    "sub"    : lambda a,b: a - b,
+    "mul"    : lambda a,b: a * b,
+    "div"    : lambda a,b: c_div(a,b) if b != 0 and not (a == INT64_MIN and b == -1) else None,
+    "mod"    : lambda a,b: c_mod(a,b) if b != 0 and not (a == INT64_MIN and b == -1) else None,
+    "shl"    : lambda a,b: a << b if 0 <= b < 64 else None,
+    "shr"    : lambda a,b: a >> b if 0 <= b < 64 else None,
+    "bitand" : lambda a,b: a & b,
+    "bitor"  : lambda a,b: a | b,
+    "bitxor" : lambda a,b: a ^ b,
+    "eq"     : lambda a,b: int(a == b),
+    "ne"     : lambda a,b: int(a != b),
+    "lt"     : lambda a,b: int(a <  b),
+    "gt"     : lambda a,b: int(a >  b),
+    "le"     : lambda a,b: int(a <= b),
+    "ge"     : lambda a,b: int(a >= b),
+}
+
+# double operators , an integer operand is converted first (I2F)
+double_operators = {
+    "add"    : lambda a,b: a + b,
+    "sub"    : lambda a,b: a - b,
+    "mul"    : lambda a,b: a * b,
+    "div"    : lambda a,b: a / b if b != 0 else None,
+}
+
+class Folder:
+    '''
+    constant folding and algebraic simplification. nodes are rebuilt
+    only where something changed , folded counts rewrites per rule
+    '''
+    def __init__(self):
+        self.folded = {}
+
+    def count(self,rule: str):
+        self.folded[rule] = self.folded.get(rule,0) + 1
+
+    def fold(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        if node is None:
+            return None
+        nodeType = node.nodeType
+        if nodeType == "function":
+            symtable = node.metas[2]
+        elif nodeType == "actions" or nodeType == "program":
+            symtable = node.metas[0]
+        elif nodeType == "sizeof":
+            return self.fold_sizeof(node,symtable)
+        elif nodeType == "initlist":
+            return self.fold_initlist(node,symtable)
+        elif nodeType == "var":
+            symItem = symtable.get((node.metas[0],))
+            if symItem is not None and type(symItem[1]) == C_Const:
+                self.count("enum")
+                return ASTNode("integer",[],(symItem[1].value,))
+            return node
+
+        old_children = node.children
+        children = [self.fold(child,symtable) for child in old_children]
+        if any(new is not old for new , old in zip(children,old_children)):
+            node = ASTNode(nodeType,children,node.metas)
+
+        handler = fold_handlers.get(nodeType)
+        if handler is not None:
+            return handler(self,node,symtable)
+        return node
+
+    def fold_binary(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        lhs , rhs = node.children
+        nodeType  = node.nodeType
+        if lhs is None or rhs is None:
+            return node
+        if lhs.nodeType == "integer" and rhs.nodeType == "integer":
+            value = integer_operators[nodeType](lhs.metas[0],rhs.metas[0])
+            if value is not None:
+                self.count("integer")
+                return ASTNode("integer",[],(wrap(value),))
+        elif nodeType in double_operators \
+                and lhs.nodeType in ["integer","float"] and rhs.nodeType in ["integer","float"]:
+            value = double_operators[nodeType](float(lhs.metas[0]),float(rhs.metas[0]))
+            if value is not None:
+                self.count("double")
+                return ASTNode("float",[],(value,))
+        return self.simplify(node,symtable)
+
+    def simplify(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        '''identities , only over integer operands so the result type is kept'''
+        lhs , rhs = node.children
+        nodeType  = node.nodeType
+        lconst = lhs.metas[0] if lhs.nodeType == "integer" else None
+        rconst = rhs.metas[0] if rhs.nodeType == "integer" else None
+        if nodeType == "add":
+            if rconst == 0 and self.is_integer(lhs,symtable):
+                self.count("x+0")
+                return lhs
+            if lconst == 0 and self.is_integer(rhs,symtable):
+                self.count("x+0")
+                return rhs
+        elif nodeType == "sub":
+            if rconst == 0 and self.is_integer(lhs,symtable):
+                self.count("x-0")
+                return lhs
+        elif nodeType == "mul":
+            if rconst == 1 and self.is_integer(lhs,symtable):
+                self.count("x*1")
+                return lhs
+            if lconst == 1 and self.is_integer(rhs,symtable):
+                self.count("x*1")
+                return rhs
+            if rconst == 0 and self.is_pure_integer(lhs,symtable) \
+                    or lconst == 0 and self.is_pure_integer(rhs,symtable):
+                self.count("x*0")
+                return ASTNode("integer",[],(0,))
+        return node
+
+    def is_integer(self,node: ASTNode,symtable: SymTable) -> bool:
+        '''whether node is known to be a plain integer (not double , pointer or array)'''
+        if node.nodeType == "integer":
+            return True
+        if node.nodeType == "var":
+            symItem = symtable.get((node.metas[0],))
+            return symItem is not None and type(symItem[1]) == C_Var \
+                and type(symItem[1].oftype) == C_Basetype and not is_double(symItem[1].oftype)
+        if node.nodeType in integer_operators and node.nodeType not in double_operators:
+            return True
+        if node.nodeType in double_operators:
+            return all(child is not None and self.is_integer(child,symtable) for child in node.children)
+        return False
+
+    def is_pure_integer(self,node: ASTNode,symtable: SymTable) -> bool:
+        '''an integer whose evaluation has no side effect , so it can be dropped'''
+        if node.nodeType in ["integer","var"]:
+            return self.is_integer(node,symtable)
+        if node.nodeType in integer_operators:
+            return all(child is not None and self.is_pure_integer(child,symtable) for child in node.children) \
+                and self.is_integer(node,symtable)
+        return False
+
+    def fold_and(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        # lhs ; BZ exit ; rhs ; exit : the value is lhs when it is 0 , rhs otherwise
+        lhs , rhs = node.children
+        if lhs is not None and lhs.nodeType == "integer":
+            self.count("logic")
+            return lhs if lhs.metas[0] == 0 else rhs
+        return node
+
+    def fold_or(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        # lhs ; BNZ exit ; rhs ; exit : the value is lhs unless it is 0
+        lhs , rhs = node.children
+        if lhs is not None and lhs.nodeType == "integer":
+            self.count("logic")
+            return lhs if lhs.metas[0] != 0 else rhs
+        return node
+
+    def fold_unary(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        child = node.children[0]
+        if child is None:
+            return node
+        if child.nodeType == "integer":
+            value = child.metas[0]
+            if node.nodeType == "neg":
+                value = wrap(-value)
+            elif node.nodeType == "not":
+                value = int(value == 0)
+            elif node.nodeType == "bitnot":
+                value = ~value
+            self.count("unary")
+            return ASTNode("integer",[],(value,))
+        if child.nodeType == "float" and node.nodeType == "neg":
+            self.count("unary")
+            return ASTNode("float",[],(0.0 - child.metas[0],)) # gen_neg's FSUB , so -0.0 stays 0.0
+        return node
+
+    def fold_as(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        child , target_type = node.children[0] , node.metas[0]
+        if child is None or type(target_type) != C_Basetype:
+            return node
+        if child.nodeType == "integer":
+            self.count("cast")
+            if is_double(target_type):
+                return ASTNode("float",[],(float(child.metas[0]),))
+            return child # integer casts emit nothing
+        if child.nodeType == "float":
+            if is_double(target_type):
+                self.count("cast")
+                return child
+            value = child.metas[0]
+            if math.isfinite(value) and INT64_MIN <= int(value) < -INT64_MIN:
+                self.count("cast")
+                return ASTNode("integer",[],(int(value),))
+        return node
+
+    def fold_sizeof(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        # the two forms gen_sizeof understands
+        child = node.children[0]
+        if child is None:
+            return node
+        if child.nodeType == "var":
+            symItem = symtable.get((child.metas[0],))
+            if symItem is None or type(symItem[1]) != C_Var:
+                return node
+            sztype = symItem[1].oftype
+        elif child.nodeType == "as":
+            sztype = child.metas[0]
+        else:
+            return node
+        self.count("sizeof")
+        return ASTNode("integer",[],(type_size(sztype),))
+
+    def fold_initlist(self,node: ASTNode,symtable: SymTable) -> ASTNode:
+        def fold_entries(lst: list) -> list:
+            res = []
+            for key , value in lst:
+                if type(value) == list:
+                    res.append((key,fold_entries(value)))
+                else:
+                    res.append((key,self.fold(value,symtable)))
+            return res
+        return ASTNode("initlist",[],(fold_entries(node.metas[0]),))
+
+fold_handlers = {
+    **{nodeType: Folder.fold_binary for nodeType in integer_operators},
+    "and"    : Folder.fold_and,
+    "or"     : Folder.fold_or,
+    "neg"    : Folder.fold_unary,
+    "not"    : Folder.fold_unary,
+    "bitnot" : Folder.fold_unary,
+    "as"     : Folder.fold_as,
+}
+
+def fold(astroot: ASTNode) -> ASTNode:
+    return Folder().fold(astroot,astroot.metas[0])
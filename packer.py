@@ -1,4 +1,27 @@
-def packer(raw_image : bytes,ratio = 2,fixspace = None,stackspace = None) -> bytes:
+'''
+image formats understood by the c4vm loader
+
+    plain : virtual size , then the raw image
+    v2    : a header page , then the file backed sections at file offsets
+            congruent to their address modulo PAGE so the loader can mmap
+            them , then the symbol table
+
+v2 header (little endian qwords) : magic , virtual size , entry , section
+count , symbol table offset , symbol count , then per section its kind ,
+address , size and file offset (0 when not in the file). a symbol is its
+kind , value , name length and the name padded to 8 bytes
+'''
+
+IMAGE_V2 = int.from_bytes(b"c4vm",'little') | 2 << 32
+PAGE     = 4096
+
+# section kinds
+TEXT , RODATA , DATA , BSS , STACK = 1 , 2 , 3 , 4 , 5
+
+# symbol kinds
+symbol_kinds = {"object": 1,"func": 2}
+
+def packer(raw_image : bytes,ratio = 2,fixspace = None,stackspace = None,symbols = True) -> bytes:
     '''
     this packer packs the raw image (with absolute location) 
     into a image that can be loaded by our c4vm loader
@@ -6,22 +29,127 @@ def packer(raw_image : bytes,ratio = 2,fixspace = None,stackspace = None) -> byt
     ratio    = (preloaded virtual space) / (.data + .text space)
     fixspace : if ratio is not set, you can set the entire space 
     stackspace : if both above are not set, you may set this just for stack
+
+    a codegen.RawImage is packed as v2 (with its symbol table unless
+    symbols is False) , plain bytes in the plain format
     '''
 
     raw_size = len(raw_image)
     if ratio is not None:
         virtual_size = int(raw_size * ratio)
-        return virtual_size.to_bytes(8,'little') + raw_image
     elif fixspace is not None:
         fixspace : int
-        return fixspace.to_bytes(8,'little') + raw_image
+        virtual_size = fixspace
     elif stackspace is not None:
-        return (raw_size + stackspace).to_bytes(8,'little') + raw_image
-    return b''
+        virtual_size = raw_size + stackspace
+    else:
+        return b''
+
+    if not hasattr(raw_image,"symbols"):
+        return virtual_size.to_bytes(8,'little') + raw_image
+    return pack_v2(raw_image,virtual_size,raw_image.symbols if symbols else {})
+
+def sections(raw_image) -> list:
+    '''[(kind,address,size)] in address order , empty ones left out'''
+    bss_start , bss_size = raw_image.bss
+    ro_start  , ro_size  = raw_image.rodata
+    raw_size  = len(raw_image)
+    if ro_size == 0:
+        ro_start = raw_size
+    text_start = ro_start + ro_size
+    res = [
+        (DATA  ,0                    ,bss_start),
+        (BSS   ,bss_start            ,bss_size),
+        (DATA  ,bss_start + bss_size ,ro_start - bss_start - bss_size),
+        (RODATA,ro_start             ,ro_size),
+        (TEXT  ,text_start           ,raw_size - text_start),
+    ]
+    merged = []
+    for kind , start , size in res:
+        if size == 0:
+            continue
+        if merged and merged[-1][0] == kind:
+            merged[-1] = (kind,merged[-1][1],merged[-1][2] + size)
+        else:
+            merged.append((kind,start,size))
+    return merged
+
+def align_up(x: int,align: int) -> int:
+    return (x + align - 1) // align * align
+
+def pack_v2(raw_image,virtual_size: int,symbols: dict) -> bytes:
+    raw_size = len(raw_image)
+    table    = sections(raw_image)
+    table.append((STACK,raw_size,virtual_size - raw_size))
+    # small images are not worth a padded page per run of sections
+    align    = PAGE if raw_size - raw_image.bss[1] >= 16 * PAGE else 8
+
+    # a bss not covering a whole page shares pages with its neighbours ,
+    # so its zeros are stored
+    def stored(kind: int,start: int,size: int) -> bool:
+        if kind == STACK:
+            return False
+        if kind == BSS:
+            return (start + size) // align * align < align_up(start,align)
+        return True
+
+    header_size = 8 * 6 + 8 * 4 * len(table)
+    body    = bytearray()
+    entries = []
+    pos     = header_size
+    run_end = None # address where the current run of stored sections ends
+    for kind , start , size in table:
+        if not stored(kind,start,size):
+            entries.append((kind,start,size,0))
+            continue
+        if start != run_end:
+            pad = align_up(pos,align) + start % align - pos
+            body.extend(b'\0' * pad)
+            pos += pad
+        entries.append((kind,start,size,pos))
+        body.extend(raw_image[start:start + size])
+        pos    += size
+        run_end = start + size
+
+    symtab = bytearray()
+    for name , (kind , value) in symbols.items():
+        encoded = name.encode()
+        symtab.extend(b''.join(x.to_bytes(8,'little',signed=True) for x in (symbol_kinds[kind],value,len(encoded))))
+        symtab.extend(encoded + b'\0' * (align_up(len(encoded),8) - len(encoded)))
+    symtab_offset = align_up(pos,8)
+    body.extend(b'\0' * (symtab_offset - pos))
+    body.extend(symtab)
+
+    entry  = int.from_bytes(raw_image[8:16],'little',signed=True) if raw_size >= 16 else 0
+    fields = [IMAGE_V2,virtual_size,entry,len(entries),symtab_offset if symtab else 0,len(symbols)]
+    for section in entries:
+        fields.extend(section)
+    header = b''.join(x.to_bytes(8,'little',signed=True) for x in fields)
+    return header + body
+
+def unpack_v2(image: bytes) -> dict:
+    '''the header of a v2 image as a dict , with its sections and symbols'''
+    def qword(pos: int) -> int:
+        return int.from_bytes(image[pos:pos + 8],'little',signed=True)
+    assert qword(0) == IMAGE_V2
+    count = qword(24)
+    res = {
+        "virtual_size" : qword(8),
+        "entry"        : qword(16),
+        "sections"     : [tuple(qword(48 + 32 * i + 8 * j) for j in range(4)) for i in range(count)],
+        "symbols"      : {},
+    }
+    rev_kinds = {v: k for k, v in symbol_kinds.items()}
+    pos = qword(32)
+    for _ in range(qword(40) if pos else 0):
+        kind , value , length = qword(pos) , qword(pos + 8) , qword(pos + 16)
+        res["symbols"][image[pos + 24:pos + 24 + length].decode()] = (rev_kinds[kind],value)
+        pos += 24 + align_up(length,8)
+    return res
 
 def qword_array(raw_image: bytes) -> list:
     res = []
     for i in range(0,len(raw_image),8):
         qword = raw_image[i:i+8]
         res.append(int.from_bytes(qword,'little',signed=True))
-    return res
\ No newline at end of file
+    return res
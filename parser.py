@@ -1,14 +1,18 @@
+from typing import Iterable
 from common import *
 
-class Ref:
-    def __init__(self,val):
-        self.val = val
-    def __repr__(self):
-        return "Ref({0})".format(self.val)
-
 REPR_SYMTABLE = False
 
+MISSING = object()
+
 class SymTable:
+    '''
+    the symbols one scope declared , kept in ASTNode.metas for codegen.
+    get falls back to the enclosing scopes and remembers what it found
+    there , so it should only be used once parsing is done
+    '''
+    __slots__ = ("mapper","father","resolved")
+
     mapper : dict
     father : "SymTable"
 
@@ -17,12 +21,16 @@ class SymTable:
             self.mapper = {}
         else:
             self.mapper = mapper
-        self.father = father
+        self.father   = father
+        self.resolved = {}
     def get(self,sym):
-        if sym in self.mapper and self.mapper is not None:
+        if sym in self.mapper:
             return self.mapper[sym]
-        if self.father:
-            return self.father.get(sym)
+        val = self.resolved.get(sym,MISSING)
+        if val is MISSING:
+            val = self.father.get(sym) if self.father else None
+            self.resolved[sym] = val
+        return val
     def set(self,sym,val):
         self.mapper[sym] = val
     def derive(self):
@@ -32,652 +40,712 @@ class SymTable:
             return "SymTable(mapper={0},father={1})".format(self.mapper,self.father)
         return "..."
 
-def parse(tokens: list[Token]) -> ASTNode:
-    idx = Ref(0)
-    return program(idx,tokens)
+class ScopeStack:
+    '''
+    flat symbol table used while parsing. symbol keys (name tuples) are
+    interned to integer ids and bindings[id] stacks the visible values ,
+    innermost last , so a lookup never walks the enclosing scopes.
+    every open scope is a SymTable recording what it declared
+    '''
+    __slots__ = ("ids","bindings","scopes")
+
+    def __init__(self,root: SymTable):
+        self.ids      = {} # name tuple:symbol id
+        self.bindings = [] # symbol id:[values]
+        self.scopes   = [] # open scopes , innermost last
+        self.push(root)
+
+    def intern(self,sym) -> int:
+        sid = self.ids.get(sym)
+        if sid is None:
+            sid = self.ids[sym] = len(self.bindings)
+            self.bindings.append([])
+        return sid
+
+    def get(self,sym):
+        sid = self.ids.get(sym)
+        if sid is not None and (stack := self.bindings[sid]):
+            return stack[-1]
+        return None
+
+    def set(self,sym,val):
+        scope = self.scopes[-1]
+        stack = self.bindings[self.intern(sym)]
+        if sym in scope.mapper:
+            stack[-1] = val # redeclared in the same scope
+        else:
+            stack.append(val)
+        scope.mapper[sym] = val
+
+    def scope(self) -> SymTable:
+        return self.scopes[-1]
+
+    def push(self,scope: SymTable = None) -> SymTable:
+        if scope is None:
+            scope = SymTable(father=self.scopes[-1] if self.scopes else None)
+        for sym , val in scope.mapper.items():
+            self.bindings[self.intern(sym)].append(val)
+        self.scopes.append(scope)
+        return scope
+
+    def pop(self) -> SymTable:
+        scope = self.scopes.pop()
+        for sym in scope.mapper:
+            self.bindings[self.ids[sym]].pop()
+        return scope
+
+def parse(tokens: Iterable[Token],arena: ASTArena = None) -> ASTNode:
+    '''builds ASTNode trees , or ASTViews stored in arena when one is given'''
+    return Parser(tokens,arena).program()
+
+# builtin types of the global scope , built once per process
+root_entries = {
+    ("void",):("type",C_Basetype("void")),
+    ("char",):("type",C_Basetype("char")),
+    ("short",):("type",C_Basetype("short")),
+    ("int",):("type",C_Basetype("int")),
+    ("long",):("type",C_Basetype("long")),
+    ("long","long"):("type",C_Basetype("long long")),
+
+    ("signed",):("type",C_Basetype("signed")),
+    ("unsigned",):("type",C_Basetype("unsigned")),
+
+    ("float",):("type",C_Basetype("float")),
+    ("double",):("type",C_Basetype("double")),
+    
+    ("unsigned","char"):("type",C_Basetype("unsigned char")),
+    ("unsigned","short"):("type",C_Basetype("unsigned short")),
+    ("unsigned","int"):("type",C_Basetype("unsigned int")),
+    ("unsigned","long"):("type",C_Basetype("unsigned long")),
+    ("unsigned","long","long"):("type",C_Basetype("unsigned long long")),
+
+    ("signed","char"):("type",C_Basetype("signed char")),
+    ("signed","short"):("type",C_Basetype("signed short")),
+    ("signed","int"):("type",C_Basetype("signed int")),
+    ("signed","long"):("type",C_Basetype("signed long")),
+    ("signed","long","long"):("type",C_Basetype("signed long long")),
+
+    ("struct",):("metatype",C_Metatype("struct")),
+    ("union",):("metatype",C_Metatype("union")),
+    ("enum",):("metatype",C_Metatype("enum")),
+
+    ("typedef",):("typedef",C_Typedef(None))
+}
+
+# ("type",C_Type)
+# ("metatype",C_Metatype)
+# ("var",C_Var)
+# ("const",C_Const)
+
+def rootTable() -> SymTable:
+    '''a fresh global scope , the builtin types are shared and never mutated'''
+    return SymTable(dict(root_entries))
+
+class Parser:
+    '''
+    recursive descent parser over a token iterable. tokens are pulled on
+    demand into window (holding tokens[offset:offset + len(window)]) and
+    released at top-level declarations , where the parser never rewinds.
+    declarations , casts and expressions are told apart with one token of
+    lookahead (at_type) , rescanned counts tokens parsed again after a
+    rewind
+    '''
+    __slots__ = ("source","window","offset","exhausted","pos","symbols","rescanned","node")
+
+    def __init__(self,tokens: Iterable[Token],arena: ASTArena = None):
+        self.source    = iter(tokens)
+        self.window    = []
+        self.offset    = 0
+        self.exhausted = False
+        self.pos       = 0 # cursor , absolute token index
+        self.symbols   = ScopeStack(rootTable())
+        self.rescanned = 0
+        self.node      = ASTNode if arena is None else arena.node # node factory
+
+    def available(self,pos: int) -> bool:
+        if pos - self.offset < len(self.window):
+            return True
+        while not self.exhausted and pos - self.offset >= len(self.window):
+            tk = next(self.source,None)
+            if tk is None:
+                self.exhausted = True
+            else:
+                self.window.append(tk)
+        return pos - self.offset < len(self.window)
+
+    def release(self):
+        '''drop every token before the cursor'''
+        del self.window[:self.pos - self.offset]
+        self.offset = self.pos
 
-def tools(idx: Ref, tokens: list[Token]) -> tuple:
     # tool functions for pattern matching
-    def peek():
-        if idx.val < len(tokens):
-            return tokens[idx.val]
+
+    def peek(self) -> Token:
+        rel = self.pos - self.offset
+        if rel < len(self.window) or self.available(self.pos):
+            return self.window[rel]
         return None
 
-    def match(tktype=None,value=None):
-        tk = peek()
+    def match(self,tktype=None,value=None) -> Token:
+        tk = self.peek()
         if tk is None:return None
         if tktype is not None and tktype != tk.tktype: return None
         if value  is not None and value  != tk.value:  return None
-        idx.val += 1
+        self.pos += 1
         return tk
 
-    def peekN(n: int):
+    def peekN(self,n: int) -> list:
         res = []
         for didx in range(n):
-            if idx.val + didx < len(tokens):
-                res.append(tokens[idx.val + didx])
+            if self.available(self.pos + didx):
+                res.append(self.window[self.pos + didx - self.offset])
             else:
                 res.append(None)
         return res
 
-    def matchN(lst: list):
+    def rewind(self,pos: int):
+        self.rescanned += self.pos - pos
+        self.pos = pos
+
+    def at_type(self,ahead: int = 0) -> bool:
+        '''whether a type name starts ahead tokens past the cursor'''
+        if not self.available(self.pos + ahead):
+            return False
+        tk = self.window[self.pos + ahead - self.offset]
+        if tk.tktype != TK_IDENTIFIER:
+            return False
+        symItem = self.symbols.get((tk.value,))
+        return symItem is not None and symItem[0] in type_kinds
+
+    def matchN(self,lst: list) -> list:
         # [(tktype,value)]
-        res = []
-        for didx,(tktype,value) in enumerate(lst):
-            if idx.val + didx < len(tokens):
-                if tktype is not None and tktype != tokens[idx.val + didx].tktype:
-                    return None 
-                if value  is not None and value  != tokens[idx.val + didx].value:
-                    return None
-                res.append(tokens[idx.val + didx])
-            else:
+        res = self.peekN(len(lst))
+        for tk,(tktype,value) in zip(res,lst):
+            if tk is None:
+                return None
+            if tktype is not None and tktype != tk.tktype:
                 return None
-        idx.val += len(lst)
+            if value  is not None and value  != tk.value:
+                return None
+        self.pos += len(lst)
         return res
 
-    return peek,match,peekN,matchN
-
-def rootTable() -> SymTable:
-    symtable = SymTable({
-        ("void",):("type",C_Basetype("void")),
-        ("char",):("type",C_Basetype("char")),
-        ("short",):("type",C_Basetype("short")),
-        ("int",):("type",C_Basetype("int")),
-        ("long",):("type",C_Basetype("long")),
-        ("long","long"):("type",C_Basetype("long long")),
-
-        ("signed",):("type",C_Basetype("signed")),
-        ("unsigned",):("type",C_Basetype("unsigned")),
-
-        ("float",):("type",C_Basetype("float")),
-        ("double",):("type",C_Basetype("double")),
-        
-        ("unsigned","char"):("type",C_Basetype("unsigned char")),
-        ("unsigned","short"):("type",C_Basetype("unsigned short")),
-        ("unsigned","int"):("type",C_Basetype("unsigned int")),
-        ("unsigned","long"):("type",C_Basetype("unsigned long")),
-        ("unsigned","long","long"):("type",C_Basetype("unsigned long long")),
-
-        ("signed","char"):("type",C_Basetype("signed char")),
-        ("signed","short"):("type",C_Basetype("signed short")),
-        ("signed","int"):("type",C_Basetype("signed int")),
-        ("signed","long"):("type",C_Basetype("signed long")),
-        ("signed","long","long"):("type",C_Basetype("signed long long")),
-
-        ("struct",):("metatype",C_Metatype("struct")),
-        ("union",):("metatype",C_Metatype("union")),
-        ("enum",):("metatype",C_Metatype("enum")),
-
-        ("typedef",):("typedef",C_Typedef(None))
-    })
-
-    # ("type",C_Type)
-    # ("metatype",C_Metatype)
-    # ("var",C_Var)
-    # ("const",C_Const)
-
-    return symtable
-
-def parseBasetype(idx: Ref,tokens: list[Token] , symTable : SymTable):
-    typenames = []
-    while idx.val < len(tokens) and tokens[idx.val].tktype == "identifier":
-        typename = tokens[idx.val].value ; typetuple = tuple((*typenames,typename))
-        if (symItem := symTable.get(typetuple)) and symItem[0] in ["typedef","metatype","type"]:
-            typenames.append(typename)
-            idx.val += 1
-        else:
-            break
-    if not typenames:
-        return None
-    return symTable.get(tuple(typenames))[1]
+    def parseBasetype(self):
+        typenames = []
+        while (tk := self.peek()) and tk.tktype == TK_IDENTIFIER:
+            typename = tk.value ; typetuple = tuple((*typenames,typename))
+            if (symItem := self.symbols.get(typetuple)) and symItem[0] in type_kinds:
+                typenames.append(typename)
+                self.pos += 1
+            else:
+                break
+        if not typenames:
+            return None
+        return self.symbols.get(tuple(typenames))[1]
 
-def parseType(idx: Ref,tokens: list[Token],symTable: SymTable,basetype = None) -> tuple:
-    '''return one of (C_Type ,var_name:str)'''
-    _,match,_,_ = tools(idx,tokens)
+    def parseType(self,basetype = None) -> tuple:
+        '''return one of (C_Type ,var_name:str)'''
 
-    if basetype is None:
-        basetype = parseBasetype(idx,tokens,symTable)
         if basetype is None:
-            return None,None
-
-    var_name = None
-    if type(basetype) == C_Typedef:
-        newtype,typename = parseType(idx,tokens,symTable)
-        return C_Typedef(newtype) , typename
-
-    if type(basetype) == C_Metatype:
-        if tk := match("identifier"):
-            var_name = tk.value
-        return basetype , var_name
-
-    def solve_type(basetype):
-        '''return TopType & BottomType'''
-        nonlocal var_name
-        top_type = basetype ; bottom_type = None
-        mid_top_type , mid_bottom_type = None , None
-        while match("operator","*"):
-            top_type = C_Pointer(top_type)
-            if bottom_type is None:
-                bottom_type = top_type
-        if tk := match("identifier"):
-            var_name = tk.value
-        elif match("operator","("):
-            mid_top_type , mid_bottom_type = solve_type(None)
-            match("operator",")")
-        if match("operator","("):
-            argtypes = []
-            while True:
-                if match("operator",")"):
-                    break
-                argtypes.append(parseType(idx,tokens,symTable))
-                if match("operator",")"):
-                    break
-                else:
-                    match("operator",",")
-            top_type = C_Func(top_type,argtypes)
-            if bottom_type is None:
-                bottom_type = top_type
-        else:
-            dimensions = []
-            while match("operator","["):
-                tk = match("integer")
-                if tk:
-                    arr_size = tk.value
-                else:
-                    arr_size = None
-                dimensions.append(arr_size)
-                match("operator","]")
-            if dimensions:
-                top_type = C_Array(top_type,tuple(dimensions))
+            basetype = self.parseBasetype()
+            if basetype is None:
+                return None,None
+
+        var_name = None
+        if type(basetype) == C_Typedef:
+            newtype,typename = self.parseType()
+            return C_Typedef(newtype) , typename
+
+        if type(basetype) == C_Metatype:
+            if tk := self.match(TK_IDENTIFIER):
+                var_name = tk.value
+            return basetype , var_name
+
+        def solve_type(basetype):
+            '''return TopType & BottomType'''
+            nonlocal var_name
+            top_type = basetype ; bottom_type = None
+            mid_top_type , mid_bottom_type = None , None
+            while self.match(TK_OPERATOR,"*"):
+                top_type = C_Pointer(top_type)
                 if bottom_type is None:
                     bottom_type = top_type
-        
-        if mid_top_type and mid_bottom_type:
-            if type(mid_bottom_type) == C_Func:
-                mid_bottom_type.rettype = top_type
-            elif type(mid_bottom_type) == C_Pointer:
-                mid_bottom_type.oftype = top_type
-            elif type(mid_bottom_type) == C_Array:
-                mid_bottom_type.oftype = top_type
-            return mid_top_type,bottom_type
-        
-        return top_type,bottom_type
-    basetype,_ = solve_type(basetype)
-
-    return basetype,var_name
-
-def declaration(idx: Ref,tokens: list[Token],symTable: SymTable) -> ASTNode:
-    '''it's possible to return a ASTNode if here is some initialization'''
-    basetype = parseBasetype(idx,tokens,symTable)
-    _,match,_,_ = tools(idx,tokens)
-
-    if type(basetype) == C_Typedef:
-        newtype , typename = parseType(idx,tokens,symTable,basetype)
-        if typename:
-            symTable.set((typename,),("type",newtype.of))
-
-    elif type(basetype) == C_Metatype:
-        # metatypes
-        var_type , var_name = parseType(idx,tokens,symTable,basetype)
-        newtype = None
-        if var_type.typename   == "struct":
-            if match("operator","{"):
-                fields = []
+            if tk := self.match(TK_IDENTIFIER):
+                var_name = tk.value
+            elif self.match(TK_OPERATOR,"("):
+                mid_top_type , mid_bottom_type = solve_type(None)
+                self.match(TK_OPERATOR,")")
+            if self.match(TK_OPERATOR,"("):
+                argtypes = []
                 while True:
-                    basetype = parseBasetype(idx,tokens,symTable)
-                    while True:
-                        field_type , field_name = parseType(idx,tokens,symTable,basetype)
-                        if field_type and field_name:
-                            fields.append((field_type,field_name))
-                        if not match("operator",","):
-                            break
-                    if match("operator","}"):
+                    if self.match(TK_OPERATOR,")"):
                         break
-                    else:
-                        match("operator",";")
-                newtype = C_Struct(fields)
-            else:
-                newtype = C_Struct([])
-        elif var_type.typename == "union":
-            if match("operator","{"):
-                fields = []
-                while True:
-                    field_type, field_name = parseType(idx,tokens,symTable)
-                    if field_type and field_name:
-                        fields.append((field_type,field_name))
-                    if match("operator","}"):
+                    argtypes.append(self.parseType())
+                    if self.match(TK_OPERATOR,")"):
                         break
                     else:
-                        match("operator",";")
-                newtype = C_Union(fields)
+                        self.match(TK_OPERATOR,",")
+                top_type = C_Func(top_type,argtypes)
+                if bottom_type is None:
+                    bottom_type = top_type
             else:
-                newtype = C_Union([])
-        elif var_type.typename == "enum":
-            val = 0; newtype = C_Enum()
-            if match("operator","{"):
-                while True:
-                    if tk := match("identifier"):
-                        if match("operator","="):
-                            if valtk := match("integer"):
-                                val = valtk.value
-                        symTable.set((tk.value,),("const",C_Const(newtype,val)))
-                        val += 1
-                    if match("operator","}"):
-                        break
+                dimensions = []
+                while self.match(TK_OPERATOR,"["):
+                    tk = self.match(TK_INTEGER)
+                    if tk:
+                        arr_size = tk.value
                     else:
-                        match("operator",",")
-        if var_name:
-            symTable.set((var_type.typename,var_name),("type",newtype))
-    
-    # otherwise we are declaring a variable
-    else:
-        rootnode = ASTNode("actions",[],(SymTable({},symTable),))
-        while True:
-            var_type , var_name = parseType(idx,tokens,symTable,basetype)
-            symTable.set((var_name,),("var",C_Var(var_type)))
+                        arr_size = None
+                    dimensions.append(arr_size)
+                    self.match(TK_OPERATOR,"]")
+                if dimensions:
+                    top_type = C_Array(top_type,tuple(dimensions))
+                    if bottom_type is None:
+                        bottom_type = top_type
+        
+            if mid_top_type and mid_bottom_type:
+                if type(mid_bottom_type) == C_Func:
+                    mid_bottom_type.rettype = top_type
+                elif type(mid_bottom_type) == C_Pointer:
+                    mid_bottom_type.oftype = top_type
+                elif type(mid_bottom_type) == C_Array:
+                    mid_bottom_type.oftype = top_type
+                return mid_top_type,bottom_type
         
-            if match("operator","="):
-                # with init
-                if match("operator","{"):
-                    astnode = initlist(idx,tokens,symTable)
-                    match("operator","}")
-                    astnode = ASTNode("init_assign",[
-                        ASTNode("var",[],(var_name,)),
-                        astnode
-                    ],())
-                    rootnode.children.append(astnode)
+            return top_type,bottom_type
+        basetype,_ = solve_type(basetype)
+
+        return basetype,var_name
+
+    def declaration(self) -> ASTNode:
+        '''it's possible to return a ASTNode if here is some initialization'''
+        basetype = self.parseBasetype()
+
+        if type(basetype) == C_Typedef:
+            newtype , typename = self.parseType(basetype)
+            if typename:
+                self.symbols.set((typename,),("type",newtype.of))
+
+        elif type(basetype) == C_Metatype:
+            # metatypes
+            var_type , var_name = self.parseType(basetype)
+            newtype = None
+            if var_type.typename   == "struct":
+                if self.match(TK_OPERATOR,"{"):
+                    fields = []
+                    while True:
+                        basetype = self.parseBasetype()
+                        while True:
+                            field_type , field_name = self.parseType(basetype)
+                            if field_type and field_name:
+                                fields.append((field_type,field_name))
+                            if not self.match(TK_OPERATOR,","):
+                                break
+                        if self.match(TK_OPERATOR,"}"):
+                            break
+                        else:
+                            self.match(TK_OPERATOR,";")
+                    newtype = C_Struct(fields)
+                else:
+                    newtype = C_Struct([])
+            elif var_type.typename == "union":
+                if self.match(TK_OPERATOR,"{"):
+                    fields = []
+                    while True:
+                        field_type, field_name = self.parseType()
+                        if field_type and field_name:
+                            fields.append((field_type,field_name))
+                        if self.match(TK_OPERATOR,"}"):
+                            break
+                        else:
+                            self.match(TK_OPERATOR,";")
+                    newtype = C_Union(fields)
                 else:
-                    astnode = ASTNode("assign",[
-                        ASTNode("var",[],(var_name,)),
-                        expression(idx,tokens,symTable,14)
-                    ],())
-                    rootnode.children.append(astnode)
-            elif match("operator","{"):
-                # symtable for arguments
-                argsymtable = symTable.derive()
-                var_type : C_Func
-                for argtype , argname in var_type.argtype:
-                    argsymtable.set((argname,),("var",C_Var(argtype)))
+                    newtype = C_Union([])
+            elif var_type.typename == "enum":
+                val = 0; newtype = C_Enum()
+                if self.match(TK_OPERATOR,"{"):
+                    while True:
+                        if tk := self.match(TK_IDENTIFIER):
+                            if self.match(TK_OPERATOR,"="):
+                                if valtk := self.match(TK_INTEGER):
+                                    val = valtk.value
+                            self.symbols.set((tk.value,),("const",C_Const(newtype,val)))
+                            val += 1
+                        if self.match(TK_OPERATOR,"}"):
+                            break
+                        else:
+                            self.match(TK_OPERATOR,",")
+            if var_name:
+                self.symbols.set((var_type.typename,var_name),("type",newtype))
+    
+        # otherwise we are declaring a variable
+        else:
+            actions = []
+            while True:
+                var_type , var_name = self.parseType(basetype)
+                self.symbols.set((var_name,),("var",C_Var(var_type)))
+        
+                if self.match(TK_OPERATOR,"="):
+                    # with init
+                    if self.match(TK_OPERATOR,"{"):
+                        astnode = self.initlist()
+                        self.match(TK_OPERATOR,"}")
+                        astnode = self.node("init_assign",[
+                            self.node("var",[],(var_name,)),
+                            astnode
+                        ],())
+                        actions.append(astnode)
+                    else:
+                        astnode = self.node("assign",[
+                            self.node("var",[],(var_name,)),
+                            self.expression(14)
+                        ],())
+                        actions.append(astnode)
+                elif self.match(TK_OPERATOR,"{"):
+                    # symtable for arguments
+                    argsymtable = self.symbols.push()
+                    var_type : C_Func
+                    for argtype , argname in var_type.argtype:
+                        self.symbols.set((argname,),("var",C_Var(argtype)))
                 
-                astnode = ASTNode("function",[statements(idx,tokens,argsymtable)],(var_name,var_type,argsymtable))
-                match("operator","}")
-                rootnode.children.append(astnode)
-            if not match("operator",","):
-                break
+                    astnode = self.node("function",[self.statements()],(var_name,var_type,argsymtable))
+                    self.symbols.pop()
+                    self.match(TK_OPERATOR,"}")
+                    actions.append(astnode)
+                if not self.match(TK_OPERATOR,","):
+                    break
         
-        if len(rootnode.children) == 0:
-            return None
-        elif len(rootnode.children) == 1:
-            return rootnode.children[0]
-        else:
-            return rootnode
-
-def initlist(idx:Ref, tokens: list[Token], symTable: SymTable) -> ASTNode:
-    peek,match,_,_ = tools(idx,tokens) ; autoidx = 0
-    lst = [] ; # [(key,value)]
-    while True:
-        if match("operator","["):
-            autoidx = match("integer").value
-            match("operator","]")
-            match("operator","=")
-            value = expression(idx,tokens,symTable,14)
-            lst.append((autoidx,value))
-            autoidx += 1
-        elif match("operator","."):
-            tk = match("identifier")
-            match("operator","=")
-            value = expression(idx,tokens,symTable,14)
-            lst.append((tk.value,value))
-        elif match("operator","{"):
-            sublst = initlist(idx,tokens,symTable)
-            match("operator","}")
-            lst.append((autoidx,sublst))
-            autoidx += 1
-        else:
-            if not peek() or peek().tktype == "operator" and peek().value == "}":
-                break
-            value = expression(idx,tokens,symTable,14)
-            lst.append((autoidx,value))
-            autoidx += 1
-        match("operator",",")
-    return ASTNode("initlist",[],(lst,))
-
-def expression(idx: Ref, tokens: list[Token],symTable: SymTable,prec=15) -> ASTNode:
-    _,match,_,_ = tools(idx,tokens)
-    lhs = None
-
-    if prec >= 15:
-        lhs = expression(idx,tokens,symTable,14)
-        while True:
-            if match("operator",","):
-                lhs = ASTNode("comma",[lhs,expression(idx,tokens,symTable,14)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 14:
-        lhs = expression(idx,tokens,symTable,13)
-        while True:
-            if match("operator","="):
-                lhs = ASTNode("assign",[lhs,expression(idx,tokens,symTable,13)],())
-            elif match("operator","/="):
-                lhs = ASTNode("assign",[lhs,ASTNode("div",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","*="):
-                lhs = ASTNode("assign",[lhs,ASTNode("mul",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","%="):
-                lhs = ASTNode("assign",[lhs,ASTNode("mod",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","+="):
-                lhs = ASTNode("assign",[lhs,ASTNode("add",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","-="):
-                lhs = ASTNode("assign",[lhs,ASTNode("sub",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","<<="):
-                lhs = ASTNode("assign",[lhs,ASTNode("shl",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator",">>="):
-                lhs = ASTNode("assign",[lhs,ASTNode("shr",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","&="):
-                lhs = ASTNode("assign",[lhs,ASTNode("bitand",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","^="):
-                lhs = ASTNode("assign",[lhs,ASTNode("bitxor",[lhs,expression(idx,tokens,symTable,13)],())],())
-            elif match("operator","|="):
-                lhs = ASTNode("assign",[lhs,ASTNode("bitor",[lhs,expression(idx,tokens,symTable,13)],())],())
-            else:
-                break
-        return lhs
-
-    if prec >= 13:
-        lhs = expression(idx,tokens,symTable,12)
-        while True:
-            if match("operator","?"):
-                true_ret  = expression(idx,tokens,symTable,12)
-                match("operator",":")
-                false_ret = expression(idx,tokens,symTable,12)
-                lhs = ASTNode("cond",[lhs,true_ret,false_ret],())
-            else:
-                break
-        return lhs
-
-    if prec >= 12:
-        lhs = expression(idx,tokens,symTable,11)
-        while True:
-            if match("operator","||"):
-                lhs = ASTNode("or",[lhs,expression(idx,tokens,symTable,11)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 11:
-        lhs = expression(idx,tokens,symTable,10)
-        while True:
-            if match("operator","&&"):
-                lhs = ASTNode("and",[lhs,expression(idx,tokens,symTable,10)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 10:
-        lhs = expression(idx,tokens,symTable,9)
-        while True:
-            if match("operator","|"):
-                lhs = ASTNode("bitor",[lhs,expression(idx,tokens,symTable,9)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 9:
-        lhs = expression(idx,tokens,symTable,8)
-        while True:
-            if match("operator","^"):
-                lhs = ASTNode("bitxor",[lhs,expression(idx,tokens,symTable,8)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 8:
-        lhs = expression(idx,tokens,symTable,7)
-        while True:
-            if match("operator","&"):
-                lhs = ASTNode("bitand",[lhs,expression(idx,tokens,symTable,7)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 7:
-        lhs = expression(idx,tokens,symTable,6)
-        while True:
-            if match("operator","=="):
-                lhs = ASTNode("eq",[lhs,expression(idx,tokens,symTable,6)],())
-            elif match("operator","!="):
-                lhs = ASTNode("ne",[lhs,expression(idx,tokens,symTable,6)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 6:
-        lhs = expression(idx,tokens,symTable,5)
-        while True:
-            if match("operator",">"):
-                lhs = ASTNode("gt",[lhs,expression(idx,tokens,symTable,5)],())
-            elif match("operator",">="):
-                lhs = ASTNode("ge",[lhs,expression(idx,tokens,symTable,5)],())
-            elif match("operator","<"):
-                lhs = ASTNode("lt",[lhs,expression(idx,tokens,symTable,5)],())
-            elif match("operator","<="):
-                lhs = ASTNode("le",[lhs,expression(idx,tokens,symTable,5)],())
+            if len(actions) == 0:
+                return None
+            elif len(actions) == 1:
+                return actions[0]
             else:
-                break
-        return lhs
+                return self.node("actions",actions,(SymTable(father=self.symbols.scope()),))
 
-    if prec >= 5:
-        lhs = expression(idx,tokens,symTable,4)
+    def initlist(self) -> ASTNode:
+        autoidx = 0
+        lst = [] ; # [(key,value)]
         while True:
-            if match("operator","<<"):
-                lhs = ASTNode("shl",[lhs,expression(idx,tokens,symTable,4)],())
-            elif match("operator",">>"):
-                lhs = ASTNode("shr",[lhs,expression(idx,tokens,symTable,4)],())
-            else:
-                break
-        return lhs
-
-    if prec >= 4:
-        lhs = expression(idx,tokens,symTable,3)
-        while True:
-            if match("operator","+"):
-                lhs = ASTNode("add",[lhs,expression(idx,tokens,symTable,3)],())
-            elif match("operator","-"):
-                lhs = ASTNode("sub",[lhs,expression(idx,tokens,symTable,3)],())
+            if self.match(TK_OPERATOR,"["):
+                autoidx = self.match(TK_INTEGER).value
+                self.match(TK_OPERATOR,"]")
+                self.match(TK_OPERATOR,"=")
+                value = self.expression(14)
+                lst.append((autoidx,value))
+                autoidx += 1
+            elif self.match(TK_OPERATOR,"."):
+                tk = self.match(TK_IDENTIFIER)
+                self.match(TK_OPERATOR,"=")
+                value = self.expression(14)
+                lst.append((tk.value,value))
+            elif self.match(TK_OPERATOR,"{"):
+                sublst = self.initlist()
+                self.match(TK_OPERATOR,"}")
+                lst.append((autoidx,sublst))
+                autoidx += 1
             else:
+                if not self.peek() or self.peek().tktype == TK_OPERATOR and self.peek().value == "}":
+                    break
+                value = self.expression(14)
+                lst.append((autoidx,value))
+                autoidx += 1
+            self.match(TK_OPERATOR,",")
+        return self.node("initlist",[],(lst,))
+
+    def expression(self,prec=15) -> ASTNode:
+        '''
+        precedence climbing over binary_operators , prec is the loosest
+        level accepted : 15 takes comma lists , 14 stops before a top-level
+        comma and anything below 3 is a single unary expression
+        '''
+        lhs = self.unary()
+        while (tk := self.peek()) and tk.tktype == TK_OPERATOR:
+            operator = binary_operators.get(tk.value)
+            if operator is None or operator[0] > prec:
                 break
+            op_prec , right_assoc , nodeType = operator
+            self.pos += 1
+            next_prec = op_prec if right_assoc else op_prec - 1
+
+            if nodeType == "cond":
+                true_ret  = self.expression(next_prec)
+                self.match(TK_OPERATOR,":")
+                false_ret = self.expression(next_prec)
+                lhs = self.node("cond",[lhs,true_ret,false_ret],())
+                continue
+
+            rhs = self.expression(next_prec)
+            if tk.value in compound_assignments:
+                # a op= b  ->  a = a op b
+                rhs = self.node(compound_assignments[tk.value],[lhs,rhs],())
+            lhs = self.node(nodeType,[lhs,rhs],())
         return lhs
 
-    if prec >= 3:
-        lhs = expression(idx,tokens,symTable,2)
-        while True:
-            if match("operator","/"):
-                lhs = ASTNode("div",[lhs,expression(idx,tokens,symTable,2)],())
-            elif match("operator","*"):
-                lhs = ASTNode("mul",[lhs,expression(idx,tokens,symTable,2)],())
-            elif match("operator","%"):
-                lhs = ASTNode("mod",[lhs,expression(idx,tokens,symTable,2)],())
+    def unary(self) -> ASTNode:
+        tk = self.peek()
+        if tk is not None:
+            if tk.tktype == TK_OPERATOR:
+                if nodeType := prefix_operators.get(tk.value):
+                    self.pos += 1
+                    return self.node(nodeType,[self.unary()],())
+                if tk.value == "+":
+                    self.pos += 1
+                    return self.unary()
+                if tk.value == "(" and self.at_type(1):
+                    self.pos += 1
+                    conv_type , _ = self.parseType()
+                    self.match(TK_OPERATOR,")")
+                    return self.node("as",[self.unary()],(conv_type,))
+            elif tk.tktype == TK_IDENTIFIER and tk.value == "sizeof":
+                self.pos += 1
+                return self.node("sizeof",[self.unary()],())
+
+        lhs = self.postfix()
+        while (tk := self.peek()) and tk.tktype == TK_OPERATOR:
+            if tk.value == "++":
+                lhs = self.node("retinc",[lhs],())
+            elif tk.value == "--":
+                lhs = self.node("retdec",[lhs],())
             else:
                 break
+            self.pos += 1
         return lhs
 
-    if prec >= 2:
-        if match("operator","++"):
-            lhs = ASTNode("incret",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","--"):
-            lhs = ASTNode("decret",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","*"):
-            lhs = ASTNode("deaddr",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","&"):
-            lhs = ASTNode("addr",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","!"):
-            lhs = ASTNode("not",[expression(idx,tokens,symTable,2)],())
-        elif match("identifier","sizeof"):
-            lhs = ASTNode("sizeof",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","~"):
-            lhs = ASTNode("bitnot",[expression(idx,tokens,symTable,2)],())
-        elif match("operator","+"):
-            lhs = expression(idx,tokens,symTable,2)
-        elif match("operator","-"):
-            lhs = ASTNode("neg",[expression(idx,tokens,symTable,2)],())
-        else:
-            snapshot = idx.val
-            if match("operator","("):
-                conv_type , _ = parseType(idx,tokens,symTable)
-                match("operator",")")
-                if conv_type:
-                    lhs = ASTNode("as",[expression(idx,tokens,symTable,2)],(conv_type,))
-                else:
-                    idx.val = snapshot
-                    lhs = expression(idx,tokens,symTable,1)
-            else:
-                lhs = expression(idx,tokens,symTable,1)
-
-            while True:
-                if match("operator","++"):
-                    lhs = ASTNode("retinc",[lhs],())
-                elif match("operator","--"):
-                    lhs = ASTNode("retdec",[lhs],())
-                else:
-                    break
-        return lhs        
-
-    if prec >= 1:
-        tk : Token
-        if match("operator","("):
-            lhs = expression(idx,tokens,symTable)
-            match("operator",")")
-        elif tk := match("identifier"):
-            var_name = tk.value
-            lhs = ASTNode("var",[],(var_name,))
-        elif tk := match("integer"):
-            lhs = ASTNode("integer",[],(tk.value,))
-        elif tk := match("string"):
-            lhs = ASTNode("string",[],(tk.value,))
-        elif tk := match("float"):
-            lhs = ASTNode("float",[],(tk.value,))
-
-        while True:
-            if match("operator","("):
+    def postfix(self) -> ASTNode:
+        lhs = None
+        tk  = self.peek()
+        if tk is None:
+            return None
+        if tk.tktype == TK_OPERATOR:
+            if tk.value == "(":
+                self.pos += 1
+                lhs = self.expression()
+                self.match(TK_OPERATOR,")")
+        elif tk.tktype == TK_IDENTIFIER:
+            self.pos += 1
+            lhs = self.node("var",[],(tk.value,))
+        elif tk.tktype == TK_INTEGER:
+            self.pos += 1
+            lhs = self.node("integer",[],(tk.value,))
+        elif tk.tktype == TK_STRING:
+            self.pos += 1
+            lhs = self.node("string",[],(tk.value,))
+        elif tk.tktype == TK_FLOAT:
+            self.pos += 1
+            lhs = self.node("float",[],(tk.value,))
+
+        while (tk := self.peek()) and tk.tktype == TK_OPERATOR:
+            if tk.value == "(":
+                self.pos += 1
                 args = []
-                if match("operator",")"):
-                    lhs = ASTNode("call",[lhs,],())
+                if self.match(TK_OPERATOR,")"):
+                    lhs = self.node("call",[lhs,],())
                 else:
                     while True:
-                        args.append(expression(idx,tokens,symTable,14))
-                        if not match("operator",","):
+                        args.append(self.expression(14))
+                        if not self.match(TK_OPERATOR,","):
                             break
-                    match("operator",")")
-                    lhs = ASTNode("call",[lhs,*args],())
-            elif match("operator","["):
-                lhs = ASTNode("index",[lhs,expression(idx,tokens,symTable)],())
-                match("operator","]")
-            elif match("operator","."):
-                tk = match("identifier")
-                lhs = ASTNode("attr",[lhs],(tk.value,))
-            elif match("operator","->"):
-                tk = match("identifier")
-                lhs = ASTNode("ptr_attr",[lhs],(tk.value,))
+                    self.match(TK_OPERATOR,")")
+                    lhs = self.node("call",[lhs,*args],())
+            elif tk.value == "[":
+                self.pos += 1
+                lhs = self.node("index",[lhs,self.expression()],())
+                self.match(TK_OPERATOR,"]")
+            elif tk.value == ".":
+                self.pos += 1
+                tk = self.match(TK_IDENTIFIER)
+                lhs = self.node("attr",[lhs],(tk.value,))
+            elif tk.value == "->":
+                self.pos += 1
+                tk = self.match(TK_IDENTIFIER)
+                lhs = self.node("ptr_attr",[lhs],(tk.value,))
             else:
                 break
         return lhs
 
-def statements(idx: Ref,tokens: list[Token],symTable : SymTable) -> ASTNode:
-    peek,match,_,_ = tools(idx,tokens)
-    symTable = symTable.derive()
-    children = []
-    rootnode = ASTNode("actions",children,(symTable,))
-
-    while True:
-        stmt = statement(idx,tokens,symTable)
-        if stmt:
-            children.append(stmt)
-        if not peek() or peek().tktype == "operator" and peek().value == "}":
-            break
+    def statements(self) -> ASTNode:
+        scope    = self.symbols.push()
+        children = []
+
+        while True:
+            stmt = self.statement()
+            if stmt:
+                children.append(stmt)
+            tk = self.peek()
+            if not tk or tk.tktype == TK_OPERATOR and tk.value == "}":
+                break
     
-    return rootnode
+        self.symbols.pop()
+        return self.node("actions",children,(scope,))
 
-def statement(idx: Ref,tokens: list[Token],symTable : SymTable) -> ASTNode:
-    peek,match,_,_ = tools(idx,tokens)
+    def statement(self) -> ASTNode:
+        tk = self.peek()
+        if tk is None:
+            return None
 
-    if match("operator",";"):
-        return None
-    if not peek() or peek().tktype == "operator" and peek().value == "}":
-        return None
-    
-    if match("operator","{"):
-        astnode = statements(idx,tokens,symTable)
-        match("operator","}")
-        return astnode
-    elif match("identifier","if"):
-        match("operator","(")
-        cond = expression(idx,tokens,symTable,14)
-        match("operator",")")
-        iftrue = statement(idx,tokens,symTable)
-        iffalse = None
-        if match("identifier","else"):
-            iffalse = statement(idx,tokens,symTable)
-        if iffalse:
-            return ASTNode("ifelse",[cond,iftrue,iffalse],())
-        return ASTNode("if",[cond,iftrue],())
-    elif match("identifier","while"):
-        match("operator","(")
-        cond = expression(idx,tokens,symTable,14)
-        match("operator",")")
-        loop = statement(idx,tokens,symTable)
-        return ASTNode("while",[cond,loop],())
-    elif match("identifier","for"):
-        match("operator","(")
-        init_clause = declaration(idx,tokens,symTable)
-        match("operator",";")
-        cond_clause = expression(idx,tokens,symTable,14)
-        match("operator",";")
-        op_clause = expression(idx,tokens,symTable,14)
-        match("operator",")")
-        loop = statement(idx,tokens,symTable)
-        return ASTNode("for",[init_clause,cond_clause,op_clause,loop],())
-    elif match("identifier","do"):
-        loop = statement(idx,tokens,symTable)
-        match("identifier","while")
-        match("identifier","(")
-        cond = expression(idx,tokens,symTable,14)
-        match("identifier",")")
-        match("identifier",";")
-        return ASTNode("do_while",[cond,loop],())
-    elif match("identifier","return"):
-        retval = expression(idx,tokens,symTable,14)
-        match("operator",";")
-        return ASTNode("ret",[retval],())
-    elif match("identifier","break"):
-        match("operator",";")
-        return ASTNode("break",[],())
-    elif match("identifier","continue"):
-        match("operator",";")
-        return ASTNode("continue",[],())
-    else:
-        snapshot = idx.val
-        if parseBasetype(idx,tokens,symTable):
-            idx.val = snapshot
-            astnode = declaration(idx,tokens,symTable)
-            match("operator",";")
+        if tk.tktype == TK_OPERATOR:
+            if tk.value == ";":
+                self.pos += 1
+                return None
+            if tk.value == "}":
+                return None
+            if tk.value == "{":
+                self.pos += 1
+                astnode = self.statements()
+                self.match(TK_OPERATOR,"}")
+                return astnode
+        elif tk.tktype == TK_IDENTIFIER and (handler := statement_keywords.get(tk.value)):
+            self.pos += 1
+            return handler(self)
+
+        if self.at_type():
+            astnode = self.declaration()
+            self.match(TK_OPERATOR,";")
             return astnode
         else:
-            idx.val = snapshot
-            expr = expression(idx,tokens,symTable)
-            match("operator",";")
+            expr = self.expression()
+            self.match(TK_OPERATOR,";")
             return expr
 
-def program(idx: Ref,tokens: list[Token]) -> ASTNode:
-    children = []
-    symtable = rootTable()
-    this = ASTNode("program",children,(symtable,))
-
-    while idx.val < len(tokens):
-        dec = declaration(idx,tokens,symtable)
-        if dec:
-            children.append(dec)
-        if idx.val < len(tokens) and tokens[idx.val].tktype == "operator" and tokens[idx.val].value == ";":
-            idx.val += 1
+    # keyword statements , dispatched through statement_keywords
+    # with the keyword itself already consumed
 
-    return this
\ No newline at end of file
+    def statement_if(self) -> ASTNode:
+        self.match(TK_OPERATOR,"(")
+        cond = self.expression(14)
+        self.match(TK_OPERATOR,")")
+        iftrue = self.statement()
+        iffalse = None
+        if self.match(TK_IDENTIFIER,"else"):
+            iffalse = self.statement()
+        if iffalse:
+            return self.node("ifelse",[cond,iftrue,iffalse],())
+        return self.node("if",[cond,iftrue],())
+
+    def statement_while(self) -> ASTNode:
+        self.match(TK_OPERATOR,"(")
+        cond = self.expression(14)
+        self.match(TK_OPERATOR,")")
+        loop = self.statement()
+        return self.node("while",[cond,loop],())
+
+    def statement_for(self) -> ASTNode:
+        self.match(TK_OPERATOR,"(")
+        init_clause = self.declaration()
+        self.match(TK_OPERATOR,";")
+        cond_clause = self.expression(14)
+        self.match(TK_OPERATOR,";")
+        op_clause = self.expression(14)
+        self.match(TK_OPERATOR,")")
+        loop = self.statement()
+        return self.node("for",[init_clause,cond_clause,op_clause,loop],())
+
+    def statement_do(self) -> ASTNode:
+        loop = self.statement()
+        self.match(TK_IDENTIFIER,"while")
+        self.match(TK_OPERATOR,"(")
+        cond = self.expression(14)
+        self.match(TK_OPERATOR,")")
+        self.match(TK_OPERATOR,";")
+        return self.node("do_while",[cond,loop],())
+
+    def statement_return(self) -> ASTNode:
+        retval = self.expression(14)
+        self.match(TK_OPERATOR,";")
+        return self.node("ret",[retval],())
+
+    def statement_break(self) -> ASTNode:
+        self.match(TK_OPERATOR,";")
+        return self.node("break",[],())
+
+    def statement_continue(self) -> ASTNode:
+        self.match(TK_OPERATOR,";")
+        return self.node("continue",[],())
+
+    def program(self) -> ASTNode:
+        children = []
+
+        while self.peek():
+            # top level declarations never rewind past their first token
+            self.release()
+            dec = self.declaration()
+            if dec:
+                children.append(dec)
+            self.match(TK_OPERATOR,";")
+
+        return self.node("program",children,(self.symbols.scope(),))
+
+statement_keywords = {
+    "if"       : Parser.statement_if,
+    "while"    : Parser.statement_while,
+    "for"      : Parser.statement_for,
+    "do"       : Parser.statement_do,
+    "return"   : Parser.statement_return,
+    "break"    : Parser.statement_break,
+    "continue" : Parser.statement_continue,
+}
+
+# symbol kinds parseBasetype accepts as part of a type name
+type_kinds = ("typedef","metatype","type")
+
+# binary operator : (precedence , right associative , nodeType)
+# precedence numbers follow the C levels , lower binds tighter.
+# assignment is kept left associative as the grammar always parsed it
+binary_operators = {
+    ","   : (15,False,"comma"),
+    "="   : (14,False,"assign"),
+    "/="  : (14,False,"assign"),
+    "*="  : (14,False,"assign"),
+    "%="  : (14,False,"assign"),
+    "+="  : (14,False,"assign"),
+    "-="  : (14,False,"assign"),
+    "<<=" : (14,False,"assign"),
+    ">>=" : (14,False,"assign"),
+    "&="  : (14,False,"assign"),
+    "^="  : (14,False,"assign"),
+    "|="  : (14,False,"assign"),
+    "?"   : (13,False,"cond"),
+    "||"  : (12,False,"or"),
+    "&&"  : (11,False,"and"),
+    "|"   : (10,False,"bitor"),
+    "^"   : ( 9,False,"bitxor"),
+    "&"   : ( 8,False,"bitand"),
+    "=="  : ( 7,False,"eq"),
+    "!="  : ( 7,False,"ne"),
+    ">"   : ( 6,False,"gt"),
+    ">="  : ( 6,False,"ge"),
+    "<"   : ( 6,False,"lt"),
+    "<="  : ( 6,False,"le"),
+    "<<"  : ( 5,False,"shl"),
+    ">>"  : ( 5,False,"shr"),
+    "+"   : ( 4,False,"add"),
+    "-"   : ( 4,False,"sub"),
+    "/"   : ( 3,False,"div"),
+    "*"   : ( 3,False,"mul"),
+    "%"   : ( 3,False,"mod"),
+}
+
+# compound assignment : the binary nodeType it desugars to
+compound_assignments = {
+    "/="  : "div",
+    "*="  : "mul",
+    "%="  : "mod",
+    "+="  : "add",
+    "-="  : "sub",
+    "<<=" : "shl",
+    ">>=" : "shr",
+    "&="  : "bitand",
+    "^="  : "bitxor",
+    "|="  : "bitor",
+}
+
+prefix_operators = {
+    "++" : "incret",
+    "--" : "decret",
+    "*"  : "deaddr",
+    "&"  : "addr",
+    "!"  : "not",
+    "~"  : "bitnot",
+    "-"  : "neg",
+}
@@ -0,0 +1,234 @@
+'''
+peephole optimisation over the finished text section of an Emitter.
+the words are decoded into instructions , rewritten with the pattern
+table below until nothing matches , then every code position (branch
+operands , the _main slot and function slots) is relocated. operands
+listed in Emitter.addr_refs travel as Address so the list still holds
+for object files afterwards
+'''
+
+from array import array
+from codegen import Emitter , opcode , operand_ops
+
+rev_opcode = {v: k for k, v in opcode.items()}
+
+# opcodes whose operand is a code position
+branch_ops = {"JMP","JSR","BZ","BNZ","EQBZ","NEBZ","LTBZ","GTBZ","LEBZ","GEBZ"}
+
+# opcodes overwriting ax without reading it
+reg_setters = {"IMM","LEA","LLI","LLC","GLI","GLC"}
+
+inverted_branch = {"BZ":"BNZ","BNZ":"BZ"}
+
+INT64_MIN = -(1 << 63)
+
+def wrap(x: int) -> int:
+    return ((x - INT64_MIN) & 0xffffffffffffffff) + INT64_MIN
+
+class Address(int):
+    '''an operand holding an image position , relocated by the linker'''
+    __slots__ = ()
+
+def offset(a: int,k: int) -> int:
+    '''a + k , an Address when one side is'''
+    res = wrap(a + k)
+    return Address(res) if type(a) == Address or type(k) == Address else res
+
+def constants(*xs) -> bool:
+    return all(type(x) != Address for x in xs)
+
+class Match(dict):
+    '''
+    operand bindings of a pattern , plus the matched opcode names (ops)
+    and the position of the instruction following the window (next)
+    '''
+    __slots__ = ("ops","next","at")
+
+    def __init__(self,at: dict):
+        super().__init__()
+        self.ops  = []
+        self.next = None
+        self.at   = at
+
+    def sets_reg(self,pos: int) -> bool:
+        '''whether the instruction at pos overwrites ax before reading it'''
+        return self.at.get(pos) in reg_setters
+
+# pattern elements are (op,) or (op,operand) where op is a name or a set
+# of names and operand an int to compare or a name to bind. follow is the
+# set of opcodes allowed right after the window (not rewritten) , rewrite
+# returns the replacement instructions or None to reject the match
+peephole_patterns = [
+    # name       , pattern                                             , follow      , rewrite
+    ("x+0"       , [("PSH",),("IMM",0),({"ADD","SUB"},)]                , None        ,
+        lambda m: []),
+    ("x*1"       , [("PSH",),("IMM",1),({"MUL","DIV"},)]                , None        ,
+        lambda m: []),
+    ("lea+k"     , [("LEA","a"),("PSH",),("IMM","k"),("ADD",)]          , None        ,
+        lambda m: [("LEA",wrap(m["a"] + m["k"]))] if constants(m["k"]) else None),
+    ("imm+k"     , [("IMM","a"),("PSH",),("IMM","k"),("ADD",)]          , None        ,
+        lambda m: [("IMM",offset(m["a"],m["k"]))]),
+    ("imm*k"     , [("IMM","a"),("PSH",),("IMM","k"),("MUL",)]          , None        ,
+        lambda m: [("IMM",wrap(m["a"] * m["k"]))] if constants(m["a"],m["k"]) else None),
+    ("reload"    , [({"LEA","IMM"},"a"),("PSH",),({"LEA","IMM"},"a"),({"LI","LC"},)] , None ,
+        lambda m: [(m.ops[0],m["a"]),("PSH",None),(m.ops[3],None)] if m.ops[0] == m.ops[2] else None),
+    ("dead"      , [("PSH",),("IMM","k"),({"ADD","SUB"},)]              , reg_setters ,
+        lambda m: []),
+    ("jmp-next"  , [("JMP","t")]                                        , None        ,
+        lambda m: [] if m["t"] == m.next else None),
+    ("lev-lev"   , [("LEV",),("LEV",)]                                  , None        ,
+        lambda m: [("LEV",None)]),
+    # IMM 0 ; PSH ; load ; EQ ; BZ  =>  load ; BNZ , as long as the 0/1
+    # left in ax is overwritten on both paths
+    ("not-branch", [("IMM",0),("PSH",),({"LEA","IMM"},"a"),({"LI","LC"},),("EQ",),({"BZ","BNZ"},"t")] , None ,
+        lambda m: [(m.ops[2],m["a"]),(m.ops[3],None),(inverted_branch[m.ops[5]],m["t"])]
+                  if m.sets_reg(m.next) and m.sets_reg(m["t"]) else None),
+]
+
+# superinstruction selection , run once the patterns above are done
+fused_patterns = [
+    # name       , pattern                              , follow , rewrite
+    ("LLI"       , [("LEA","a"),("LI",)]                 , None   , lambda m: [("LLI",m["a"])]),
+    ("LLC"       , [("LEA","a"),("LC",)]                 , None   , lambda m: [("LLC",m["a"])]),
+    ("GLI"       , [("IMM","a"),("LI",)]                 , None   , lambda m: [("GLI",m["a"])]),
+    ("GLC"       , [("IMM","a"),("LC",)]                 , None   , lambda m: [("GLC",m["a"])]),
+    ("ADDI"      , [("PSH",),("IMM","k"),("ADD",)]       , None   , lambda m: [("ADDI",m["k"])]),
+    ("SUBI"      , [("PSH",),("IMM","k"),("SUB",)]       , None   , lambda m: [("SUBI",m["k"])]),
+    ("MULI"      , [("PSH",),("IMM","k"),("MUL",)]       , None   , lambda m: [("MULI",m["k"])]),
+    ("cmp-BZ"    , [({"EQ","NE","LT","GT","LE","GE"},),("BZ","t")] , None ,
+        lambda m: [(m.ops[0] + "BZ",m["t"])]),
+]
+
+def match_element(element: tuple,instr: tuple,m: Match) -> bool:
+    ops , op , operand = element[0] , instr[0] , instr[1]
+    if op != ops if type(ops) == str else op not in ops:
+        return False
+    m.ops.append(op)
+    if len(element) == 1:
+        return True
+    spec = element[1]
+    if type(spec) == int:
+        return operand == spec
+    if spec in m:
+        return m[spec] == operand
+    m[spec] = operand
+    return True
+
+def decode(text: array,text_base: int) -> list:
+    '''[(op,operand,pos)] , None if the words are not a whole instruction stream'''
+    instrs = []
+    idx = 0
+    while idx < len(text):
+        op = rev_opcode.get(text[idx])
+        if op is None:
+            return None
+        if op in operand_ops:
+            if idx + 1 >= len(text):
+                return None
+            instrs.append((op,text[idx + 1],text_base + 8 * idx))
+            idx += 2
+        else:
+            instrs.append((op,None,text_base + 8 * idx))
+            idx += 1
+    return instrs
+
+def encode(instrs: list) -> array:
+    text = array('q')
+    for op , operand , _ in instrs:
+        text.append(opcode[op])
+        if op in operand_ops:
+            text.append(operand)
+    return text
+
+class Peephole:
+    '''
+    bytecode pass for codegen.entry , removed counts the instructions
+    each pattern took out
+    '''
+    def __init__(self,patterns: list = peephole_patterns):
+        self.removed = {}
+        self.index   = {}
+        for row in patterns:
+            first = row[1][0][0]
+            for op in ([first] if type(first) == str else sorted(first)):
+                self.index.setdefault(op,[]).append(row)
+
+    def __call__(self,image: Emitter):
+        if image.text_base is None:
+            return
+        instrs = decode(image.text,image.text_base)
+        if instrs is None:
+            return
+        refs   = set(image.addr_refs)
+        instrs = [(op,Address(operand),pos) if pos + 8 in refs else (op,operand,pos) for op , operand , pos in instrs]
+        changed = True
+        while changed:
+            instrs , changed = self.run(instrs,image)
+        image.text = encode(instrs)
+        image.addr_refs = [pos for pos in image.addr_refs if pos < image.text_base]
+        image.addr_refs.extend(pos + 8 for _ , operand , pos in instrs if type(operand) == Address)
+
+    def run(self,instrs: list,image: Emitter) -> tuple:
+        '''one rewriting sweep , returns the relocated instructions'''
+        end     = image.text_base + 8 * len(image.text)
+        at      = {pos: op for op , _ , pos in instrs}
+        targets = {operand for op , operand , _ in instrs if op in branch_ops}
+        targets.update(int.from_bytes(image.block[ref:ref + 8],'little',signed=True) for ref in image.code_refs)
+
+        out   = []
+        moved = {} # old position : index in out
+        idx   = 0
+        while idx < len(instrs):
+            instr = instrs[idx]
+            for name , pattern , follow , rewrite in self.index.get(instr[0],()):
+                size = len(pattern)
+                if idx + size > len(instrs):
+                    continue
+                if any(instrs[j][2] in targets for j in range(idx + 1,idx + size)):
+                    continue # a jump lands inside the window
+                nxt = instrs[idx + size] if idx + size < len(instrs) else None
+                if follow is not None and (nxt is None or nxt[0] not in follow):
+                    continue
+                m = Match(at)
+                if not all(match_element(element,instrs[idx + j],m) for j , element in enumerate(pattern)):
+                    continue
+                m.next = end if nxt is None else nxt[2]
+                replacement = rewrite(m)
+                if replacement is None:
+                    continue
+                moved[instr[2]] = len(out)
+                out.extend((op,operand,None) for op , operand in replacement)
+                self.removed[name] = self.removed.get(name,0) + size - len(replacement)
+                idx += size
+                break
+            else:
+                moved[instr[2]] = len(out)
+                out.append(instr)
+                idx += 1
+
+        if len(out) == len(instrs):
+            return instrs , False
+        return self.relocate(out,moved,end,image) , True
+
+    def relocate(self,out: list,moved: dict,end: int,image: Emitter) -> list:
+        new_pos = []
+        pos = image.text_base
+        for op , _ , _ in out:
+            new_pos.append(pos)
+            pos += 16 if op in operand_ops else 8
+        new_pos.append(pos)
+        moved[end] = len(out)
+
+        def relocated(old: int) -> int:
+            idx = moved.get(old)
+            return old if idx is None else new_pos[idx]
+
+        res = []
+        for idx , (op , operand , _) in enumerate(out):
+            if op in branch_ops:
+                operand = relocated(operand)
+            res.append((op,operand,new_pos[idx]))
+        for ref in image.code_refs:
+            image.patch(ref,relocated(int.from_bytes(image.block[ref:ref + 8],'little',signed=True)))
+        image.text = encode(res)
+        return res
@@ -1,20 +1,123 @@
 import re
 import os
+import stat
+import bisect
 import lexer
-from common import Token
+from common import log
+from typing import Iterable, Iterator
+from common import Token, TK_IDENTIFIER, TK_MACRO
+
+class HeaderCache:
+    '''
+    lexed header tokens keyed by path , an entry is reused as long as
+    the file's mtime is unchanged so each header is lexed once.
+    guard is the include guard macro when the whole header sits inside
+    #ifndef X / #define X / ... / #endif , macro_positions indexes the
+    directives so inactive regions can be skipped
+    '''
+    def __init__(self):
+        self.entries = {} # path:(mtime,tokens,guard,macro_positions)
+
+    def lookup(self,path: str) -> tuple:
+        '''return (tokens,guard,macro_positions) , None if path is not a file'''
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != st.st_mtime_ns:
+            with open(path,'r',encoding='utf-8') as f:
+                src = f.read()
+            tokens = lexer.tokenize(src)
+            entry  = (st.st_mtime_ns,tokens,include_guard(tokens),macro_positions(tokens))
+            self.entries[path] = entry
+        return entry[1:]
+
+    def preload(self,src: str,cwd: str):
+        '''lex the quoted headers src includes , and theirs , ahead of time'''
+        for path in include_closure(src,cwd):
+            self.lookup(path)
+
+    def clear(self):
+        self.entries.clear()
+
+header_cache = HeaderCache()
+
+def include_closure(src: str,cwd: str) -> list[str]:
+    '''
+    absolute paths of every #include "..." reachable from src , resolved
+    the way handle_macro does (relative to the including file). scans the
+    text without lexing , so includes in inactive regions are listed too
+    '''
+    pattern = re.compile(r'^[ \t]*#[ \t]*include\s+"(.*?)"',re.M)
+    pending = [os.path.abspath(os.path.join(cwd,name)) for name in pattern.findall(src)]
+    res     = {} # ordered set
+    while pending:
+        path = pending.pop()
+        if path in res:
+            continue
+        res[path] = None
+        try:
+            with open(path,'r',encoding='utf-8') as f:
+                text = f.read()
+        except (OSError,ValueError):
+            continue
+        pending.extend(os.path.abspath(os.path.join(os.path.dirname(path),name)) for name in pattern.findall(text))
+    return list(res)
+
+def macro_positions(tokens: list[Token]) -> list[int]:
+    return [idx for idx, tk in enumerate(tokens) if tk.tktype == TK_MACRO]
+
+def include_guard(tokens: list[Token]) -> str:
+    '''name of the include guard macro , None if tokens are not guarded'''
+    if len(tokens) < 3:
+        return None
+    if tokens[0].tktype != TK_MACRO or tokens[1].tktype != TK_MACRO:
+        return None
+    ifndef_obj = re.match(r'^ifndef\s+(\S*)$',tokens[0].value.strip())
+    define_obj = re.match(r'^define\s+(\S*)$',tokens[1].value.strip())
+    if not ifndef_obj or not define_obj or ifndef_obj.group(1) != define_obj.group(1):
+        return None
+
+    # the #endif closing the #ifndef has to be the very last token
+    depth = 0
+    for idx, tk in enumerate(tokens):
+        if tk.tktype != TK_MACRO:
+            continue
+        macro_line = tk.value.strip()
+        if re.match(r'^ifn?def\s',macro_line):
+            depth += 1
+        elif macro_line == "else" and depth == 1:
+            return None # the #else half has to be seen on a second include
+        elif macro_line == "endif":
+            depth -= 1
+            if depth == 0:
+                return ifndef_obj.group(1) if idx == len(tokens) - 1 else None
+    return None
 
 def entry(tokens: list[Token],cwd: str) -> list[Token]:
     including_stack  = []
     define_table     = {}
     return preprocess(tokens,define_table,including_stack,cwd)
 
+def iter_entry(tokens: Iterable[Token],cwd: str) -> Iterator[Token]:
+    including_stack  = []
+    define_table     = {}
+    return iter_preprocess(tokens,define_table,including_stack,cwd)
+
 def handle_macro(
         macro_line: str,
         define_table:dict[str,str],
         including_stack:list[bool],
-        output_tokens: list[Token],
-        cwd: str) -> int:
-    
+        cwd: str) -> Iterable[Token]:
+    '''
+    applies the directive to define_table / including_stack right away,
+    returns the tokens to splice into the output (lazily for #include)
+    '''
+
     macro_line = macro_line.strip()
     if matchobj := re.match(r'^include\s+(<.*?>|".*?")$',macro_line):
         # include clause
@@ -25,30 +128,31 @@ def handle_macro(
         elif include_target.startswith("\""):
             include_target = include_target[1:-1]
             target_path = os.path.join(cwd,include_target)
-            if os.path.isfile(target_path):
+            header = header_cache.lookup(target_path)
+            if header is not None:
+                include_tokens , guard , include_positions = header
+                if guard is not None and guard in define_table:
+                    return () # guarded header already included
                 next_cwd = os.path.dirname(target_path)
-                with open(target_path,'r',encoding='utf-8') as f:
-                    src = f.read()
-                include_tokens    = lexer.tokenize(src)
-                preprocess_tokens = preprocess(
+                return iter_preprocess(
                     include_tokens,
                     define_table,
                     including_stack,
-                    next_cwd
+                    next_cwd,
+                    include_positions
                 )
-                output_tokens.extend(preprocess_tokens)
     elif matchobj := re.match(r'^define\s+(\S*)(?:|\s+(.*))$',macro_line):
         # define clause
         macro_name, macro_replacement = matchobj.groups()
         if macro_name in define_table:
-            print("{0} is already declared".format(macro_name))
+            log.warning("%s is already declared",macro_name)
         macro_replacement = lexer.tokenize(macro_replacement) if macro_replacement else None
         define_table[macro_name] = macro_replacement
     elif matchobj := re.match(r'^undef\s+(\S*)$',macro_line):
         # undef clause
         macro_name = matchobj.group(1)
         if macro_name not in define_table:
-            print("{0} is not yet defined".format(macro_name))
+            log.warning("%s is not yet defined",macro_name)
         del define_table[macro_name]
     elif matchobj := re.match(r'^ifdef\s+(\S*)$',macro_line):
         # ifdef clause
@@ -69,52 +173,118 @@ def handle_macro(
         if including_stack:
             including_stack.pop()
     else:
-        print("macro discard \"{0}\"".format(macro_line))
+        log.warning("macro discard \"%s\"",macro_line)
+    return ()
 
-def preprocess(tokens: list[Token], 
+def close_inactive(macro_line: str,depth: int,including_stack: list[bool]) -> int:
+    '''
+    feeds one directive met inside an inactive region , returns the new
+    nesting depth or -1 once the #else / #endif closing the region has
+    been applied to including_stack. nothing else is interpreted here
+    '''
+    macro_line = macro_line.strip()
+    if macro_line.startswith("ifdef") or macro_line.startswith("ifndef"):
+        return depth + 1
+    if macro_line == "endif":
+        if depth == 0:
+            including_stack.pop()
+            return -1
+        return depth - 1
+    if macro_line == "else" and depth == 0:
+        including_stack[-1] = True
+        return -1
+    return depth
+
+def skip_inactive(tokens: Iterator[Token],including_stack: list[bool]) -> bool:
+    '''consumes tokens up to the end of the inactive region , False if they run out'''
+    depth = 0
+    for tk in tokens:
+        if tk.tktype == TK_MACRO:
+            depth = close_inactive(tk.value,depth,including_stack)
+            if depth < 0:
+                return True
+    return False
+
+def skip_inactive_indexed(tokens: list[Token],
+                          idx: int,
+                          macro_positions: list[int],
+                          including_stack: list[bool]) -> int:
+    '''
+    same as skip_inactive but jumps from directive to directive ,
+    returns the index right after the region
+    '''
+    depth = 0
+    for mpos in range(bisect.bisect_left(macro_positions,idx),len(macro_positions)):
+        pos   = macro_positions[mpos]
+        depth = close_inactive(tokens[pos].value,depth,including_stack)
+        if depth < 0:
+            return pos + 1
+    return len(tokens)
+
+def preprocess(tokens: list[Token],
                define_table: dict[str,str],
                including_stack: list[bool],
                cwd: str) -> list[Token]:
+    return list(iter_preprocess(
+        tokens,define_table,including_stack,cwd,macro_positions(tokens)
+    ))
+
+def iter_preprocess(tokens: Iterable[Token],
+                    define_table: dict[str,str],
+                    including_stack: list[bool],
+                    cwd: str,
+                    positions: list[int] = None) -> Iterator[Token]:
     '''
     define_table for recursive-including
     including_stack for ifdef & ifndef detection
+    positions (see macro_positions) lets a token list skip inactive
+    regions in O(directives) , other iterables are skipped token by token
+
+    consumes tokens lazily and yields the preprocessed stream
     '''
 
-    # variable for return
-    output_tokens = []
+    if positions is not None:
+        yield from iter_preprocess_indexed(tokens,define_table,including_stack,cwd,positions)
+        return
+
+    tokens = iter(tokens)
+    for tk in tokens:
+        if tk.tktype == TK_MACRO:
+            yield from handle_macro(
+                tk.value,
+                define_table,including_stack,
+                cwd
+            )
+            while including_stack and not including_stack[-1]:
+                if not skip_inactive(tokens,including_stack):
+                    return
+        elif tk.tktype == TK_IDENTIFIER and tk.value in define_table:
+            macro_replacement = define_table[tk.value]
+            if macro_replacement:
+                yield from macro_replacement
+        else:
+            yield tk
 
+def iter_preprocess_indexed(tokens: list[Token],
+                            define_table: dict[str,str],
+                            including_stack: list[bool],
+                            cwd: str,
+                            positions: list[int]) -> Iterator[Token]:
     idx = 0
     while idx < len(tokens):
         tk = tokens[idx]
-        if not including_stack or including_stack[-1]:
-            if tk.tktype == "macro":
-                handle_macro(
-                    tk.value,
-                    define_table,including_stack,
-                    output_tokens,cwd
-                )
-                idx += 1
-            elif tk.tktype == "identifier":
-                id_name = tk.value
-                if id_name in define_table:
-                    macro_replacement = define_table[id_name]
-                    output_tokens.extend(macro_replacement)
-                    idx += 1
-                else:
-                    output_tokens.append(tk)
-                    idx += 1
-            else:
-                output_tokens.append(tk)
-                idx += 1
+        idx += 1
+        if tk.tktype == TK_MACRO:
+            yield from handle_macro(
+                tk.value,
+                define_table,including_stack,
+                cwd
+            )
+            while including_stack and not including_stack[-1] and idx < len(tokens):
+                idx = skip_inactive_indexed(tokens,idx,positions,including_stack)
+        elif tk.tktype == TK_IDENTIFIER and tk.value in define_table:
+            macro_replacement = define_table[tk.value]
+            if macro_replacement:
+                yield from macro_replacement
         else:
-            if tk.tktype == "macro":
-                handle_macro(
-                    tk.value,
-                    define_table,including_stack,
-                    output_tokens,cwd
-                )
-                idx += 1
-            else:
-                idx += 1
-
-    return output_tokens
\ No newline at end of file
+            yield tk
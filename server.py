@@ -0,0 +1,106 @@
+'''
+compile server : a long running compiler listening on a unix socket , so
+interpreter startup , imports and the preprocess.header_cache are paid
+once instead of per compile. jobs are handled one at a time , one
+running past the timeout (the parser can loop on broken input) fails
+
+    server.py [--socket path] [--timeout seconds]
+
+requests (see client.py for the framing) :
+    {"op":"compile","path":p}         compile the file p
+    {"op":"compile","name":n} + src   compile src given as the payload
+    {"op":"stats"}                    jobs served and cached headers
+    {"op":"shutdown"}
+a compile replies {"ok":bool,"diagnostics":str} and the packed image
+'''
+
+import os
+import sys
+import logging
+import traceback
+import socketserver
+import client
+import compiler
+import preprocess
+from common import log
+
+class DiagnosticsHandler(logging.Handler):
+    '''collects the warnings logged during one job'''
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.lines = []
+
+    def emit(self,record: logging.LogRecord):
+        self.lines.append(self.format(record))
+
+def compile_job(header: dict,payload: bytes,timeout: float) -> tuple:
+    '''(reply header,image)'''
+    diagnostics = DiagnosticsHandler()
+    log.addHandler(diagnostics)
+    ok , image = False , b''
+    try:
+        if "path" in header:
+            with open(header["path"],'r',encoding='utf-8') as f:
+                src = f.read()
+        else:
+            src = payload.decode()
+        with compiler.time_limit(timeout):
+            image = compiler.build(src,os.path.dirname(os.path.abspath(compiler.__file__)))
+        ok = True
+    except Exception:
+        diagnostics.lines.append(traceback.format_exc())
+    finally:
+        log.removeHandler(diagnostics)
+    return {"ok": ok,"diagnostics": "".join(line + "\n" for line in diagnostics.lines)} , image
+
+class CompileHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        header , payload = client.recv_message(self.request)
+        op = header.get("op")
+        if op == "compile":
+            reply , image = compile_job(header,payload,server.timeout)
+            server.jobs += 1
+            client.send_message(self.request,reply,image)
+        elif op == "stats":
+            client.send_message(self.request,{"jobs": server.jobs,"headers": len(preprocess.header_cache.entries)})
+        elif op == "shutdown":
+            client.send_message(self.request,{"ok": True})
+            server.stopping = True
+        else:
+            client.send_message(self.request,{"ok": False,"diagnostics": "unknown op {0}\n".format(op)})
+
+class CompileServer(socketserver.UnixStreamServer):
+    def __init__(self,path: str,timeout: float = 60):
+        if os.path.exists(path):
+            os.unlink(path) # left over by a server that did not shut down
+        super().__init__(path,CompileHandler)
+        self.jobs     = 0
+        self.timeout  = timeout
+        self.stopping = False
+
+    def serve(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            os.unlink(self.server_address)
+
+if __name__ == '__main__':
+    path    = client.default_socket()
+    timeout = 60
+
+    args = sys.argv[1:]
+    for option in ["--socket","--timeout"]:
+        if option in args:
+            idx = args.index(option)
+            if idx + 1 >= len(args):
+                print("server.py [--socket path] [--timeout seconds]")
+                sys.exit(1)
+            if option == "--socket":
+                path = args[idx + 1]
+            else:
+                timeout = float(args[idx + 1])
+
+    CompileServer(path,timeout).serve()
@@ -0,0 +1,68 @@
+'''
+per phase profiling for compiler.py --time-report : wall time , peak
+traced memory (tracemalloc) and counts of what each phase produced.
+tracing slows allocation heavy phases down , compare seconds between
+reports rather than against an untraced compile
+'''
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from common import * # NullReport lives there , usable without tracemalloc
+
+class TimeReport:
+    '''phases in the order they ran , as (name,seconds,peak bytes,counts)'''
+    enabled = True
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self,name: str):
+        '''time the body , counts can be filled in by it'''
+        counts = {}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base , _ = tracemalloc.get_traced_memory()
+        start_time = time.perf_counter()
+        yield counts
+        end_time = time.perf_counter()
+        _ , peak = tracemalloc.get_traced_memory()
+        self.phases.append((name,end_time - start_time,peak - base,counts))
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def as_dict(self) -> dict:
+        return {
+            "phases"  : [{"name": name,"seconds": seconds,"peak_bytes": peak,"counts": counts}
+                         for name , seconds , peak , counts in self.phases],
+            "seconds" : sum(phase[1] for phase in self.phases),
+        }
+
+    def json(self) -> str:
+        return json.dumps(self.as_dict(),indent=2)
+
+    def text(self) -> str:
+        lines = ["{0:<12} {1:>10} {2:>12}   {3}".format("phase","seconds","peak KiB","counts")]
+        for name , seconds , peak , counts in self.phases:
+            detail = " ".join("{0}={1}".format(k,v) for k , v in counts.items())
+            lines.append("{0:<12} {1:>10.4f} {2:>12.1f}   {3}".format(name,seconds,peak / 1024,detail))
+        lines.append("{0:<12} {1:>10.4f}".format("total",self.as_dict()["seconds"]))
+        return "\n".join(lines)
+
+def count_nodes(node) -> int:
+    '''nodes of an AST , ASTNode or ASTView'''
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        count += 1
+        stack.extend(node.children)
+        if node.nodeType == "initlist":
+            stack.extend(value for _ , value in node.metas[0] if type(value) != list)
+    return count